@@ -12,11 +12,13 @@ from tastypie.utils import trailing_slash
 from tastypie.http import  HttpBadRequest
 from tastypie.resources import Resource
 
-from neo4jrestclient.client import GraphDatabase
+from common.utils.graph import get_graph
 
 # imported from the phaidra api
 from validation import ResourceValidation
-from utils import DataObject
+from utils import DataObject, CtsUrn
+from cypher import filter_params, where_clause
+from versioned_cache import bump_corpus_version
 
 class UserSentenceResource(Resource):
     
@@ -54,7 +56,7 @@ class UserSentenceResource(Resource):
     	if len(dict) > 0:
     		return dict
     	
-    	gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+    	gdb = get_graph()
     	data = {}
     	data['objects'] = []
     	
@@ -62,7 +64,7 @@ class UserSentenceResource(Resource):
     		
     		translations = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`)-[:sentences]->(s:`UserSentence`)-[:words]->
     			(w:`Word`)<-[:translation]-(t:`Word`)<-[:words]-(s1:`Sentence`)
-    			WHERE HAS (s1.CTS) AND s1.CTS='""" + request.GET.get('CTS') + """' RETURN DISTINCT s, d, u.username ORDER BY ID(s)""")
+    			WHERE HAS (s1.CTS) AND s1.CTS = {CTS} RETURN DISTINCT s, d, u.username ORDER BY ID(s)""", params={'CTS': request.GET.get('CTS')})
     		
     		# create the objects which was queried for and set all necessary attributes
     		for t in translations:
@@ -95,64 +97,25 @@ class UserSentenceResource(Resource):
 
 
     def get_object_list(self, request):
-    	
-    	gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)    
-        attrlist = ['CTS', 'length', 'sentence']
+        
+        gdb = get_graph()    
         sentences = []
-
-        query_params = {}
-        for obj in request.GET.keys():
-            if obj in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
+        query_params = filter_params(request.GET, ['CTS', 'length', 'sentence'])
         
         # implement filtering
-        if len(query_params) > 0:
-            
-            # generate query
-            q = """MATCH (u:`User`)-[:owns]->(d:UserDocument)-[:sentences]->(s:UserSentence) WHERE """
-            
-            # filter word on parameters
-            for key in query_params:
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'gt':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """>""" +query_params[key]+ """ AND """
-                    elif key.split('__')[1] == 'lt':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<""" +query_params[key]+ """ AND """
-                    elif key.split('__')[1] == 'isnot':
-                        if key.split('__')[0] == 'length':
-                            q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<>""" +query_params[key]+ """ AND """
-                        else:
-                            q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                else:
-                    if key == 'length':
-                        q = q + """HAS (s.""" +key+ """) AND s.""" +key+ """=""" +query_params[key]+ """ AND """
-                    else:
-                        q = q + """HAS (s.""" +key+ """) AND s.""" +key+ """='""" +query_params[key]+ """' AND """
-                        
-            # is user set if params not empty?
-         	if request.GET.get('user'):
-         		q = q + """ u.username='""" + request.GET.get('user') + """' RETURN s, d, u.username ORDER BY ID(s)"""         		
-         	else:
-         		q = q[:len(q)-4]
-         		q = q + """RETURN s, d, u.username ORDER BY ID(s)"""
-            
-        	table = gdb.query(q)
+        where, params = where_clause('s', query_params, ['length'])
         
+        # is user set?
+        if request.GET.get('user'):
+            where = where + ' AND ' if where else where
+            where = where + 'u.username = {username}'
+            params['username'] = request.GET.get('user')
+        
+        if where:
+            table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`)-[:sentences]->(s:`UserSentence`) WHERE """ + where + """ RETURN DISTINCT s, d, u.username ORDER BY ID(s)""", params=params)
         # default querying    
-        else:    
-            # is user set if params are empty?
-        	if request.GET.get('user'):
-        		table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`)-[:sentences]->(s:UserSentence) WHERE u.username='""" + request.GET.get('user') + """' RETURN DISTINCT s, d, u.username ORDER BY ID(d)""")
-         	else:
-         		table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:UserDocument)-[:sentences]->(s:UserSentence) RETURN s, d, u.username ORDER BY ID(s)""")
+        else:
+            table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`)-[:sentences]->(s:`UserSentence`) RETURN s, d, u.username ORDER BY ID(s)""")
             
             
         # create the objects which was queried for and set all necessary attributes
@@ -163,11 +126,9 @@ class UserSentenceResource(Resource):
             url = sentence['self'].split('/')
             urlDoc = document['self'].split('/')        
                 
-            new_obj = DataObject(url[len(url)-1])
-            new_obj.__dict__['_data'] = sentence['data']        
-            new_obj.__dict__['_data']['id'] = url[len(url)-1]
-            new_obj.__dict__['_data']['document_resource_uri'] = API_PATH + 'user_document/' + urlDoc[len(urlDoc)-1] +'/'
-            new_obj.__dict__['_data']['user'] = user
+            new_obj = DataObject(url[len(url)-1], sentence['data'])
+            new_obj.document_resource_uri = API_PATH + 'user_document/' + urlDoc[len(urlDoc)-1] +'/'
+            new_obj.user = user
             sentences.append(new_obj)
                 
         return sentences
@@ -192,29 +153,27 @@ class UserSentenceResource(Resource):
             elif obj.split('__')[0] in attrlist and bundle.request.GET.get(obj) is not None:
                 query_params[obj] = bundle.request.GET.get(obj)
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         sentence = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
         documentNode = sentence.relationships.incoming(types=["sentences"])[0].start
         # get the sentence parameters            
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = sentence.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
-        new_obj.__dict__['_data']['document_resource_uri'] = API_PATH + 'user_document/' + str(sentence.relationships.incoming(types=["sentences"])[0].start.id) + '/'
-        new_obj.__dict__['_data']['user'] = str(documentNode.relationships.incoming(types=["owns"])[0].start.properties['username'])
+        new_obj = DataObject(kwargs['pk'], sentence.properties)
+        new_obj.document_resource_uri = API_PATH + 'user_document/' + str(sentence.relationships.incoming(types=["sentences"])[0].start.id) + '/'
+        new_obj.user = str(documentNode.relationships.incoming(types=["owns"])[0].start.properties['username'])
         
         # get a dictionary of related translation of this sentence # shall this be more strict (only user)
-        relatedSentences = gdb.query("""MATCH (s:`UserSentence`)-[:words]->(w:`Word`)-[:translation]->(t:`Word`)<-[:words]-(s1:`Sentence`) WHERE HAS (s.CTS) AND s.CTS='""" + sentence.properties['CTS'] + """' RETURN DISTINCT s1 ORDER BY ID(s1)""")
+        relatedSentences = gdb.query("""MATCH (s:`UserSentence`)-[:words]->(w:`Word`)-[:translation]->(t:`Word`)<-[:words]-(s1:`Sentence`) WHERE HAS (s.CTS) AND s.CTS = {CTS} RETURN DISTINCT s1 ORDER BY ID(s1)""", params={'CTS': sentence.properties['CTS']})
         
-        new_obj.__dict__['_data']['translations']={}
+        new_obj.translations={}
         for rs in relatedSentences:
             sent = rs[0]
             url = sent['self'].split('/')
-            for lang in CTS_LANG:
-                if sent['data']['CTS'].find(lang) != -1:
-                    new_obj.__dict__['_data']['translations'][lang] = API_PATH + 'sentence/' + url[len(url)-1] +'/'        
+            lang = CtsUrn.parse(sent['data']['CTS']).lang
+            if lang in CTS_LANG:
+                new_obj.translations[lang] = API_PATH + 'sentence/' + url[len(url)-1] +'/'        
         
         # get the words and related information    
-        words = gdb.query("""MATCH (d:`UserSentence`)-[:words]->(w:`Word`) WHERE d.CTS='""" +sentence.properties['CTS']+ """' RETURN DISTINCT w ORDER BY ID(w)""")
+        words = gdb.query("""MATCH (d:`UserSentence`)-[:words]->(w:`Word`) WHERE d.CTS = {CTS} RETURN DISTINCT w ORDER BY ID(w)""", params={'CTS': sentence.properties['CTS']})
         wordArray = []
         for w in words:
             word = w[0]
@@ -224,7 +183,7 @@ class UserSentenceResource(Resource):
 
             # get the full translation
             if bundle.request.GET.get('full'):            
-                translations = gdb.query("""MATCH (d:`Word`)-[:translation]->(w:`Word`) WHERE d.CTS='""" +wordNode.properties['CTS']+ """' RETURN DISTINCT w ORDER BY ID(w)""")
+                translations = gdb.query("""MATCH (d:`Word`)-[:translation]->(w:`Word`) WHERE d.CTS = {CTS} RETURN DISTINCT w ORDER BY ID(w)""", params={'CTS': wordNode.properties['CTS']})
                 translationArray = []
                 for t in translations:
                     trans = t[0]
@@ -236,7 +195,7 @@ class UserSentenceResource(Resource):
             wordArray.append(word['data'])
         
         
-        new_obj.__dict__['_data']['words'] = wordArray
+        new_obj.words = wordArray
 
         return new_obj
 
@@ -246,7 +205,7 @@ class UserSentenceResource(Resource):
         """
         Create a new sentence object, and the word objects containing the translations, build the relations; return the json data.
         """
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         
         self.method_check(request, allowed=['post'])
         self.is_authenticated(request)
@@ -262,7 +221,7 @@ class UserSentenceResource(Resource):
         
         # get the user and document via neo look-up or create a new one
         if request.user.username is not None:
-            documentTable = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`) WHERE HAS (u.username) AND ID(d)=""" + documentId +""" AND u.username='""" + request.user.username + """' RETURN u,d""")        
+            documentTable = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`) WHERE HAS (u.username) AND ID(d) = {document_id} AND u.username = {username} RETURN u,d""", params={'document_id': int(documentId), 'username': request.user.username})        
             # test for user node
             try:
                 documentTable.elements[0][0]
@@ -288,7 +247,7 @@ class UserSentenceResource(Resource):
                 word.labels.add("Word")
                 # loop to create links to translations
                 for cts in w["translations"]:
-                    translation = gdb.query("""MATCH (w:`Word`) WHERE HAS (w.CTS) AND w.CTS='""" + cts +"""' RETURN w""")
+                    translation = gdb.query("""MATCH (w:`Word`) WHERE HAS (w.CTS) AND w.CTS = {CTS} RETURN w""", params={'CTS': cts})
                     transNode = gdb.nodes.get(translation[0][0]['self'])
                     transNode.translation(word)
                     word.translation(transNode)
@@ -308,6 +267,9 @@ class UserSentenceResource(Resource):
             
             # save sentence to document
             #userNode.owns(document)
+            
+            # the translation links change cached sentences
+            bump_corpus_version()
                   
             return self.create_response(request, data)
         
@@ -346,64 +308,34 @@ class UserDocumentResource(Resource):
     
     def get_object_list(self, request):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)    
-        attrlist = ['CTS', 'name', 'name_eng', 'lang', 'author']
+        gdb = get_graph()    
         documents = []
-        
-        query_params = {}
-        for obj in request.GET.keys():
-            if obj in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
+        query_params = filter_params(request.GET, ['CTS', 'name', 'name_eng', 'lang', 'author'])
         
         # implement filtering
-        if len(query_params) > 0:
-            
-            # generate query
-            q = """MATCH (u:`User`)-[:owns]->(d:`UserDocument`) WHERE """
-            
-            # filter word on parameters
-            for key in query_params:
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'isnot':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                else:
-                    q = q + """HAS (d.""" +key+ """) AND d.""" +key+ """='""" +query_params[key]+ """' AND """     	
-         	# is user set if params not empty?
-         	if request.GET.get('user'):
-         		q = q + """ u.username='""" + request.GET.get('user') + """' RETURN d, u ORDER BY ID(d)"""         		
-         	else:
-         		q = q[:len(q)-4]
-         		q = q + """RETURN d, u ORDER BY ID(d)"""
-            
-        	table = gdb.query(q)
-        	      
+        where, params = where_clause('d', query_params)
+        
+        # is user set?
+        if request.GET.get('user'):
+            where = where + ' AND ' if where else where
+            where = where + 'u.username = {username}'
+            params['username'] = request.GET.get('user')
+        
+        if where:
+            table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`) WHERE """ + where + """ RETURN DISTINCT d, u.username ORDER BY ID(d)""", params=params)
         # default querying    
-        else: 
-        	# is user set if params are empty?
-        	if request.GET.get('user'):
-         		table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`) WHERE u.username='""" + request.GET.get('user') + """' RETURN DISTINCT d, u.username ORDER BY ID(d)""")
-         	else:
-         		table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`) RETURN DISTINCT d, u.username ORDER BY ID(d)""")
+        else:
+            table = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`) RETURN DISTINCT d, u.username ORDER BY ID(d)""")
         # create the objects which was queried for and set all necessary attributes
         for t in table:
             document = t[0] 
             user = t[1]       
             urlDoc = document['self'].split('/')        
                 
-            new_obj = DataObject(urlDoc[len(urlDoc)-1])
-            new_obj.__dict__['_data'] = document['data']        
-            new_obj.__dict__['_data']['id'] = urlDoc[len(urlDoc)-1]
-            new_obj.__dict__['_data']['user'] = user
+            new_obj = DataObject(urlDoc[len(urlDoc)-1], document['data'])
+            new_obj.user = user
             
-            sentences = gdb.query("""MATCH (d:`UserDocument`)-[:sentences]->(s:`UserSentence`) WHERE d.CTS='""" +document['data']['CTS']+ """' RETURN DISTINCT s ORDER BY ID(s)""")
+            sentences = gdb.query("""MATCH (d:`UserDocument`)-[:sentences]->(s:`UserSentence`) WHERE d.CTS = {CTS} RETURN DISTINCT s ORDER BY ID(s)""", params={'CTS': document['data']['CTS']})
             sentenceArray = []
             for s in sentences:
                 
@@ -414,7 +346,7 @@ class UserDocumentResource(Resource):
                 sent['data']['resource_uri'] = API_PATH + 'user_sentence/' + url[len(url)-1] + '/'
                 sentenceArray.append(sent['data'])
                 
-            new_obj.__dict__['_data']['sentences'] = sentenceArray
+            new_obj.sentences = sentenceArray
             
             documents.append(new_obj)        
                 
@@ -430,15 +362,13 @@ class UserDocumentResource(Resource):
     
     def obj_get(self, bundle, **kwargs):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         document = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
         
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = document.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
-        new_obj.__dict__['_data']['user'] = str(document.relationships.incoming(types=["owns"])[0].start.properties['username'])
+        new_obj = DataObject(kwargs['pk'], document.properties)
+        new_obj.user = str(document.relationships.incoming(types=["owns"])[0].start.properties['username'])
         
-        sentences = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`)-[:sentences]->(s:`UserSentence`) WHERE d.CTS='""" +document.properties['CTS']+ """' RETURN DISTINCT s ORDER BY ID(s)""")
+        sentences = gdb.query("""MATCH (u:`User`)-[:owns]->(d:`UserDocument`)-[:sentences]->(s:`UserSentence`) WHERE d.CTS = {CTS} RETURN DISTINCT s ORDER BY ID(s)""", params={'CTS': document.properties['CTS']})
         sentenceArray = []
         for s in sentences:
             sent = s[0]
@@ -448,18 +378,18 @@ class UserDocumentResource(Resource):
             sent['data']['resource_uri'] = API_PATH + 'user_sentence/' + url[len(url)-1] + '/'
             sentenceArray.append(sent['data'])
                 
-            new_obj.__dict__['_data']['sentences'] = sentenceArray
+            new_obj.sentences = sentenceArray
 
         # get a dictionary of related translations of this document
-        relatedDocuments = gdb.query("""MATCH (d:`UserDocument`)-[:sentences]->(s:`UserSentence`)-[:words]->(w:`Word`)-[:translation]->(t:`Word`)<-[:words]-(s1:`Sentence`)<-[:sentences]-(d1:`Document`) WHERE HAS (d.CTS) AND d.CTS='""" + document.properties['CTS'] + """' RETURN DISTINCT d1 ORDER BY ID(d1)""")
+        relatedDocuments = gdb.query("""MATCH (d:`UserDocument`)-[:sentences]->(s:`UserSentence`)-[:words]->(w:`Word`)-[:translation]->(t:`Word`)<-[:words]-(s1:`Sentence`)<-[:sentences]-(d1:`Document`) WHERE HAS (d.CTS) AND d.CTS = {CTS} RETURN DISTINCT d1 ORDER BY ID(d1)""", params={'CTS': document.properties['CTS']})
         
-        new_obj.__dict__['_data']['translations']={}
+        new_obj.translations={}
         for rd in relatedDocuments:
             doc = rd[0]
             url = doc['self'].split('/')
             if doc['data']['lang'] in CTS_LANG:
-                new_obj.__dict__['_data']['translations'][doc['data']['lang']] = doc['data']
-                new_obj.__dict__['_data']['translations'][doc['data']['lang']]['resource_uri']= API_PATH + 'document/' + url[len(url)-1] +'/'
+                new_obj.translations[doc['data']['lang']] = doc['data']
+                new_obj.translations[doc['data']['lang']]['resource_uri']= API_PATH + 'document/' + url[len(url)-1] +'/'
 
 
         return new_obj
@@ -470,7 +400,7 @@ class UserDocumentResource(Resource):
         """
         Create a new document object and return it if the user is authenticated and exists. Create a new neo node in case the users doesn't exist on this side.
         """
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         
         self.method_check(request, allowed=['post'])
         self.is_authenticated(request)
@@ -482,7 +412,7 @@ class UserDocumentResource(Resource):
 
         # get the user via neo look-up or create a newone
         if request.user.username is not None:
-            userTable = gdb.query("""MATCH (u:`User`) WHERE HAS (u.username) AND u.username='""" + request.user.username + """' RETURN u""")
+            userTable = gdb.query("""MATCH (u:`User`) WHERE HAS (u.username) AND u.username = {username} RETURN u""", params={'username': request.user.username})
         
             if len(userTable) > 0:    
                 userurl = userTable[0][0]['self']
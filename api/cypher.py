@@ -0,0 +1,170 @@
+"""
+Query builder for the neo4j backed resources.
+
+Turns the filter syntax of the API (e.g. ?pos=noun&lemma__endswith=os&tbwid__gt=3, multiple values separated by '__')
+or a Grammar.query string into a Cypher WHERE clause with {param} placeholders and a dict of parameters.
+The query text only depends on the filtered attributes and operators, never on the values, so neo4j can reuse its cached execution plans.
+"""
+from tastypie.exceptions import BadRequest
+
+
+# attributes of the Word nodes which can be used for filtering
+WORD_ATTRIBUTES = ['lang', 'CTS', 'length', 'case', 'dialect', 'head', 'form', 'posClass', 'cid', 'gender', 'tbwid', 'pos', 'value', 'degree', 'number', 'lemma', 'relation', 'isIndecl', 'ref', 'posAdd', 'mood', 'tense', 'voice', 'person']
+WORD_INTEGER_ATTRIBUTES = ['tbwid', 'head', 'length', 'cid']
+
+# operator -> (cypher operator, format of the value)
+OPERATORS = {
+    None: ('=', None),
+    'contains': ('=~', '.*%s.*'),
+    'startswith': ('=~', '%s.*'),
+    'endswith': ('=~', '.*%s'),
+    'gt': ('>', None),
+    'lt': ('<', None),
+    'isnot': ('<>', None)
+}
+
+
+"""
+Collects the request parameters which filter on one of the allowed attributes, with or without operator suffix.
+"""
+def filter_params(GET, attrlist):
+
+    query_params = {}
+    for key in GET.keys():
+        if key.split('__')[0] in attrlist and GET.get(key) is not None:
+            query_params[key] = GET.get(key)
+    return query_params
+
+
+"""
+Splits a Grammar.query string, e.g. pos=noun&case=nom&lemma__endswith=os, into a dict of filters.
+"""
+def parse_query(query):
+
+    query_params = {}
+    if not query:
+        return query_params
+    for pair in query.split('&'):
+        if '=' in pair:
+            key, value = pair.split('=', 1)
+            query_params[key] = value
+    return query_params
+
+
+"""
+Returns the attribute and the operator of a filter key, e.g. ('lemma', 'endswith') for lemma__endswith.
+"""
+def split_key(key):
+
+    chunks = key.split('__')
+    if len(chunks) > 1:
+        return chunks[0], chunks[1]
+    return chunks[0], None
+
+
+def _typed_value(attribute, operator, value, integer_attrs):
+
+    if operator in ('gt', 'lt') or (attribute in integer_attrs and OPERATORS[operator][1] is None):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                raise BadRequest("Filter %s requires a number." % attribute)
+    return value
+
+
+"""
+Builds the conditions of a WHERE clause for the node bound to alias.
+Returns the conditions joined by AND (empty string if there are no filters) and the parameters to send along with the query.
+Unknown operators are ignored. With a word index (see word_index.py) the filters it covers become ID(alias) IN {ids},
+unless the index can't resolve them (empty values, too many matching words).
+"""
+def where_clause(alias, query_params, integer_attrs=(), prefix=None, index=None):
+
+    conditions = []
+    params = {}
+    prefix = prefix or alias
+
+    # sorted, so the same set of filters always produces the same query text
+    for key in sorted(query_params.keys()):
+        attribute, operator = split_key(key)
+        if operator not in OPERATORS:
+            continue
+
+        cypher_operator, value_format = OPERATORS[operator]
+        values = query_params[key].split('__')
+
+        # resolved to node ids by the index
+        if index is not None and index.covers(attribute, operator):
+            ids = index.lookup(attribute, operator, values)
+            if ids is not None:
+                name = '%s_%s_%s_ids' % (prefix, attribute, operator)
+                params[name] = ids
+                conditions.append('ID(%s) IN {%s}' % (alias, name))
+                continue
+
+        placeholders = []
+        for i, value in enumerate(values):
+            name = '%s_%s_%s_%d' % (prefix, attribute, operator or 'eq', i)
+            value = _typed_value(attribute, operator, value, integer_attrs)
+            params[name] = value_format % value if value_format else value
+            placeholders.append('%s.%s %s {%s}' % (alias, attribute, cypher_operator, name))
+
+        # multi values
+        if len(placeholders) > 1:
+            conditions.append('(' + ' OR '.join(placeholders) + ')')
+        # one value
+        else:
+            conditions.append('HAS (%s.%s) AND %s' % (alias, attribute, placeholders[0]))
+
+    return ' AND '.join(conditions), params
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# operator -> test of a word's value against one filter value, with the same meaning as the Cypher operators
+TESTS = {
+    None: lambda value, expected: value == expected,
+    'contains': lambda value, expected: expected in value,
+    'startswith': lambda value, expected: value.startswith(expected),
+    'endswith': lambda value, expected: value.endswith(expected),
+    'gt': lambda value, expected: _number(value) is not None and _number(value) > expected,
+    'lt': lambda value, expected: _number(value) is not None and _number(value) < expected,
+    'isnot': lambda value, expected: value != expected
+}
+
+
+"""
+Compiles filters into a predicate over word property dicts, matching the same words as where_clause.
+Values are split and converted once, so the predicate can be applied to many words.
+"""
+def compile_predicate(query_params, integer_attrs=()):
+
+    tests = []
+    for key in sorted(query_params.keys()):
+        attribute, operator = split_key(key)
+        if operator not in OPERATORS:
+            continue
+        values = [_typed_value(attribute, operator, value, integer_attrs) for value in query_params[key].split('__')]
+        tests.append((attribute, TESTS[operator], values))
+
+    def predicate(properties):
+        for attribute, test, values in tests:
+            value = properties.get(attribute)
+            if value is None:
+                return False
+            for expected in values:
+                if test(value, expected):
+                    break
+            else:
+                return False
+        return True
+
+    return predicate
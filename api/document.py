@@ -1,17 +1,80 @@
 from phaidra.settings import CTS_LANG
 from phaidra.settings import GRAPH_DATABASE_REST_URL, API_PATH
 
+from django.conf.urls import url
+from django.http import StreamingHttpResponse
+
 from tastypie import fields
 from tastypie.bundle import Bundle
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.resources import Resource
-from tastypie.cache import SimpleCache
+from tastypie.http import HttpNotFound
+from tastypie.utils import trailing_slash
+
+from common.utils.graph import get_graph
 
-from neo4jrestclient.client import GraphDatabase
+import json
 
 # imported from the phaidra api
 from validation import ResourceValidation
-from utils import DataObject, sort_sentences
+from utils import DataObject, cts_sort_key, sort_by_cts
+from versioned_cache import VersionedSimpleCache
+from cypher import filter_params, where_clause
+
+
+# sentences whose words are read with one query while exporting
+EXPORT_CHUNK_SIZE = 50
+
+
+def _node_id(node):
+    url = node['self'].split('/')
+    return url[len(url)-1]
+
+
+"""
+Generates the lines of the NDJSON export of a document: the document, then every sentence in CTS order followed by its words.
+Sentences are read in chunks of EXPORT_CHUNK_SIZE, so only one chunk is held in memory.
+"""
+def export_lines(document):
+
+    gdb = get_graph()
+    
+    data = dict(document['data'])
+    data['type'] = 'document'
+    data['resource_uri'] = API_PATH + 'document/' + _node_id(document) + '/'
+    yield json.dumps(data) + '\n'
+    
+    sentenceTable = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE d.CTS = {CTS} RETURN ID(s), s.CTS""", params={'CTS': document['data']['CTS']})
+    sentenceIds = [row[0] for row in sorted(sentenceTable, key=lambda row: cts_sort_key(row[1]))]
+    
+    for start in range(0, len(sentenceIds), EXPORT_CHUNK_SIZE):
+        ids = sentenceIds[start:start + EXPORT_CHUNK_SIZE]
+        table = gdb.query("""MATCH (s:`Sentence`) WHERE ID(s) IN {ids} OPTIONAL MATCH (s)-[:words]->(w:`Word`) RETURN ID(s), s, w""", params={'ids': ids})
+        
+        sentences = {}
+        words = {}
+        for row in table:
+            sentences[row[0]] = row[1]
+            words.setdefault(row[0], [])
+            if row[2] is not None:
+                words[row[0]].append(row[2])
+        
+        for id in ids:
+            if id not in sentences:
+                continue
+            sentenceUri = API_PATH + 'sentence/' + str(id) + '/'
+            
+            data = dict(sentences[id]['data'])
+            data['type'] = 'sentence'
+            data['resource_uri'] = sentenceUri
+            yield json.dumps(data) + '\n'
+            
+            for word in sorted(words[id], key=lambda w: cts_sort_key(w['data']['CTS'])):
+                data = dict(word['data'])
+                data['type'] = 'word'
+                data['resource_uri'] = API_PATH + 'word/' + _node_id(word) + '/'
+                data['sentence_resource_uri'] = sentenceUri
+                yield json.dumps(data) + '\n'
 
 
 class DocumentResource(Resource):
@@ -19,6 +82,7 @@ class DocumentResource(Resource):
     CTS = fields.CharField(attribute='CTS')
     lang = fields.CharField(attribute='lang', null = True, blank = True)    
     sentences = fields.ListField(attribute='sentences', null = True, blank = True)
+    sentence_count = fields.IntegerField(attribute='sentence_count', null = True, blank = True)
     name = fields.CharField(attribute='name', null = True, blank = True)
     author = fields.CharField(attribute='author', null = True, blank = True)
     translations = fields.DictField(attribute='translations', null = True, blank = True)
@@ -27,7 +91,7 @@ class DocumentResource(Resource):
         object_class = DataObject
         resource_name = 'document'    
         authorization = ReadOnlyAuthorization()
-        cache = SimpleCache(timeout=None)
+        cache = VersionedSimpleCache('document')
         validation =  ResourceValidation()
     
     def detail_uri_kwargs(self, bundle_or_obj):
@@ -39,69 +103,76 @@ class DocumentResource(Resource):
             kwargs['pk'] = bundle_or_obj.id        
         return kwargs
     
-    def get_object_list(self, request):
+    def prepend_urls(self, *args, **kwargs):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)    
-        attrlist = ['CTS', 'name', 'name_eng', 'lang', 'author']
-        documents = []
+        return [
+            url(r"^(?P<resource_name>%s)/(?P<pk>\d+)/%s%s$" % (self._meta.resource_name, 'export', trailing_slash()), self.wrap_view('export'), name="api_%s" % 'document_export')
+            ]
+    
+    """
+    Streams a document with its sentences and words as NDJSON (one JSON object per line, with a type of document, sentence or word),
+    in CTS order. With translations=true the related translations follow, each starting with its document line.
+    """
+    def export(self, request, **kwargs):
         
-        query_params = {}
-        for obj in request.GET.keys():
-            if obj in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
         
-        # implement filtering
-        if len(query_params) > 0:
-            
-            # generate query
-            q = """MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE """
-            
-            # filter word on parameters
-            for key in query_params:
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'isnot':
-                        q = q + """HAS (d.""" +key.split('__')[0]+ """) AND d.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                else:
-                    q = q + """HAS (d.""" +key+ """) AND d.""" +key+ """='""" +query_params[key]+ """' AND """
-            q = q[:len(q)-4]
-            q = q + """RETURN DISTINCT d ORDER BY ID(d)"""
-            
-            table = gdb.query(q)
+        gdb = get_graph()
+        table = gdb.query("""MATCH (d:`Document`) WHERE ID(d) = {id} RETURN d""", params={'id': int(kwargs['pk'])})
+        if len(table) < 1:
+            return HttpNotFound()
+        documents = [table[0][0]]
+        
+        if request.GET.get('translations') in ('1', 'true', 'True'):
+            relatedDocuments = gdb.query("""MATCH (d:`Document`)-[:translated_as]->(d1:`Document`) WHERE ID(d) = {id} RETURN DISTINCT d1 ORDER BY ID(d1)""", params={'id': int(kwargs['pk'])})
+            documents.extend(rd[0] for rd in relatedDocuments)
+        
+        def lines():
+            for document in documents:
+                for line in export_lines(document):
+                    yield line
+        
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson; charset=utf-8')
+    
+    def get_object_list(self, request):
+        """
+        Lists the documents ordered by CTS with their sentence counts, read with one aggregated query.
+        The sentences (CTS and resource_uri) are added with include=sentences only.
+        """
+        gdb = get_graph()    
+        documents = []
+        query_params = filter_params(request.GET, ['CTS', 'name', 'name_eng', 'lang', 'author'])
+        includeSentences = 'sentences' in request.GET.get('include', '').split(',')
         
+        # implement filtering, like before only documents with sentences are listed
+        if len(query_params) > 0:
+            where, params = where_clause('d', query_params)
+            q = """MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE """ + where
         # default querying    
-        else:    
-            table = gdb.query("""MATCH (d:`Document`) RETURN DISTINCT d ORDER BY ID(d)""")
+        else:
+            q, params = """MATCH (d:`Document`) OPTIONAL MATCH (d)-[:sentences]->(s:`Sentence`)""", {}
+        
+        if includeSentences:
+            q = q + """ RETURN d, count(s), collect([ID(s), s.CTS]) ORDER BY d.CTS"""
+        else:
+            q = q + """ RETURN d, count(s) ORDER BY d.CTS"""
+        
+        table = gdb.query(q, params=params)
             
         # create the objects which was queried for and set all necessary attributes
         for t in table:
             document = t[0]        
             urlDoc = document['self'].split('/')        
                 
-            new_obj = DataObject(urlDoc[len(urlDoc)-1])
-            new_obj.__dict__['_data'] = document['data']        
-            new_obj.__dict__['_data']['id'] = urlDoc[len(urlDoc)-1]
-        
-            sentences = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE d.CTS='""" +document['data']['CTS']+ """' RETURN DISTINCT s ORDER BY ID(s)""")
-            sentenceArray = []
-            for s in sentences:
-                
-                sent = s[0]
-                url = sent['self'].split('/')
-                sent_cts = sent['data']['CTS']
-                sent['data'] = {}
-                sent['data']['resource_uri'] = API_PATH + 'sentence/' + url[len(url)-1] + '/'
-                sent['data']['CTS'] = sent_cts
-                sentenceArray.append(sent['data'])
-                
-            new_obj.__dict__['_data']['sentences'] = sort_sentences(sentenceArray)
+            new_obj = DataObject(urlDoc[len(urlDoc)-1], document['data'])
+            new_obj.sentence_count = t[1]
+            
+            if includeSentences:
+                # rows of a document without sentences are [None, None]
+                sentenceRows = sorted((row for row in t[2] if row[0] is not None), key=lambda row: cts_sort_key(row[1]))
+                new_obj.sentences = [{'CTS': row[1], 'resource_uri': API_PATH + 'sentence/' + str(row[0]) + '/'} for row in sentenceRows]
             
             documents.append(new_obj)        
                 
@@ -118,14 +189,12 @@ class DocumentResource(Resource):
     
     def obj_get(self, bundle, **kwargs):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         document = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
         
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = document.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
+        new_obj = DataObject(kwargs['pk'], document.properties)
         
-        sentences = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE d.CTS='""" +document.properties['CTS']+ """' RETURN DISTINCT s ORDER BY ID(s)""")
+        sentences = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE d.CTS = {CTS} RETURN DISTINCT s ORDER BY ID(s)""", params={'CTS': document.properties['CTS']})
         sentenceArray = []
         for s in sentences:
             sent = s[0]
@@ -135,19 +204,20 @@ class DocumentResource(Resource):
             sent['data']['resource_uri'] = API_PATH + 'sentence/' + url[len(url)-1] + '/'
             sentenceArray.append(sent['data'])
 
-        new_obj.__dict__['_data']['sentences'] = sort_sentences(sentenceArray)
+        new_obj.sentences = sort_by_cts(sentenceArray)
+        new_obj.sentence_count = len(sentenceArray)
             
         
-        # get a dictionary of related translations of this document
-        relatedDocuments = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`)-[:words]->(w:`Word`)-[:translation]->(t:`Word`)<-[:words]-(s1:`Sentence`)<-[:sentences]-(d1:`Document`) WHERE HAS (d.CTS) AND d.CTS='"""+ document.properties['CTS'] +"""' RETURN DISTINCT d1 ORDER BY ID(d1)""")
+        # get a dictionary of related translations of this document (see common/utils/neo4j_import/alignment_index.py)
+        relatedDocuments = gdb.query("""MATCH (d:`Document`)-[:translated_as]->(d1:`Document`) WHERE d.CTS = {CTS} RETURN DISTINCT d1 ORDER BY ID(d1)""", params={'CTS': document.properties['CTS']})
         
-        new_obj.__dict__['_data']['translations']={}
+        new_obj.translations={}
         for rd in relatedDocuments:
             doc = rd[0]
             url = doc['self'].split('/')
             if doc['data']['lang'] in CTS_LANG:
-                new_obj.__dict__['_data']['translations'][doc['data']['lang']] = doc['data']
-                new_obj.__dict__['_data']['translations'][doc['data']['lang']]['resource_uri']= API_PATH + 'document/' + url[len(url)-1] +'/'
+                new_obj.translations[doc['data']['lang']] = doc['data']
+                new_obj.translations[doc['data']['lang']]['resource_uri']= API_PATH + 'document/' + url[len(url)-1] +'/'
 
 
         return new_obj
@@ -0,0 +1,76 @@
+"""
+Compiled Grammar.query per ref.
+
+The query string of a grammar topic (e.g. pos=noun&case=nom&lemma__endswith=os) is parsed once per ref and kept
+as filters, as a predicate over word property dicts and as parameterised Cypher WHERE conditions.
+The compiled queries are cached in the process; saving or deleting a Grammar clears the cache (see app/models.py),
+other processes pick up changes after COMPILED_QUERY_TIMEOUT seconds.
+"""
+import threading
+import time
+
+from app.models import Grammar
+
+# imported from the phaidra api
+from cypher import WORD_INTEGER_ATTRIBUTES, compile_predicate, parse_query, where_clause
+from word_index import word_index
+
+
+COMPILED_QUERY_TIMEOUT = 300
+
+
+class CompiledQuery(object):
+
+    def __init__(self, ref, query):
+
+        self.ref = ref
+        self.query = query
+        self.params = parse_query(query)
+        self.predicate = compile_predicate(self.params, WORD_INTEGER_ATTRIBUTES)
+        self._where = {}
+
+    def where(self, alias='w'):
+        """
+        Returns the WHERE conditions for the word node bound to alias and their parameters.
+        """
+        index = word_index()
+        key = (alias, index.version if index is not None else None)
+        if key not in self._where:
+            self._where[key] = where_clause(alias, self.params, WORD_INTEGER_ATTRIBUTES, index=index)
+        return self._where[key]
+
+    def matches(self, properties):
+        return self.predicate(properties)
+
+
+_compiled = {}
+_lock = threading.Lock()
+
+
+"""
+Returns the CompiledQuery of a grammar ref, None if there is no Grammar with this ref.
+"""
+def compiled_query(ref):
+
+    entry = _compiled.get(ref)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    try:
+        grammar = Grammar.objects.filter(ref=ref)[0]
+        compiled = CompiledQuery(ref, grammar.query)
+    except IndexError:
+        compiled = None
+
+    with _lock:
+        _compiled[ref] = (compiled, time.time() + COMPILED_QUERY_TIMEOUT)
+    return compiled
+
+
+"""
+Signal receiver for Grammar changes; refs are editable in the admin on creation, so the whole cache is dropped.
+"""
+def invalidate_compiled_queries(sender=None, **kwargs):
+
+    with _lock:
+        _compiled.clear()
@@ -0,0 +1,231 @@
+"""
+Per-user knowledge map, materialised in the KnowledgeMap model.
+
+Every submission adds its encountered words (vocab counts), the lemmas of the words seen for the first time
+(with their frequency) and the filters of its grammar ref. The visualizations read the map with a single row look-up
+instead of replaying all submissions of a user; rebuild() recalculates it from the submissions in neo4j.
+"""
+from django.db import transaction
+
+from common.utils.graph import get_graph
+
+from app.models import KnowledgeMap
+
+import json
+
+# imported from the phaidra api
+from cypher import WORD_INTEGER_ATTRIBUTES, compile_predicate, where_clause
+from grammar_query import compiled_query
+from word_index import word_index
+
+
+"""
+Returns value and frequency of the lemmas of the given words as a dict keyed by word CTS, with one query.
+"""
+def lemmas_of(ctsList):
+
+    lemmas = {}
+    if not ctsList:
+        return lemmas
+
+    gdb = get_graph()
+    table = gdb.query("""MATCH (l:`Lemma`)-[:values]->(w:`Word`) WHERE w.CTS IN {ctss} RETURN w.CTS, l.value, l.frequency""", params={'ctss': list(ctsList)})
+    for row in table:
+        if row[0] not in lemmas:
+            lemmas[row[0]] = (row[1], row[2])
+    return lemmas
+
+
+"""
+Returns the filters of the query of a grammar ref, None if the ref is unknown.
+"""
+def ref_params(ref):
+
+    compiled = compiled_query(ref)
+    return compiled.params if compiled is not None else None
+
+
+"""
+Adds one submission to the map (dict with vocab, lemmas, refs and lemma_frequency).
+wordLemmas maps the CTS of first seen words to their (lemma value, frequency).
+"""
+def apply_submission(knowledge, ref, encounteredWords, wordLemmas, params):
+
+    if not encounteredWords:
+        return knowledge
+
+    for cts in encounteredWords:
+        if not cts:
+            continue
+        if cts in knowledge['vocab']:
+            knowledge['vocab'][cts] = knowledge['vocab'][cts] + 1
+        else:
+            knowledge['vocab'][cts] = 1
+            # two words can have the same lemma, so the lemma is the key
+            lemma = wordLemmas.get(cts)
+            if lemma is not None and lemma[0] and lemma[0] not in knowledge['lemmas']:
+                knowledge['lemmas'][lemma[0]] = lemma[1]
+                knowledge['lemma_frequency'] = knowledge['lemma_frequency'] + int(lemma[1] or 0)
+
+    if ref and ref not in knowledge['refs'] and params is not None:
+        knowledge['refs'][ref] = params
+
+    return knowledge
+
+
+def _load(entry):
+    return {'vocab': json.loads(entry.vocab),
+            'lemmas': json.loads(entry.lemmas),
+            'refs': json.loads(entry.refs),
+            'lemma_frequency': entry.lemma_frequency}
+
+
+def _store(entry, knowledge):
+    entry.vocab = json.dumps(knowledge['vocab'])
+    entry.lemmas = json.dumps(knowledge['lemmas'])
+    entry.refs = json.dumps(knowledge['refs'])
+    entry.lemma_frequency = knowledge['lemma_frequency']
+    entry.save()
+
+
+"""
+Returns the knowledge map of a user as dict with vocab, lemmas, refs and lemma_frequency (empty if nothing was submitted).
+"""
+def knowledge_map(username):
+
+    try:
+        return _load(KnowledgeMap.objects.get(username=username))
+    except KnowledgeMap.DoesNotExist:
+        return {'vocab': {}, 'lemmas': {}, 'refs': {}, 'lemma_frequency': 0}
+
+
+def user_exists(username):
+
+    gdb = get_graph()
+    return gdb.query("""MATCH (n:`User`) WHERE n.username = {username} RETURN count(n)""", params={'username': username})[0][0] > 0
+
+
+"""
+Returns the number of words whose morphology the user knows (the knows_morph relationships written with the submissions),
+i.e. the words matching the filters of one of the refs of the map, counted with one query.
+"""
+def morph_known_count(knowledge):
+
+    conditions = []
+    params = {}
+    index = word_index()
+    for i, ref in enumerate(sorted(knowledge['refs'])):
+        where, refParams = where_clause('w', knowledge['refs'][ref], WORD_INTEGER_ATTRIBUTES, prefix='r%d' % i, index=index)
+        # like knowledge_statements, refs without filters relate no words
+        if where:
+            conditions.append('(' + where + ')')
+            params.update(refParams)
+    if not conditions:
+        return 0
+
+    gdb = get_graph()
+    return gdb.query("""MATCH (w:`Word`) WHERE """ + ' OR '.join(conditions) + """ RETURN count(w)""", params=params)[0][0]
+
+
+"""
+Returns the words of a range of word CTSs with the user's knowledge of them, read with one query, as a dict keyed by CTS
+of (CTS, value, word id, lemma id, times_seen, word seen, lemma seen, morphology known).
+Only the user's relationships to the words of the range (and their lemmas) are read.
+"""
+def range_knowledge(username, ctss):
+
+    gdb = get_graph()
+    table = gdb.query("""MATCH (w:`Word`) WHERE HAS (w.head) AND w.CTS IN {ctss}
+                         OPTIONAL MATCH (l:`Lemma`)-[:values]->(w)
+                         OPTIONAL MATCH (:`User` {username: {username}})-[ws:has_seen]->(w)
+                         OPTIONAL MATCH (:`User` {username: {username}})-[ls:has_seen]->(l)
+                         OPTIONAL MATCH (:`User` {username: {username}})-[km:knows_morph]->(w)
+                         RETURN w.CTS, w.value, ID(w), ID(l), ws.times_seen, ws IS NOT NULL, ls IS NOT NULL, km IS NOT NULL""", params={'ctss': list(ctss), 'username': username})
+
+    words = {}
+    for row in table:
+        # one row per lemma of a word
+        if row[0] in words:
+            row = words[row[0]][:6] + (words[row[0]][6] or row[6],) + words[row[0]][7:]
+        words[row[0]] = tuple(row)
+    return words
+
+
+"""
+Updates the map of a user with a new submission.
+"""
+def record_submission(username, ref, encounteredWords):
+
+    if not encounteredWords:
+        return
+
+    params = ref_params(ref)
+    with transaction.atomic():
+        entry, created = KnowledgeMap.objects.select_for_update().get_or_create(username=username)
+        knowledge = _load(entry)
+        # only first seen words add lemmas
+        wordLemmas = lemmas_of(set(cts for cts in encounteredWords if cts and cts not in knowledge['vocab']))
+        _store(entry, apply_submission(knowledge, ref, encounteredWords, wordLemmas, params))
+
+
+"""
+Recalculates the map of a user from all of the user's submissions, e.g. for a backfill.
+"""
+def rebuild(username):
+
+    gdb = get_graph()
+    submissions = gdb.query("""MATCH (n:`User`)-[:submits]->(s:`Submission`) WHERE HAS (n.username) AND n.username = {username} RETURN s.ref, s.encounteredWords ORDER BY ID(s)""", params={'username': username})
+
+    ctss = set()
+    for sub in submissions:
+        ctss.update(cts for cts in (sub[1] or []) if cts)
+    wordLemmas = lemmas_of(ctss)
+
+    knowledge = {'vocab': {}, 'lemmas': {}, 'refs': {}, 'lemma_frequency': 0}
+    paramCache = {}
+    for sub in submissions:
+        ref = sub[0]
+        if ref not in paramCache:
+            paramCache[ref] = ref_params(ref)
+        apply_submission(knowledge, ref, sub[1], wordLemmas, paramCache[ref])
+
+    with transaction.atomic():
+        entry, created = KnowledgeMap.objects.select_for_update().get_or_create(username=username)
+        _store(entry, knowledge)
+    return knowledge
+
+
+"""
+Yields the sentences of a document in order as (sentence CTS, words), every word as (properties, vocab known, morph known).
+All words are read with one query; the filters of the user's refs are compiled once and applied in a single pass.
+A word's morphology counts as known if its vocab is known and it matches one of the refs.
+"""
+def document_coverage(documentCTS, knowledge):
+
+    gdb = get_graph()
+    vocab = knowledge['vocab']
+    lemmas = knowledge['lemmas']
+    predicates = []
+    for ref, params in knowledge['refs'].items():
+        compiled = compiled_query(ref)
+        # refs deleted in the meantime keep their stored filters
+        predicates.append(compiled.predicate if compiled is not None else compile_predicate(params, WORD_INTEGER_ATTRIBUTES))
+
+    table = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`)-[:words]->(w:`Word`) WHERE HAS (s.CTS) AND d.CTS = {CTS} RETURN s.CTS, w ORDER BY ID(s), ID(w)""", params={'CTS': documentCTS})
+
+    sentenceCTS = None
+    words = []
+    for row in table:
+        if row[0] != sentenceCTS:
+            if words:
+                yield sentenceCTS, words
+            sentenceCTS = row[0]
+            words = []
+
+        properties = row[1]['data']
+        vocabKnown = properties.get('CTS') in vocab or properties.get('lemma') in lemmas
+        morphKnown = vocabKnown and any(predicate(properties) for predicate in predicates)
+        words.append((properties, vocabKnown, morphKnown))
+
+    if words:
+        yield sentenceCTS, words
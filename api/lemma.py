@@ -1,16 +1,27 @@
-from phaidra.settings import GRAPH_DATABASE_REST_URL, API_PATH
+from phaidra.settings import API_PATH
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 
 from tastypie import fields
 from tastypie.bundle import Bundle
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.resources import Resource
-from tastypie.cache import SimpleCache
+from tastypie.exceptions import BadRequest
+from tastypie.http import HttpBadRequest
 
-from neo4jrestclient.client import GraphDatabase
+from common.utils.graph import get_graph
+from common.utils.serializers import FieldProjection, fast_list_response, wants_fast
 
 # imported from the phaidra api
 from validation import ResourceValidation
 from utils import DataObject     
+from versioned_cache import VersionedSimpleCache
+from cypher import filter_params, where_clause
+
+
+# projections of the words of a lemma in lists
+LEMMA_VALUES = ('full', 'ids', 'none')
 
 
 class LemmaResource(Resource):
@@ -25,7 +36,7 @@ class LemmaResource(Resource):
         object_class = DataObject    
         resource_name = 'lemma'        
         authorization = ReadOnlyAuthorization()
-        cache = SimpleCache(timeout=None)
+        cache = VersionedSimpleCache('lemma')
         validation =  ResourceValidation()
     
     def detail_uri_kwargs(self, bundle_or_obj):
@@ -37,80 +48,112 @@ class LemmaResource(Resource):
             kwargs['pk'] = bundle_or_obj.id            
         return kwargs
     
-    def get_object_list(self, request):
-        
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)    
-        attrlist = ['CITE', 'value', 'posAdd', 'frequency']
-        lemmas = []
-        
-        query_params = {}
-        for obj in request.GET.keys():
-            if obj in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
+    def lemma_page(self, query_params, values='full', offset=0, limit=None):
+        """
+        Returns the lemmas in ID order with their values aggregated by the same query, one round-trip per page.
+        values is full (the word properties), ids (id and resource_uri of the words) or none (no values).
+        With a limit one more lemma is read to tell whether another page follows; returns (lemmas, more).
+        """
+        gdb = get_graph()
         
         # implement filtering
         if len(query_params) > 0:
-            
-            # generate query
-            q = """MATCH (l:`Lemma`)-[:values]->(w:`Word`) WHERE """
-            
-            # filter word on parameters
-            for key in query_params:
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'isnot':
-                        if key == 'frequency':
-                            q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """<>""" +query_params[key]+ """ AND """
-                        else:
-                            q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'gt':
-                        q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """>""" +query_params[key]+ """ AND """
-                    elif key.split('__')[1] == 'lt':
-                        q = q + """HAS (l.""" +key.split('__')[0]+ """) AND l.""" +key.split('__')[0]+ """<""" +query_params[key]+ """ AND """
-                else:
-                    if key == 'frequency':
-                        q = q + """HAS (l.""" +key+ """) AND l.""" +key+ """=""" +query_params[key]+ """ AND """
-                    else:
-                        q = q + """HAS (l.""" +key+ """) AND l.""" +key+ """='""" +query_params[key]+ """' AND """
-            q = q[:len(q)-4]
-            q = q + """RETURN DISTINCT l ORDER BY ID(l)"""
-            
-            table = gdb.query(q)
+            where, params = where_clause('l', query_params, ['frequency'])
+        else:
+            where, params = """HAS (l.CITE)""", {}
+        
+        q = """MATCH (l:`Lemma`)-[:values]->(w:`Word`) WHERE """ + where + """ WITH DISTINCT l ORDER BY ID(l)"""
+        if offset:
+            q = q + """ SKIP {offset}"""
+            params['offset'] = offset
+        if limit is not None:
+            q = q + """ LIMIT {limit}"""
+            params['limit'] = limit + 1
+        
+        if values == 'full':
+            q = q + """ OPTIONAL MATCH (l)-[:values]->(v:`Word`) RETURN l, collect(v) ORDER BY ID(l)"""
+        elif values == 'ids':
+            q = q + """ OPTIONAL MATCH (l)-[:values]->(v:`Word`) RETURN l, collect(ID(v)) ORDER BY ID(l)"""
+        else:
+            q = q + """ RETURN l ORDER BY ID(l)"""
+        
+        table = gdb.query(q, params=params)
+        more = limit is not None and len(table) > limit
         
-        # default querying    
-        else:    
-            table = gdb.query("""MATCH (l:`Lemma`)-[:values]->(w:`Word`) WHERE HAS (l.CITE) RETURN DISTINCT l ORDER BY ID(l)""")
-            
         # create the objects which was queried for and set all necessary attributes
-        for t in table:
+        lemmas = []
+        for t in table[:limit]:
             lemma = t[0]    
             url = lemma['self'].split('/')        
                 
-            new_obj = DataObject(url[len(url)-1])
-            new_obj.__dict__['_data'] = lemma['data']        
-            new_obj.__dict__['_data']['id'] = url[len(url)-1]
+            new_obj = DataObject(url[len(url)-1], lemma['data'])
             
-            # get the word as a node to query relations
-            lemmaNode = gdb.nodes.get(lemma['self'])
+            if values == 'full':
+                valuesArray = []
+                for val in t[1]:
+                    valurl = val['self'].split('/')
+                    val['data']['resource_uri'] = API_PATH + 'word/' + valurl[len(valurl)-1] + '/'
+                    valuesArray.append(val['data'])
+                new_obj.values = valuesArray
+            elif values == 'ids':
+                new_obj.values = [{'id': id, 'resource_uri': API_PATH + 'word/' + str(id) + '/'} for id in sorted(t[1])]
             
-            values = lemmaNode.relationships.outgoing(types=["values"])    
-            valuesArray = []
-            for v in range(0, len(values), 1):
-                val = values[v].end
-                val.properties['resource_uri'] = API_PATH + 'word/' + str(val.id) + '/'
-                valuesArray.append(val.properties)
-
-            new_obj.__dict__['_data']['values'] = valuesArray            
             lemmas.append(new_obj)
                 
-        return lemmas
+        return lemmas, more
+    
+    def get_object_list(self, request):
+        
+        query_params = filter_params(request.GET, ['CITE', 'value', 'posAdd', 'frequency'])
+        return self.lemma_page(query_params, request.GET.get('values', 'full'))[0]
+    
+    def projection(self):
+        
+        if getattr(self, '_projection', None) is None:
+            self._projection = FieldProjection(self, API_PATH)
+        return self._projection
+    
+    def get_list(self, request, **kwargs):
+        """
+        Pages in the query (SKIP/LIMIT) instead of slicing the list of all lemmas; meta has no total_count,
+        meta.next links to the next page while there is one.
+        With fast=1 the lemmas are serialized to JSON by the precompiled projection of the fields instead of being dehydrated.
+        """
+        errors = self._meta.validation.is_valid(self.build_bundle(request=request), request)
+        if len(errors) > 0:
+            return self.error_response(request, errors, response_class=HttpBadRequest)
+        
+        values = request.GET.get('values', 'full')
+        if values not in LEMMA_VALUES:
+            raise BadRequest("Invalid values provided. Please provide one of %s." % ', '.join(LEMMA_VALUES))
+        
+        try:
+            limit = int(request.GET.get('limit', getattr(settings, 'API_LIMIT_PER_PAGE', 20)))
+            offset = int(request.GET.get('offset', 0))
+        except ValueError:
+            raise BadRequest("Invalid limit or offset provided. Please provide a positive integer.")
+        if limit <= 0 or limit > self._meta.max_limit:
+            limit = self._meta.max_limit
+        offset = max(offset, 0)
+        
+        query_params = filter_params(request.GET, ['CITE', 'value', 'posAdd', 'frequency'])
+        lemmas, more = self.lemma_page(query_params, values, offset, limit)
+        
+        meta = {'limit': limit, 'offset': offset, 'previous': None, 'next': None}
+        params = request.GET.copy()
+        if offset > 0:
+            params['offset'] = max(offset - limit, 0)
+            meta['previous'] = request.path + '?' + params.urlencode()
+        if more:
+            params['offset'] = offset + limit
+            meta['next'] = request.path + '?' + params.urlencode()
+        
+        if wants_fast(self, request):
+            return fast_list_response(self.projection(), meta, lemmas)
+        
+        bundles = [self.full_dehydrate(self.build_bundle(obj=obj, request=request), for_list=True) for obj in lemmas]
+        to_be_serialized = self.alter_list_data_to_serialize(request, {'meta': meta, 'objects': bundles})
+        return self.create_response(request, to_be_serialized)
     
     def obj_get_list(self, bundle, **kwargs):
         
@@ -122,36 +165,37 @@ class LemmaResource(Resource):
     
     def obj_get(self, bundle, **kwargs):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
-        lemma = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
+        gdb = get_graph()
+        
+        # the lemma, its values and, for the full representation, their translations in one query
+        if bundle.request.GET.get('full'):
+            table = gdb.query("""MATCH (l:`Lemma`) WHERE ID(l) = {id} OPTIONAL MATCH (l)-[:values]->(v:`Word`) OPTIONAL MATCH (v)-[:translation]->(t:`Word`) RETURN l, v, collect(DISTINCT t) ORDER BY ID(v)""", params={'id': int(kwargs['pk'])})
+        else:
+            table = gdb.query("""MATCH (l:`Lemma`) WHERE ID(l) = {id} OPTIONAL MATCH (l)-[:values]->(v:`Word`) RETURN l, v, [] ORDER BY ID(v)""", params={'id': int(kwargs['pk'])})
+        if len(table) < 1:
+            raise ObjectDoesNotExist("Lemma %s doesn't exist." % kwargs['pk'])
         
-        # ge the data of the word
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = lemma.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
+        # get the data of the lemma
+        new_obj = DataObject(kwargs['pk'], table[0][0]['data'])
         
         # get the values    
-        values = lemma.relationships.outgoing(types=["values"])            
         valuesArray = []
-        for v in range(0, len(values), 1):
-            val = values[v].end
-            val.properties['resource_uri'] = API_PATH + 'word/' + str(val.id) + '/'
-            val.properties['translations'] = []
-
-            # get the full translation # force API into full representation if cache is enabled
-            if bundle.request.GET.get('full'):    
-                
-                translations = gdb.query("""MATCH (d:`Word`)-[:translation]->(w:`Word`) WHERE d.CTS='""" + val.properties['CTS'] + """' RETURN DISTINCT w ORDER BY ID(w)""")
-                translationArray = []
-                for t in translations:
-                    trans = t[0]
-                    transurl = trans['self'].split('/')
-                    trans['data']['resource_uri'] = API_PATH + 'word/' + transurl[len(transurl)-1] + '/'
-                    translationArray.append(trans['data'])
-                    val.properties['translations'] = translationArray
+        for row in table:
+            val = row[1]
+            if val is None:
+                continue
+            url = val['self'].split('/')
+            val['data']['resource_uri'] = API_PATH + 'word/' + url[len(url)-1] + '/'
+            
+            translationArray = []
+            for trans in sorted(row[2], key=lambda t: int(t['self'].split('/')[-1])):
+                transurl = trans['self'].split('/')
+                trans['data']['resource_uri'] = API_PATH + 'word/' + transurl[len(transurl)-1] + '/'
+                translationArray.append(trans['data'])
+            val['data']['translations'] = translationArray
             
-            valuesArray.append(val.properties)
+            valuesArray.append(val['data'])
             
-        new_obj.__dict__['_data']['values'] = valuesArray
+        new_obj.values = valuesArray
 
-        return new_obj
\ No newline at end of file
+        return new_obj
@@ -1,19 +1,66 @@
 from phaidra.settings import CTS_LANG
-from phaidra.settings import GRAPH_DATABASE_REST_URL, API_PATH
+from phaidra.settings import API_PATH
 
-from django.core.cache import cache
+from django.conf.urls import url
+from django.core.exceptions import ObjectDoesNotExist
 
 from tastypie import fields
 from tastypie.bundle import Bundle
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.exceptions import BadRequest
+from tastypie.http import HttpBadRequest
 from tastypie.resources import Resource
+from tastypie.utils import trailing_slash
 
-from neo4jrestclient.client import GraphDatabase
+from common.utils.graph import get_graph
 
 # imported from the phaidra api
 from validation import ResourceValidation
-from utils import DataObject, sort_sentences, sort_words
+from utils import DataObject, CtsUrn, cts_sort_key, sort_by_cts
+from cypher import WORD_ATTRIBUTES, WORD_INTEGER_ATTRIBUTES, compile_predicate, filter_params, where_clause
+from syntax import SentenceTree, short_sentence
+from grammar_query import compiled_query
+from versioned_cache import VersionedCache
+
+
+# detail representations of sentences, per process and in the shared cache
+sentence_cache = VersionedCache('sentence')
+# ids of the sentences of a document with a matching short sentence, per filters
+short_cache = VersionedCache('short_sentences')
+
+
+"""
+Returns the sentences (id and CTS, in CTS order) of a document whose short sentence contains a word matching the filters,
+all sentences which can be shortened if there are no filters.
+The words of the whole document are read with one query, the sentences are shortened over their trees in one pass.
+"""
+def short_sentence_candidates(document_CTS, params):
+
+    cacheKey = short_cache.key(document_CTS, 'short', params)
+    cached = short_cache.get(cacheKey)
+    if cached is not None:
+        return cached
+
+    gdb = get_graph()
+    table = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`)-[:words]->(w:`Word`) WHERE d.CTS = {document_CTS} RETURN ID(s), s.CTS, collect(w)""", params={'document_CTS': document_CTS})
+    predicate = compile_predicate(params, WORD_INTEGER_ATTRIBUTES) if params else None
+
+    candidates = []
+    for row in sorted(table, key=lambda row: cts_sort_key(row[1])):
+        # collect() has no order, the words are shortened in CTS order like in obj_get
+        words = sort_by_cts([w['data'] for w in row[2]])
+        tree = SentenceTree.from_words(words)
+        if tree is None:
+            continue
+        positions = short_sentence(tree)
+        if positions is None:
+            continue
+        if predicate is not None and not any(predicate(words[i]) for i in positions):
+            continue
+        candidates.append({'id': row[0], 'CTS': row[1], 'resource_uri': API_PATH + 'sentence/' + str(row[0]) + '/'})
+
+    short_cache.set(cacheKey, candidates)
+    return candidates
 
 
 class SentenceResource(Resource):
@@ -29,9 +76,53 @@ class SentenceResource(Resource):
         object_class = DataObject
         resource_name = 'sentence'    
         authorization = ReadOnlyAuthorization()    
-        # cache = SimpleCache(timeout=None) # caching is not that easy for this resource, caching inline
+        # cache = SimpleCache(timeout=None) # caching is not that easy for this resource, see sentence_cache
         validation =  ResourceValidation()
     
+    def prepend_urls(self, *args, **kwargs):    
+        
+        return [
+            url(r"^(?P<resource_name>%s)/%s%s$" % (self._meta.resource_name, 'cache', trailing_slash()), self.wrap_view('cache_stats'), name="api_%s" % 'sentence_cache'),
+            url(r"^(?P<resource_name>%s)/%s%s$" % (self._meta.resource_name, 'short', trailing_slash()), self.wrap_view('short'), name="api_%s" % 'sentence_short')
+            ]
+    
+    """
+    Returns hit and miss counters and the size of the sentence caches of this process.
+    """
+    def cache_stats(self, request, **kwargs):
+        
+        self.method_check(request, allowed=['get'])
+        return self.create_response(request, {'cache': sentence_cache.stats(), 'short_cache': short_cache.stats()})
+    
+    """
+    Returns the sentences of a document (document_CTS) whose short sentence (short=1) hits the query, given as a grammar ref 
+    and/or word filters, e.g. sentence/short/?document_CTS=urn:cts:greekLit:tlg0003.tlg001.perseus-grc&ref=s1.
+    """
+    def short(self, request, **kwargs):
+        
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        
+        errors = self._meta.validation.is_valid(self.build_bundle(request=request), request)
+        if len(errors) > 0:
+            return self.error_response(request, errors, response_class=HttpBadRequest)
+        
+        document_CTS = request.GET.get('document_CTS')
+        if not document_CTS:
+            raise BadRequest("Parameter document_CTS is required.")
+        
+        query_params = {}
+        if request.GET.get('ref'):
+            compiled = compiled_query(request.GET.get('ref'))
+            if compiled is None:
+                return self.create_response(request, {'document_CTS': document_CTS, 'ref': request.GET.get('ref'), 'count': 0, 'sentences': []})
+            query_params = dict(compiled.params)
+        query_params.update(filter_params(request.GET, WORD_ATTRIBUTES))
+        
+        candidates = short_sentence_candidates(document_CTS, query_params)
+        return self.create_response(request, {'document_CTS': document_CTS, 'ref': request.GET.get('ref'), 'count': len(candidates), 'sentences': candidates})
+    
     def detail_uri_kwargs(self, bundle_or_obj):
         
         kwargs = {}
@@ -44,50 +135,18 @@ class SentenceResource(Resource):
 
     def get_object_list(self, request):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)    
-        attrlist = ['CTS', 'length', 'sentence']
+        gdb = get_graph()    
         sentences = []
-        
-        query_params = {}
-        for obj in request.GET.keys():
-            if obj in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
+        query_params = filter_params(request.GET, ['CTS', 'length', 'sentence'])
         
         # implement filtering
         if len(query_params) > 0:
             
             # generate query
-            q = """MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE """
-            
-            # filter word on parameters
-            for key in query_params:                    
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'gt':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """>""" +query_params[key]+ """ AND """
-                    elif key.split('__')[1] == 'lt':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<""" +query_params[key]+ """ AND """    
-                    elif key.split('__')[1] == 'isnot':
-                        if key.split('__')[0] == 'length':
-                            q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<>""" +query_params[key]+ """ AND """
-                        else:
-                            q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                else:
-                    if key == 'length':
-                        q = q + """HAS (s.""" +key+ """) AND s.""" +key+ """=""" +query_params[key]+ """ AND """
-                    else:
-                        q = q + """HAS (s.""" +key+ """) AND s.""" +key+ """='""" +query_params[key]+ """' AND """
-            q = q[:len(q)-4]
-            q = q + """RETURN s, d ORDER BY ID(s)"""
+            where, params = where_clause('s', query_params, ['length'])
+            q = """MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE """ + where + """ RETURN s, d ORDER BY ID(s)"""
             
-            table = gdb.query(q)
+            table = gdb.query(q, params=params)
         
         # default querying    
         else:    
@@ -100,13 +159,11 @@ class SentenceResource(Resource):
             url = sentence['self'].split('/')
             urlDoc = document['self'].split('/')        
                 
-            new_obj = DataObject(url[len(url)-1])
-            new_obj.__dict__['_data'] = sentence['data']        
-            new_obj.__dict__['_data']['id'] = url[len(url)-1]
-            new_obj.__dict__['_data']['document_resource_uri'] = API_PATH + 'document/' + urlDoc[len(urlDoc)-1] +'/'
+            new_obj = DataObject(url[len(url)-1], sentence['data'])
+            new_obj.document_resource_uri = API_PATH + 'document/' + urlDoc[len(urlDoc)-1] +'/'
             sentences.append(new_obj)
                 
-        return sort_sentences(sentences)
+        return sort_by_cts(sentences)
     
     def obj_get_list(self, bundle, **kwargs):
         
@@ -118,77 +175,77 @@ class SentenceResource(Resource):
     
     def obj_get(self, bundle, **kwargs):
         
-        # get the actually cached objects 
-        if cache.get("sentence_%s"%kwargs['pk']) is not None and not bundle.request.GET.get('full') and not bundle.request.GET.get('short'):
-            return cache.get("sentence_%s"%kwargs['pk'])
+        # query parameters (optional) for short sentence approach
+        query_params = filter_params(bundle.request.GET, WORD_ATTRIBUTES)
         
-        elif bundle.request.GET.get('short') and not bundle.request.GET.get('full') and cache.get("sentence_short_%s"%kwargs['pk']) is not None:
-            return cache.get("sentence_short_%s"%kwargs['pk'])
+        # the representation depends on full, short and, for short sentences, the query parameters
+        representation = ('full_' if bundle.request.GET.get('full') else '') + ('short' if bundle.request.GET.get('short') else 'sentence')
+        cacheKey = sentence_cache.key(kwargs['pk'], representation, query_params if bundle.request.GET.get('short') else None)
+        cached = sentence_cache.get(cacheKey)
+        if cached is not None:
+            return cached
         
-        elif bundle.request.GET.get('full') and not bundle.request.GET.get('short') and cache.get("sentence_full_%s"%kwargs['pk']) is not None:
-            return cache.get("sentence_full_%s"%kwargs['pk'])
+        try:
+            sentence_id = int(kwargs['pk'])
+        except ValueError:
+            raise ObjectDoesNotExist("Sentence %s doesn't exist." % kwargs['pk'])
         
-        elif cache.get("sentence_full_short%s"%kwargs['pk']) is not None and not bundle.request.GET.get('full') and not bundle.request.GET.get('short'):
-            return cache.get("sentence_full_short_%s"%kwargs['pk'])
-    
-        # query parameters (optional) for short sentence approach
-        attrlist = ['CTS', 'length', 'case', 'dialect', 'head', 'form', 'posClass', 'cid', 'gender', 'tbwid', 'pos', 'value', 'degree', 'number','lemma', 'relation', 'isIndecl', 'ref', 'posAdd', 'mood', 'tense', 'voice', 'person']
-        query_params = {}
-        for obj in bundle.request.GET.keys():
-            if obj in attrlist and bundle.request.GET.get(obj) is not None:
-                query_params[obj] = bundle.request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and bundle.request.GET.get(obj) is not None:
-                query_params[obj] = bundle.request.GET.get(obj)
+        # get the sentence, its document, aligned sentences, words, lemmas and translations in one round-trip
+        gdb = get_graph()
+        table = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE ID(s) = {sentence_id}
+                             OPTIONAL MATCH (s)-[:aligned_with]->(a:`Sentence`)
+                             WITH d, s, collect(DISTINCT a) AS aligned
+                             OPTIONAL MATCH (s)-[:words]->(w:`Word`)
+                             OPTIONAL MATCH (l:`Lemma`)-[:values]->(w)
+                             WITH d, s, aligned, w, head(collect(ID(l))) AS lemma_id
+                             OPTIONAL MATCH (w)-[:translation]->(t:`Word`)
+                             RETURN d, s, w, lemma_id, collect(DISTINCT t), aligned""", params={'sentence_id': sentence_id})
+        
+        if len(table) < 1:
+            raise ObjectDoesNotExist("Sentence %s doesn't exist." % kwargs['pk'])
+        
+        document = table[0][0]
+        sentence = table[0][1]
+        urlDoc = document['self'].split('/')
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
-        sentence = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
-            
         # get the sentence parameters            
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = sentence.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
-        new_obj.__dict__['_data']['document_resource_uri'] = API_PATH + 'document/' + str(sentence.relationships.incoming(types=["sentences"])[0].start.id) + '/'
+        new_obj = DataObject(kwargs['pk'], sentence['data'])
+        new_obj.document_resource_uri = API_PATH + 'document/' + urlDoc[len(urlDoc)-1] + '/'
+        new_obj.translations = {}
         
         # get a dictionary of related translation of this sentence 
-        relatedSentences = gdb.query("""MATCH (s:`Sentence`)-[:words]->(w:`Word`)-[:translation]->(t:`Word`)<-[:words]-(s1:`Sentence`) WHERE HAS (s.CTS) AND s.CTS='"""+ sentence.properties['CTS'] + """' RETURN DISTINCT s1 ORDER BY ID(s1)""")
-    
-        new_obj.__dict__['_data']['translations']={}
-        for rs in relatedSentences:
-            sent = rs[0]
-            url = sent['self'].split('/')
-            for lang in CTS_LANG:
-                if sent['data']['CTS'].find("-"+lang+":") != -1:
-                    new_obj.__dict__['_data']['translations'][lang] = API_PATH + 'sentence/' + url[len(url)-1] +'/'        
+        for sent in table[0][5]:
+            lang = CtsUrn.parse(sent['data']['CTS']).lang
+            if lang in CTS_LANG:
+                url = sent['self'].split('/')
+                new_obj.translations[lang] = API_PATH + 'sentence/' + url[len(url)-1] +'/'
         
-        # get the words and lemma resource uri of the sentence    
-        words = gdb.query("""MATCH (d:`Sentence`)-[:words]->(w:`Word`) WHERE d.CTS='""" +sentence.properties['CTS']+ """' RETURN DISTINCT w ORDER BY ID(w)""")
         wordArray = []
-        for w in words:
-            word = w[0]
+        for t in table:
+            word = t[2]
+            # sentence without words
+            if word is None:
+                continue
+            
             url = word['self'].split('/')
             word['data']['resource_uri'] = API_PATH + 'word/' + url[len(url)-1] + '/'
-            wordNode = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + url[len(url)-1] + '/')
             
             # get the lemma    
-            lemmaRels = wordNode.relationships.incoming(types=["values"])
-            if len(lemmaRels) > 0:
-                word['data']['lemma_resource_uri'] = API_PATH + 'lemma/' + str(lemmaRels[0].start.id) + '/'
+            if t[3] is not None:
+                word['data']['lemma_resource_uri'] = API_PATH + 'lemma/' + str(t[3]) + '/'
             
             # get the translations of a word if parameter is set
-            if bundle.request.GET.get('full'):    
-                
-                translations = gdb.query("""MATCH (d:`Word`)-[:translation]->(w:`Word`) WHERE d.CTS='""" +wordNode.properties['CTS']+ """' RETURN DISTINCT w ORDER BY ID(w)""")
+            if bundle.request.GET.get('full'):
                 translationArray = []
-                for t in translations:
-                    trans = t[0]
+                for trans in t[4]:
                     transurl = trans['self'].split('/')
                     trans['data']['resource_uri'] = API_PATH + 'word/' + transurl[len(transurl)-1] + '/'
                     translationArray.append(trans['data'])
-                    word['data']['translations'] = translationArray
-                
+                word['data']['translations'] = sort_by_cts(translationArray)
+            
             wordArray.append(word['data'])
             
-        wordArray = sort_words(wordArray)
+        wordArray = sort_by_cts(wordArray)
             
         # if short=True return only words of the short sentence
         if bundle.request.GET.get('short'):
@@ -199,129 +256,33 @@ class SentenceResource(Resource):
                 raise BadRequest("Sentence doesn't hit your query.")
         
         
-        new_obj.__dict__['_data']['words'] = wordArray
-        
-        # deal with caching here -> all are different objects
-        if bundle.request.GET.get('full') and bundle.request.GET.get('short'):    
-            if cache.get("sentence_full_short_%s"%kwargs['pk']) is None:
-                cache.set("sentence_full_short_%s"%kwargs['pk'], new_obj, None)
+        new_obj.words = wordArray
         
-        if bundle.request.GET.get('short'):                    
-            if cache.get("sentence_short_%s"%kwargs['pk']) is None:
-                cache.set("sentence_short_%s"%kwargs['pk'], new_obj, None)
-                
-        elif bundle.request.GET.get('full'):
-            if cache.get("sentence_full_%s"%kwargs['pk']) is None:
-                cache.set("sentence_full_%s"%kwargs['pk'], new_obj, None)
-            
-        else:
-            if cache.get("sentence_%s"%kwargs['pk']) is None:    
-                cache.set("sentence_%s"%kwargs['pk'], new_obj, None)
+        sentence_cache.set(cacheKey, new_obj)
 
         return new_obj
     
     
-    class node(object):
-        
-        def __init__(self, value):
-            self.value = value
-            self.children = []
-            
-        def add_child(self, obj):
-            self.children.append(obj)
-                    
     """
-    Function for shortening a sentence
+    Function for shortening a sentence, returns the words of the short sentence (see syntax.short_sentence) or None.
+    With filters the short sentence has to contain a word matching them.
     """    
     def shorten(self, wordArray, params = None):
         
-        words = wordArray        
         # interrupt as soon as possible if there is no according syntactical information available
-        try:
-            words[0]['head']
-        except KeyError as k:
+        tree = SentenceTree.from_words(wordArray)
+        if tree is None:
             return None
-            
-        # save words within a map for faster lookup            
-        nodes = dict((word['tbwid'], self.node(word)) for word in words)
-        # build a "tree"
-        verbs = []
-        for w in words:
-            if w['head'] != 0:
-                   nodes[w['head']].add_child(nodes[w['tbwid']])
-            if w['relation'] == "PRED" or w['relation'] == "PRED_CO":
-                   verbs.append(w)
-                                                        
-        # start here 
-        for verb in verbs:                    
-            # get the verb
-            if verb['relation'] == "PRED" or verb['relation'] == "PRED_CO":                        
-                u, i = [], []
-                aim_words = []
-                # group the words and make sure, save the selected words
-                for word in nodes[verb['tbwid']].children:
-                                            
-                    if word.value['relation'] == "COORD":
-                        u.append(word.value['tbwid'])
-                        #aim_words.append(word)
-                        for w in nodes[word.value['tbwid']].children:
-                            if (w.value['relation'] == "OBJ_CO" or w.value['relation'] == "ADV_CO") and w.value['pos'] != "participle" and w.value['pos'] != "verb":
-                                i.append(w.value['tbwid'])
-                                #aim_words.append(w.value) # Is are checked later
-                    
-                    elif word.value['relation'] == "AuxP":
-                        aim_words.append(word.value)
-                        for w in nodes[word.value['tbwid']].children:
-                            if w.value['relation'] != "AuxC" and w.value['pos'] != "participle":
-                                aim_words.append(w.value)
-                    
-                                for w2 in nodes[w.value['tbwid']].children:
-                                    if w2.value['relation'] == "ATR" and w2.value['pos'] != "verb":
-                                        aim_words.append(w2.value)
-                                        
-                                        
-                    elif word.value['relation'] != "AuxC" and word.value['relation'] != "COORD" and word.value['pos'] != "participle":
-                        aim_words.append(word.value)
-                        for w in nodes[word.value['tbwid']].children:
-                            if w.value['relation'] == "ATR" and w.value['pos'] != "verb":
-                                aim_words.append(w.value)
-                    
-                # refinement of u coords # i want u if i is not empty
-                for id in u:
-                    for id2 in i:
-                        w = nodes[id2].value
-                        if w['head'] == id:
-                            aim_words.append(w)
-                    if len(i) > 0:
-                        w2 = nodes[id].value
-                        aim_words.append(w2)
-                          
-                            
-                aim_words.append(verb)    
-                # check if not verbs only are returned
-                if len(aim_words) > 1:
-                    # consider params
-                    if len(params) > 0:
-                        # check if aim_words and parameter filtered intersect 
-                        cand = False
-                        for w in aim_words:
-                            for key in params:
-                                if w[key] == params[key]:
-                                    cand = True
-                                else:
-                                    cand = False
-                                    continue
-                            
-                            if cand:                                        
-                                # set and order words
-                                return sorted(aim_words, key=lambda x: x['tbwid'])    
-                        
-                        return None        
-                    else:        
-                        # set and order words
-                        return sorted(aim_words, key=lambda x: x['tbwid'])                
-                    
-                    # set and order words
-                    return sorted(aim_words, key=lambda x: x['tbwid'])
-                                    
-        return None
+        
+        positions = short_sentence(tree)
+        if positions is None:
+            return None
+        aim_words = [wordArray[i] for i in positions]
+        
+        # consider params
+        if params:
+            predicate = compile_predicate(params, WORD_INTEGER_ATTRIBUTES)
+            if not any(predicate(w) for w in aim_words):
+                return None
+        
+        return aim_words
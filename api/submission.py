@@ -1,20 +1,19 @@
 #from __future__ import unicode_literals
-from phaidra.settings import GRAPH_DATABASE_REST_URL
+from phaidra.settings import GRAPH_DATABASE_REST_URL, ENABLE_SUBMISSION_QUEUE
 
-from django.core.exceptions import ValidationError
+from django.conf.urls import url
 
 from tastypie import fields
 from tastypie.bundle import Bundle
 from tastypie.authentication import SessionAuthentication, BasicAuthentication
 from tastypie.authorization import Authorization
-from tastypie.http import HttpBadRequest, HttpUnauthorized
+from tastypie.http import HttpBadRequest, HttpForbidden, HttpUnauthorized
 from tastypie.exceptions import BadRequest, Unauthorized
 from tastypie.resources import Resource
+from tastypie.utils import trailing_slash
 from tastypie.cache import SimpleCache
 
-from neo4jrestclient.client import GraphDatabase
-
-from app.models import Grammar
+from common.utils.graph import get_graph
 
 import json
 import os
@@ -23,69 +22,136 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "phaidra.settings")
 # imported from the phaidra api
 from validation import ResourceValidation
 from utils import DataObject
+from cypher import filter_params, where_clause
+from grammar_query import compiled_query
+from knowledge import record_submission
+from submission_queue import enqueue, idempotency_key, queue_status
+  
+
+SUBMISSION_STATEMENT = """MERGE (u:`User` {username: {username}})
+CREATE (s:`Submission` {properties})
+CREATE (u)-[:submits]->(s)"""
+
+KNOWS_MORPH_STATEMENT = """MATCH (u:`User` {username: {username}})
+MATCH (w:`Word`) WHERE %s
+MERGE (u)-[:knows_morph]->(w)"""
+
+# times_seen is counted up by neo4j, seen is a word CTS with the number of times it was encountered in the submission
+HAS_SEEN_STATEMENT = """MATCH (u:`User` {username: {username}})
+UNWIND {words} AS seen
+MATCH (l:`Lemma`)-[:values]->(w:`Word` {CTS: seen.CTS})
+WITH u, seen, w, head(collect(l)) AS l
+MERGE (u)-[r:has_seen]->(w)
+ON CREATE SET r.times_seen = seen.times
+ON MATCH SET r.times_seen = r.times_seen + seen.times
+MERGE (u)-[:has_seen]->(l)"""
+
+
+"""
+Returns the statements relating a user to the words of the ref's grammar (knows_morph) and to the encountered words 
+and their lemmas (has_seen), None if the ref can't be processed. 
+Words without lemma (punctuation) aren't related.
+"""
+def knowledge_statements(username, ref, encounteredWords):
+
+    compiled = compiled_query(ref)
+    if compiled is None:
+        return None
+    where, params = compiled.where('w')
+    if not where:
+        return None
+
+    params = dict(params)
+    params['username'] = username
+    
+    times = {}
+    for cts in encounteredWords:
+        times[cts] = times.get(cts, 0) + 1
+    
+    return [(KNOWS_MORPH_STATEMENT % where, params),
+            (HAS_SEEN_STATEMENT, {'username': username, 'words': [{'CTS': cts, 'times': times[cts]} for cts in sorted(times)]})]
+
   
+"""
+Writes a submission, the user node (created if it doesn't exist yet) and the user's knowledge relationships in one transaction.
+Queued submissions carry their idempotency key.
+Returns an error message if the ref can't be processed, the submission itself is saved anyway.
+"""
+def write_submission(username, data, key=None):
+
+    gdb = get_graph()
+    
+    # create the submission        
+    properties = {
+        'response': data.get("response"),
+        'task': data.get("task"), 
+        'ref': data.get("ref"),    # string
+        'starttime': data.get("starttime"),
+        'accuracy': int(data.get("accuracy")),
+        'encounteredWords': data.get("encounteredWords"), # array
+        'timestamp': data.get("timestamp"),
+        'key': key
+    }
+    statements = [(SUBMISSION_STATEMENT, {'username': username, 'properties': dict((k, value) for k, value in properties.items() if value is not None)})]
+    
+    # check empty encountered words than spare the knowledge relationships
+    encounteredWords = data.get("encounteredWords") or []
+    if all(encounteredWords):
+        knowledge = knowledge_statements(username, data.get("ref"), encounteredWords)
+        if knowledge is None:
+            gdb.commit(statements)
+            return 'Reference data could not be processed.'
+        statements.extend(knowledge)
+    
+    gdb.commit(statements)
+    return None
+
+
+"""
+Adds a written submission to the materialised knowledge map of the user, like rebuild() does for every submission.
+"""
+def record_knowledge(username, data):
+
+    record_submission(username, data.get("ref"), data.get("encounteredWords"))
+
 
+"""
+Writes a submission and updates the user's knowledge map, returns the error message of write_submission.
+"""
+def save_submission(username, data, key=None):
+
+    error = write_submission(username, data, key)
+    record_knowledge(username, data)
+    return error
+
+  
 class SubmissionAuthorization(Authorization):
     
     def read_list(self, object_list, bundle):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)        
-        attrlist = ['response', 'task', 'ref', 'user', 'starttime', 'timestamp', 'accuracy']
-        
-        query_params = {}
-        for obj in bundle.request.GET.keys():
-            if obj in attrlist and bundle.request.GET.get(obj) is not None:
-                query_params[obj] = bundle.request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and bundle.request.GET.get(obj) is not None:
-                query_params[obj] = bundle.request.GET.get(obj)
+        gdb = get_graph()        
+        query_params = filter_params(bundle.request.GET, ['response', 'task', 'ref', 'user', 'starttime', 'timestamp', 'accuracy'])
                 
         # implement filtering
         if len(query_params) > 0:
                         
             # generate query
-            q = """MATCH (u:`User`)-[:submits]->(s:`Submission`) WHERE """
-            
-            # filter word on parameters
-            for key in query_params:                
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'isnot':
-                        if key.split('__')[0] == 'accuracy':
-                            q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<>""" +query_params[key]+ """ AND """
-                        else:
-                            q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                    elif key.split('__')[1] == 'gt':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """>""" +query_params[key]+ """ AND """
-                    elif key.split('__')[1] == 'lt':
-                        q = q + """HAS (s.""" +key.split('__')[0]+ """) AND s.""" +key.split('__')[0]+ """<""" +query_params[key]+ """ AND """
-                else:
-                    if key == 'accuracy':
-                        q = q + """HAS (s.""" +key+ """) AND s.""" +key+ """=""" +query_params[key]+ """ AND """
-                    else:
-                        q = q + """HAS (s.""" +key+ """) AND s.""" +key+ """='""" +query_params[key]+ """' AND """
-            q = q[:len(q)-4]
-            q = q + """RETURN s"""
+            where, params = where_clause('s', query_params, ['accuracy'])
+            q = """MATCH (u:`User`)-[:submits]->(s:`Submission`) WHERE """ + where + """ RETURN s"""
             
-            table = gdb.query(q)
+            table = gdb.query(q, params=params)
     
         # ordinary querying
         else:    
-            table = gdb.query("""MATCH (u:`User`)-[:submits]->(s:`Submission`) WHERE HAS (u.username) AND u.username='""" + bundle.request.user.username + """' RETURN s""")        
+            table = gdb.query("""MATCH (u:`User`)-[:submits]->(s:`Submission`) WHERE HAS (u.username) AND u.username = {username} RETURN s""", params={'username': bundle.request.user.username})
                 
         # create the objects which was queried for and set all necessary attributes
         submissions = []
         for s in table:
             submission = s[0]    
             url = submission['self'].split('/')                        
-            new_obj = DataObject(url[len(url)-1])
-            new_obj.__dict__['_data'] = submission['data']        
-            new_obj.__dict__['_data']['id'] = url[len(url)-1]
-            new_obj.__dict__['_data']['user'] = bundle.request.user.username                        
+            new_obj = DataObject(url[len(url)-1], submission['data'])
+            new_obj.user = bundle.request.user.username                        
             submissions.append(new_obj)
                 
         return submissions
@@ -122,6 +188,12 @@ class SubmissionResource(Resource):
         cache = SimpleCache(timeout=None)
         validation =  ResourceValidation()
 
+    def prepend_urls(self, *args, **kwargs):    
+        
+        return [
+            url(r"^(?P<resource_name>%s)/%s%s$" % (self._meta.resource_name, 'queue', trailing_slash()), self.wrap_view('queue'), name="api_%s" % 'submission_queue')
+            ]
+
     def detail_uri_kwargs(self, bundle_or_obj):
         
         kwargs = {}    
@@ -160,12 +232,10 @@ class SubmissionResource(Resource):
     
     def obj_get(self, bundle, **kwargs):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         submission = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
             
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = submission.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
+        new_obj = DataObject(kwargs['pk'], submission.properties)
             
         try:
             auth_result = self._meta.authorization.read_detail(new_obj, bundle)
@@ -174,12 +244,24 @@ class SubmissionResource(Resource):
 
         return auth_result    
       
+    """
+    Returns the number of pending and failed queued submissions and the lag of the queue in seconds, to staff users only.
+    """
+    def queue(self, request, **kwargs):
+        
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        if not request.user.is_staff:
+            return HttpForbidden()
+        
+        return self.create_response(request, {'queue': queue_status()})
+    
     def post_list(self, request, **kwargs):
         """
         Create a new submission object, which relates to the slide it responds to and the user who submitted it.
         Return the submission object, complete with whether or not they got the answer correct.
         """
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         
         self.method_check(request, allowed=['post'])
         self.is_authenticated(request)
@@ -189,97 +271,19 @@ class SubmissionResource(Resource):
 
         data = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
 
-        # get the user via neo look-up or create a newone
         if request.user.username is not None:
-            userTable = gdb.query("""MATCH (u:`User`)-[:submits]->(s:`Submission`) WHERE HAS (u.username) AND u.username='""" + request.user.username + """' RETURN u""")
             
-            if len(userTable) > 0:
-                userurl = userTable[0][0]['self']
-                userNode = gdb.nodes.get(userurl)
+            # catch this so that it doesn't lead to submission problems
+            int(data.get("accuracy"))
             
+            # respond right away and let the worker write to neo4j ...
+            if ENABLE_SUBMISSION_QUEUE:
+                enqueue(request.user.username, data, idempotency_key(request, request.user.username))
+            # ... or write it now
             else:
-                userNode = gdb.nodes.create(username=request.user.username)
-                userNode.labels.add("User")
-                
-            # create the submission        
-            subms = gdb.nodes.create(
-                response = data.get("response"),
-                task = data.get("task"), 
-                ref = data.get("ref"),    # string
-                starttime = data.get("starttime"),     # catch this so that it doesn't lead to submission problems
-                accuracy = int(data.get("accuracy")),
-                encounteredWords = data.get("encounteredWords"), # array
-                timestamp = data.get("timestamp") 
-            )
-            
-            subms.labels.add("Submission")
-            
-            if subms is None :
-                # in case an error wasn't already raised             
-                raise ValidationError('Submission node could not be created.')
-            
-            # Form the connections from the new Submission node to the existing slide and user nodes
-            userNode.submits(subms)
-            
-            # check empty encountered words than spare the 
-            for cts in data.get("encounteredWords"):
-                if not cts:
-                    body = json.loads(request.body) if type(request.body) is str else request.body
-                    return self.create_response(request, body)
-            
-            # set links between the ref key filtered words and the user... 
-            q = """MATCH (w:`Word`) WHERE """
-            try:
-                grammarParams = Grammar.objects.filter(ref=data.get("ref"))[0].query.split('&')
-                for pair in grammarParams:
-                    if len(pair.split('=')[0].split('__')) == 1:
-                        attribute = pair.split('=')[0]
-                        value= pair.split('=')[1]
-                        q = q + """HAS (w.""" +attribute+ """) AND w.""" +attribute+ """='""" +value+ """' AND """
-                    elif len(pair.split('=')[0].split('__')) > 1:
-                        attribute = pair.split('=')[0].split('__')[0]
-                        operator = pair.split('=')[0].split('__')[1]
-                        value= pair.split('=')[1]
-                        if operator == 'contains':
-                            q = q + """HAS (w.""" +attribute+ """) AND w.""" +attribute+ """=~'.*""" +value+ """.*' AND """
-                        elif operator == 'startswith':
-                            q = q + """HAS (w.""" +attribute+ """) AND w.""" +attribute+ """=~'""" +value+ """.*' AND """
-                        elif operator == 'endswith':
-                            q = q + """HAS (w.""" +attribute+ """) AND w.""" +attribute+ """=~'.*""" +value+ """' AND """
-                        elif operator == 'isnot':
-                            q = q + """HAS (w.""" +attribute+ """) AND w.""" +attribute+ """<>'""" +value+ """' AND """
-                q = q[:len(q)-4]
-                q = q + """RETURN w"""        
-            except:
-                return self.error_response(request, {'error': 'Reference data could not be processed.' }, response_class=HttpBadRequest)
-            
-            # ... if not already known
-            table = gdb.query(q)
-            for t in table:
-                word = gdb.nodes.get(t[0]['self'])
-                knows_morph = gdb.query("""MATCH (u:`User`)-[kg:knows_morph]->(w:`Word`) WHERE HAS (w.CTS) AND w.CTS='""" + t[0]['data']['CTS'] + """' RETURN kg""")
-                if len(knows_morph) < 1:
-                    userNode.knows_morph(word)              
-                            
-            # set links between the lemmas of the encountered words (as vocab knowledge) and the words themselves, if the encountered words were not already known, otherwise increase times_seen
-            for cts in data.get("encounteredWords"):    
-                relation = gdb.query("""MATCH (u:`User`)-[kv:has_seen]->(w:`Word`)
-                                        WHERE HAS (w.CTS) and w.CTS='""" + cts +"""' and u.username='""" + request.user.username + """' RETURN kv""")
-                try:
-                   times = relation[0][0]['data']['times_seen']+1
-                   id = relation[0][0]['self'].split('/')[len(relation[0][0]['self'].split('/'))-1]  
-                   rel = gdb.relationships.get(id)
-                   rel.properties = {'times_seen':times}      
-                except IndexError as e:   
-                    table = gdb.query("""MATCH (l:`Lemma`)-[:values]->(w:`Word`) WHERE HAS (w.CTS) and w.CTS='""" + cts +"""' RETURN w, l""")
-                    try:
-                        word = gdb.nodes.get(table[0][0]['self'])
-                        lemma = gdb.nodes.get(table[0][1]['self'])
-                        userNode.has_seen(word, times_seen=1)
-                        userNode.has_seen(lemma)
-                    except IndexError as e:
-                        # no relationship between word and lemma means punctuation
-                        continue
+                error = save_submission(request.user.username, data)
+                if error is not None:
+                    return self.error_response(request, {'error': error }, response_class=HttpBadRequest)
                     
             # create the body
             body = json.loads(request.body) if type(request.body) is str else request.body
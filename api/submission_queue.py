@@ -0,0 +1,144 @@
+"""
+Durable queue of submissions in the SubmissionTask table.
+
+With ENABLE_SUBMISSION_QUEUE the API only stores a submission and responds; the process_submissions command takes
+the due tasks in order and writes them to neo4j, failed tasks are retried with exponential backoff and can be queued
+again with manage.py requeue_submissions or the admin. Every task has an idempotency key: the same key is queued once,
+and a task whose submission node (marked with the key) already exists is not written again, e.g. after a worker crash.
+The keys are looked up through the index on :Submission(key), which process_submissions creates on start.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from common.utils.graph import get_graph
+
+from app.models import SubmissionTask
+
+from datetime import timedelta
+
+import hashlib
+import json
+
+
+def max_attempts():
+    return getattr(settings, 'SUBMISSION_QUEUE_MAX_ATTEMPTS', 5)
+
+
+"""
+Returns the idempotency key of a submission request, the X-Idempotency-Key header if sent,
+otherwise a hash of the user and the request body.
+"""
+def idempotency_key(request, username):
+
+    key = request.META.get('HTTP_X_IDEMPOTENCY_KEY')
+    if key:
+        return key[:64]
+    body = request.body if isinstance(request.body, str) else json.dumps(request.body)
+    return hashlib.sha1(username.encode('utf-8') + '\n' + body).hexdigest()
+
+
+"""
+Queues a submission, returns False if a submission with this key was queued before.
+"""
+def enqueue(username, data, key):
+
+    try:
+        with transaction.atomic():
+            SubmissionTask.objects.create(key=key, username=username, data=json.dumps(data))
+        return True
+    except IntegrityError:
+        return False
+
+
+# submission_exists looks the keys up, without the index every task would scan all submissions
+INDEXES = [
+    """CREATE INDEX ON :Submission(key)"""
+]
+
+
+"""
+Creates the indexes of the queue, existing indexes are kept.
+"""
+def create_indexes():
+
+    gdb = get_graph()
+    for index in INDEXES:
+        gdb.query(index)
+
+
+def submission_exists(key):
+
+    gdb = get_graph()
+    return gdb.query("""MATCH (s:`Submission`) WHERE s.key = {key} RETURN count(s)""", params={'key': key})[0][0] > 0
+
+
+"""
+Returns the delay before the next attempt of a task which failed attempts times, doubling with every attempt
+from SUBMISSION_QUEUE_RETRY_DELAY up to SUBMISSION_QUEUE_MAX_RETRY_DELAY seconds.
+"""
+def retry_delay(attempts):
+
+    delay = getattr(settings, 'SUBMISSION_QUEUE_RETRY_DELAY', 30) * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, getattr(settings, 'SUBMISSION_QUEUE_MAX_RETRY_DELAY', 3600)))
+
+
+"""
+Processes the oldest pending task which is due: writes it with write(username, data, key), which returns an error message or None,
+unless its submission node exists already (a previous attempt failed after writing), and adds it to the user's knowledge map
+with record(username, data). The task row stays locked meanwhile, so several workers don't write the same task.
+The map is updated in the transaction which marks the task processed, so a failing attempt leaves no trace in the map
+and the retry records the submission exactly once.
+Failing tasks are retried with growing delays until they reach SUBMISSION_QUEUE_MAX_ATTEMPTS. Returns the task, None if no task is due.
+"""
+def process_next(write, record):
+
+    with transaction.atomic():
+        due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())
+        tasks = list(SubmissionTask.objects.select_for_update().filter(due, processed__isnull=True, attempts__lt=max_attempts()).order_by('id')[:1])
+        if not tasks:
+            return None
+
+        task = tasks[0]
+        try:
+            data = json.loads(task.data)
+            if not submission_exists(task.key):
+                task.error = write(task.username, data, task.key) or ''
+            with transaction.atomic():
+                record(task.username, data)
+            task.processed = timezone.now()
+            task.next_attempt_at = None
+        except Exception as e:
+            task.attempts = task.attempts + 1
+            task.error = unicode(e)
+            task.next_attempt_at = timezone.now() + retry_delay(task.attempts)
+        task.save()
+        return task
+
+
+"""
+Queues failed tasks (all or those with the given keys) again, returns their number.
+"""
+def requeue_failed(keys=None):
+
+    failed = SubmissionTask.objects.filter(processed__isnull=True, attempts__gte=max_attempts())
+    if keys:
+        failed = failed.filter(key__in=keys)
+    return failed.update(attempts=0, next_attempt_at=None, error='')
+
+
+"""
+Returns the number of pending, retrying (waiting for their next attempt) and failed tasks and the lag,
+the age of the oldest pending task in seconds.
+"""
+def queue_status():
+
+    pending = SubmissionTask.objects.filter(processed__isnull=True, attempts__lt=max_attempts())
+    oldest = list(pending.order_by('id')[:1])
+    lag = (timezone.now() - oldest[0].created).total_seconds() if oldest else 0.0
+
+    return {'pending': pending.count(),
+            'retrying': pending.filter(next_attempt_at__gt=timezone.now()).count(),
+            'failed': SubmissionTask.objects.filter(processed__isnull=True, attempts__gte=max_attempts()).count(),
+            'lag': lag}
@@ -0,0 +1,149 @@
+"""
+Array-backed dependency trees of the treebank sentences.
+
+A SentenceTree keeps the words of a sentence by position (the order of the given words) in integer arrays: the position
+of the head, the relation code and the part of speech code of every word, and the children of every word in one array
+(children of i are child[first[i]:first[i + 1]]). Relations and parts of speech are coded once per process, so
+syntactic filters like short_sentence compare integers instead of walking dicts and strings.
+"""
+from array import array
+
+import threading
+
+
+_codes = {'relation': {}, 'pos': {}}
+_lock = threading.Lock()
+
+
+"""
+Returns the integer code of a relation or part of speech value (kind is 'relation' or 'pos'), -1 for missing values.
+"""
+def code(kind, value):
+
+    if value is None:
+        return -1
+    codes = _codes[kind]
+    c = codes.get(value)
+    if c is None:
+        with _lock:
+            c = codes.setdefault(value, len(codes))
+    return c
+
+
+PRED = code('relation', 'PRED')
+PRED_CO = code('relation', 'PRED_CO')
+COORD = code('relation', 'COORD')
+AUXP = code('relation', 'AuxP')
+AUXC = code('relation', 'AuxC')
+ATR = code('relation', 'ATR')
+OBJ_CO = code('relation', 'OBJ_CO')
+ADV_CO = code('relation', 'ADV_CO')
+
+PARTICIPLE = code('pos', 'participle')
+VERB = code('pos', 'verb')
+
+
+class SentenceTree(object):
+
+    def __init__(self, tbwids, heads, relations, pos):
+
+        n = len(tbwids)
+        position = dict((tbwid, i) for i, tbwid in enumerate(tbwids))
+
+        self.tbwid = array('i', tbwids)
+        # heads outside the sentence (0 for the root) become -1
+        self.parent = array('i', [position.get(head, -1) for head in heads])
+        self.relation = array('i', [code('relation', r) for r in relations])
+        self.pos = array('i', [code('pos', p) for p in pos])
+
+        # children of all words in one array, in word order
+        first = [0] * (n + 1)
+        for p in self.parent:
+            if p >= 0:
+                first[p + 1] = first[p + 1] + 1
+        for i in range(n):
+            first[i + 1] = first[i + 1] + first[i]
+        child = [0] * first[n]
+        filled = first[:n]
+        for i, p in enumerate(self.parent):
+            if p >= 0:
+                child[filled[p]] = i
+                filled[p] = filled[p] + 1
+        self.first = array('i', first)
+        self.child = array('i', child)
+
+    def __len__(self):
+        return len(self.tbwid)
+
+    def children(self, i):
+        return self.child[self.first[i]:self.first[i + 1]]
+
+    @classmethod
+    def from_words(cls, words):
+        """
+        Builds the tree of a list of word property dicts, None if the words have no syntactic information.
+        """
+        if not words or 'head' not in words[0]:
+            return None
+        try:
+            return cls([int(w['tbwid']) for w in words], [int(w.get('head') or 0) for w in words],
+                       [w.get('relation') for w in words], [w.get('pos') for w in words])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+"""
+Returns the positions of the words of the short sentence of the first predicate (PRED or PRED_CO) which has more than
+the verb itself, ordered by tbwid; None if there is none. The short sentence consists of the predicate and its
+dependents: attributes (ATR, no verbs) of the dependents, prepositions (AuxP) with their objects and coordinated
+objects and adverbials (OBJ_CO, ADV_CO) with their coordinator. Participles and subordinating conjunctions (AuxC) are left out.
+"""
+def short_sentence(tree):
+
+    relation = tree.relation
+    pos = tree.pos
+    first = tree.first
+    child = tree.child
+
+    for verb in range(len(tree)):
+        if relation[verb] != PRED and relation[verb] != PRED_CO:
+            continue
+
+        coords, coordinated = [], []
+        aim = []
+        for c in child[first[verb]:first[verb + 1]]:
+
+            if relation[c] == COORD:
+                coords.append(c)
+                for w in child[first[c]:first[c + 1]]:
+                    if (relation[w] == OBJ_CO or relation[w] == ADV_CO) and pos[w] != PARTICIPLE and pos[w] != VERB:
+                        coordinated.append(w)
+
+            elif relation[c] == AUXP:
+                aim.append(c)
+                for w in child[first[c]:first[c + 1]]:
+                    if relation[w] != AUXC and pos[w] != PARTICIPLE:
+                        aim.append(w)
+                        for w2 in child[first[w]:first[w + 1]]:
+                            if relation[w2] == ATR and pos[w2] != VERB:
+                                aim.append(w2)
+
+            elif relation[c] != AUXC and pos[c] != PARTICIPLE:
+                aim.append(c)
+                for w in child[first[c]:first[c + 1]]:
+                    if relation[w] == ATR and pos[w] != VERB:
+                        aim.append(w)
+
+        # coordinators only with their coordinated objects and adverbials
+        for c in coords:
+            for w in coordinated:
+                if tree.parent[w] == c:
+                    aim.append(w)
+            if coordinated:
+                aim.append(c)
+
+        aim.append(verb)
+        if len(aim) > 1:
+            return sorted(aim, key=tree.tbwid.__getitem__)
+
+    return None
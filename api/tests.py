@@ -1,16 +1,785 @@
 """
-This file demonstrates writing tests using the unittest module. These will pass
-when you run "manage.py test".
+Tests of the graph independent parts of the api. They run with "manage.py test api" and don't need a neo4j server.
+"""
+from phaidra.settings import API_PATH
+
+from django.core.cache import caches
+from django.http import HttpRequest
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from common.utils.neo4j_import.batch import BatchImporter, DryRunBackend, SENTENCES_STATEMENT
+from common.utils.neo4j_import.position_index import index_positions
+from common.utils.neo4j_import.readers import read_alignment, read_treebank
+from common.utils.graph import GraphConnection
+from common.utils.serializers import FieldProjection
+
+from tastypie.exceptions import BadRequest
+
+from app.models import SubmissionTask
+
+import requests
+
+from StringIO import StringIO
+import json
+import random
+import time
+
+# imported from the phaidra api
+from utils import CtsUrn, DataObject, cts_sort_key, sort_by_cts
+from cypher import WORD_INTEGER_ATTRIBUTES, compile_predicate, where_clause
+from lemma import LemmaResource
+from word import WordResource
+import knowledge
+import sentence
+import submission_queue
+from syntax import SentenceTree, short_sentence
+from word_index import WordIndex
+from versioned_cache import CORPUS_VERSION_KEY, VersionedCache, _version_cache, bump_corpus_version, corpus_version
+
+
+WORK = 'urn:cts:greekLit:tlg0003.tlg001.perseus-grc'
+
+
+class CtsUrnTest(SimpleTestCase):
+
+    def test_parse(self):
+        """
+        Tests that the parts of a word range URN are parsed and parsed URNs are shared.
+        """
+        urn = CtsUrn.parse(WORK + ':1.90.4:11-13')
+        self.assertEqual(urn.work, 'tlg0003.tlg001.perseus-grc')
+        self.assertEqual(urn.passage, ('1', '90', '4'))
+        self.assertEqual(urn.word, None)
+        self.assertEqual(urn.word_range, (11, 13))
+        self.assertEqual(urn.lang, 'grc')
+        self.assertEqual(urn.sentence.urn, WORK + ':1.90.4')
+        self.assertEqual([u.urn for u in urn.expand()], [WORK + ':1.90.4:11', WORK + ':1.90.4:12', WORK + ':1.90.4:13'])
+        self.assertTrue(CtsUrn.parse(WORK + ':1.90.4:11-13') is urn)
+
+    def test_immutable(self):
+        """
+        Tests that parsed URNs can't be changed.
+        """
+        urn = CtsUrn.parse(WORK + ':1.89.1:4')
+        self.assertEqual(urn.word, 4)
+        self.assertRaises(AttributeError, setattr, urn, 'word', 5)
+
+    def test_sort_mixed_depths(self):
+        """
+        Tests that sentences and words are ordered numerically level by level, a sentence before its words.
+        """
+        ordered = [WORK + ':1.9.1', WORK + ':1.89.1', WORK + ':1.89.1:2', WORK + ':1.89.1:10', WORK + ':1.89.2', WORK + ':1.89.2:1', WORK + ':2.1.1']
+        shuffled = [ordered[i] for i in (4, 2, 6, 0, 3, 5, 1)]
+        self.assertEqual(sorted(shuffled, key=cts_sort_key), ordered)
+        self.assertTrue(CtsUrn.parse(ordered[1]) < CtsUrn.parse(ordered[3]) < CtsUrn.parse(ordered[4]))
+
+    def test_sort_non_numeric(self):
+        """
+        Tests that non-numeric references are ordered after the numeric ones of the same level.
+        """
+        self.assertEqual(sorted([WORK + ':1.89.1a', WORK + ':1.89.2', WORK + ':1.89.1'], key=cts_sort_key),
+                         [WORK + ':1.89.1', WORK + ':1.89.2', WORK + ':1.89.1a'])
+
+    def test_sort_by_cts(self):
+        """
+        Tests that dicts and DataObjects are sorted by their CTS.
+        """
+        objects = [{'CTS': WORK + ':1.89.1:10'}, DataObject(1, {'CTS': WORK + ':1.89.1:9'}), {'CTS': WORK + ':1.89.1'}]
+        self.assertEqual([obj['CTS'] if isinstance(obj, dict) else obj.CTS for obj in sort_by_cts(objects)],
+                         [WORK + ':1.89.1', WORK + ':1.89.1:9', WORK + ':1.89.1:10'])
+
+
+class FailingGraph(object):
+    """
+    Stand-in for neo4jrestclient and the session of the transactional endpoint, every call fails with a connection error.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def fail(self, *args, **kwargs):
+        self.calls = self.calls + 1
+        raise requests.exceptions.ConnectionError('connection reset')
+
+    query = post = fail
+
+
+class StandInConnection(GraphConnection):
+
+    @property
+    def gdb(self):
+        return self.stand_in
+
+
+class GraphConnectionTest(SimpleTestCase):
+
+    def setUp(self):
+        self.graph = FailingGraph()
+        self.connection = StandInConnection('http://localhost:7474/db/data/', retries=1)
+        self.connection.stand_in = self.graph
+        self.connection.session = self.graph
+
+    def test_read_retried(self):
+        """
+        Tests that a read query is sent again after a connection error.
+        """
+        self.assertRaises(requests.exceptions.ConnectionError, self.connection.query, """MATCH (w:`Word`) RETURN count(w)""")
+        self.assertEqual(self.graph.calls, 2)
+
+    def test_write_not_retried(self):
+        """
+        Tests that writes are sent once, they may have been committed before the connection broke.
+        """
+        self.assertRaises(requests.exceptions.ConnectionError, self.connection.query, """MATCH (u:`User`) CREATE (u)-[:submits]->(s:`Submission`)""")
+        self.assertRaises(requests.exceptions.ConnectionError, self.connection.commit, [("""MATCH (w) SET w.x = 1""", {})])
+        self.assertEqual(self.graph.calls, 2)
+
+
+class BatchImporterTest(SimpleTestCase):
+
+    def words(self, n):
+        return [{'tbwid': i, 'value': 'w%d' % i} for i in range(1, n + 1)]
+
+    def test_batches(self):
+        """
+        Tests that sentences are committed every batch_size sentences and the rest on close.
+        """
+        out = StringIO()
+        backend = DryRunBackend(out)
+        importer = BatchImporter(backend, WORK, batch_size=2, log=StringIO())
+        for i in range(1, 6):
+            importer.add_sentence('%s:1.1.%d' % (WORK, i), self.words(i))
+        self.assertEqual(backend.transactions, 2)
+        importer.close()
+
+        self.assertEqual(backend.transactions, 3)
+        self.assertEqual(backend.statements, 3)
+        self.assertEqual(importer.sentence_count, 5)
+        self.assertEqual(importer.word_count, 15)
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line['statement'] for line in lines], [SENTENCES_STATEMENT] * 3)
+        self.assertEqual([len(line['parameters']['sentences']) for line in lines], [2, 2, 1])
+        first = lines[0]['parameters']['sentences'][0]
+        self.assertEqual(first['sentence'], 'w1')
+        self.assertEqual(first['length'], 1)
+        self.assertEqual(lines[1]['parameters']['sentences'][1]['sentence'], 'w1 w2 w3 w4')
+
+    def test_close_without_sentences(self):
+        """
+        Tests that nothing is committed for an empty batch.
+        """
+        backend = DryRunBackend()
+        BatchImporter(backend, WORK, log=StringIO()).close()
+        self.assertEqual(backend.transactions, 0)
 
-Replace this with more appropriate tests for your application.
+
+TREEBANK = """<?xml version="1.0" ?>
+<treebank version="1.5" xml:lang="grc">
+<sentence document_id="Perseus:text:1999.01.0199" id="3" subdoc="book=1:chapter=89">
+    <word cid="1" form="a" head="2" id="1" lemma="a1" postag="l-p---mn-" relation="ATR"/>
+    <word cid="2" form="b" head="0" id="2" lemma="b1" postag="v3paia---" relation="PRED"/>
+</sentence>
+<sentence document_id="Perseus:text:1999.01.0199" id="4" subdoc="book=1:chapter=90">
+    <word cid="3" form="c" head="0" id="1" lemma="c1" postag="v3paia---" relation="PRED"/>
+</sentence>
+</treebank>
+"""
+
+ALIGNMENT = """<aligned-text xmlns="http://alpheios.net/namespaces/aligned-text">
+  <language lnum="L1" xml:lang="grc"/>
+  <language lnum="L2" xml:lang="eng"/>
+  <sentence id="1.89.1" document_id="tlg003.tlg001.perseus-eng.xml">
+    <wds lnum="L1">
+      <w n="1.89.1:1"><text>a</text><refs nrefs="1.89.1:2 "/></w>
+      <w n="1.89.1:2"><text>b</text></w>
+    </wds>
+    <wds lnum="L2">
+      <w n="1.89.1:1"><text>x</text><refs nrefs="1.89.1:1 1.89.1:2 "/></w>
+    </wds>
+  </sentence>
+</aligned-text>
 """
 
-from django.test import TestCase
 
+class ReadersTest(SimpleTestCase):
+
+    def test_read_treebank(self):
+        """
+        Tests that every sentence is read with its subdoc parts and words.
+        """
+        sentences = list(read_treebank(StringIO(TREEBANK)))
+        self.assertEqual([s['id'] for s in sentences], ['3', '4'])
+        self.assertEqual((sentences[0]['book'], sentences[0]['chapter']), (1, 89))
+        self.assertEqual(sentences[1]['chapter'], 90)
+        self.assertEqual([w['form'] for w in sentences[0]['words']], ['a', 'b'])
+        self.assertEqual(sentences[0]['words'][0], {'cid': '1', 'form': 'a', 'head': '2', 'id': '1', 'lemma': 'a1',
+                                                    'postag': 'l-p---mn-', 'relation': 'ATR'})
+
+    def test_read_alignment(self):
+        """
+        Tests that the words of a sentence are read per language with their references.
+        """
+        sentences = list(read_alignment(StringIO(ALIGNMENT)))
+        self.assertEqual(len(sentences), 1)
+        self.assertEqual(sentences[0]['id'], '1.89.1')
+        languages = sentences[0]['languages']
+        self.assertEqual(sorted(languages), ['eng', 'grc'])
+        self.assertEqual(languages['grc'], [{'n': '1.89.1:1', 'text': 'a', 'refs': ['1.89.1:2']},
+                                            {'n': '1.89.1:2', 'text': 'b', 'refs': []}])
+        self.assertEqual(languages['eng'][0]['refs'], ['1.89.1:1', '1.89.1:2'])
+
+
+class WhereClauseTest(SimpleTestCase):
+
+    def test_operators(self):
+        """
+        Tests the condition and parameter of every operator.
+        """
+        cases = [
+            ('pos', 'noun', 'HAS (w.pos) AND w.pos = {w_pos_eq_0}', 'noun'),
+            ('lemma__contains', 'og', 'HAS (w.lemma) AND w.lemma =~ {w_lemma_contains_0}', '.*og.*'),
+            ('lemma__startswith', 'lo', 'HAS (w.lemma) AND w.lemma =~ {w_lemma_startswith_0}', 'lo.*'),
+            ('lemma__endswith', 'os', 'HAS (w.lemma) AND w.lemma =~ {w_lemma_endswith_0}', '.*os'),
+            ('tbwid__gt', '3', 'HAS (w.tbwid) AND w.tbwid > {w_tbwid_gt_0}', 3),
+            ('length__lt', '2.5', 'HAS (w.length) AND w.length < {w_length_lt_0}', 2.5),
+            ('case__isnot', 'nom', 'HAS (w.case) AND w.case <> {w_case_isnot_0}', 'nom'),
+            ('head', '2', 'HAS (w.head) AND w.head = {w_head_eq_0}', 2)
+        ]
+        for key, value, condition, param in cases:
+            where, params = where_clause('w', {key: value}, WORD_INTEGER_ATTRIBUTES)
+            self.assertEqual(where, condition)
+            self.assertEqual(params.values(), [param])
+
+    def test_multiple_filters(self):
+        """
+        Tests that multiple values are ORed, filters are ANDed in a stable order and unknown operators ignored.
+        """
+        where, params = where_clause('w', {'pos': 'noun__verb', 'case': 'nom', 'lemma__like': 'x'}, prefix='p')
+        self.assertEqual(where, 'HAS (w.case) AND w.case = {p_case_eq_0} AND (w.pos = {p_pos_eq_0} OR w.pos = {p_pos_eq_1})')
+        self.assertEqual(params, {'p_case_eq_0': 'nom', 'p_pos_eq_0': 'noun', 'p_pos_eq_1': 'verb'})
+        self.assertEqual(where_clause('w', {}), ('', {}))
+
+    def test_invalid_number(self):
+        """
+        Tests that a comparison with a non-numeric value is a bad request.
+        """
+        self.assertRaises(BadRequest, where_clause, 'w', {'tbwid__gt': 'x'})
+
+
+class CompilePredicateTest(SimpleTestCase):
+
+    WORDS = [
+        {'lemma': 'logos', 'pos': 'noun', 'case': 'nom', 'tbwid': 1},
+        {'lemma': 'legw', 'pos': 'verb', 'tbwid': 2},
+        {'lemma': 'logikos', 'pos': 'adj', 'case': 'gen', 'tbwid': 3},
+        {'lemma': 'o', 'pos': 'article', 'case': 'nom', 'tbwid': 4}
+    ]
+
+    def matching(self, query_params):
+        predicate = compile_predicate(query_params, WORD_INTEGER_ATTRIBUTES)
+        return [w['tbwid'] for w in self.WORDS if predicate(w)]
+
+    def test_operators(self):
+        """
+        Tests that every operator matches the same words as its Cypher condition.
+        """
+        self.assertEqual(self.matching({'pos': 'noun'}), [1])
+        self.assertEqual(self.matching({'lemma__contains': 'og'}), [1, 3])
+        self.assertEqual(self.matching({'lemma__startswith': 'le'}), [2])
+        self.assertEqual(self.matching({'lemma__endswith': 'os'}), [1, 3])
+        self.assertEqual(self.matching({'tbwid__gt': '2'}), [3, 4])
+        self.assertEqual(self.matching({'tbwid__lt': '2'}), [1])
+        self.assertEqual(self.matching({'tbwid': '2'}), [2])
+        # like HAS (w.case), words without the attribute don't match
+        self.assertEqual(self.matching({'case__isnot': 'nom'}), [3])
+
+    def test_multiple_filters(self):
+        """
+        Tests that multiple values are ORed and filters ANDed.
+        """
+        self.assertEqual(self.matching({'pos': 'noun__article'}), [1, 4])
+        self.assertEqual(self.matching({'pos': 'noun__adj', 'case': 'gen'}), [3])
+        self.assertEqual(self.matching({}), [1, 2, 3, 4])
+
+
+class SubmissionQueueTest(TestCase):
+    """
+    The graph is replaced by the submissions of self.written, write and record count their calls.
+    """
+    def setUp(self):
+        self.written = set()
+        self.writes = []
+        self.records = []
+        self.failures = {'write': 0, 'record': 0}
+        self.submission_exists = submission_queue.submission_exists
+        submission_queue.submission_exists = lambda key: key in self.written
+
+    def tearDown(self):
+        submission_queue.submission_exists = self.submission_exists
+
+    def write(self, username, data, key):
+        if self.failures['write'] > 0:
+            self.failures['write'] = self.failures['write'] - 1
+            raise IOError('neo4j is down')
+        self.writes.append(key)
+        self.written.add(key)
+
+    def record(self, username, data):
+        if self.failures['record'] > 0:
+            self.failures['record'] = self.failures['record'] - 1
+            raise IOError('neo4j is down')
+        self.records.append((username, data['ref']))
+
+    def process(self):
+        return submission_queue.process_next(self.write, self.record)
+
+    def make_due(self):
+        SubmissionTask.objects.update(next_attempt_at=timezone.now())
+
+    def test_enqueue_once(self):
+        """
+        Tests that a submission is queued once per key.
+        """
+        self.assertTrue(submission_queue.enqueue('user', {'ref': 'r1'}, 'k1'))
+        self.assertFalse(submission_queue.enqueue('user', {'ref': 'r1'}, 'k1'))
+        self.assertEqual(SubmissionTask.objects.count(), 1)
+
+    def test_process(self):
+        """
+        Tests that tasks are written and recorded once, in order.
+        """
+        submission_queue.enqueue('user', {'ref': 'r1'}, 'k1')
+        submission_queue.enqueue('user', {'ref': 'r2'}, 'k2')
+        self.assertEqual(self.process().key, 'k1')
+        self.assertEqual(self.process().key, 'k2')
+        self.assertEqual(self.process(), None)
+        self.assertEqual(self.writes, ['k1', 'k2'])
+        self.assertEqual(self.records, [('user', 'r1'), ('user', 'r2')])
+        self.assertEqual(SubmissionTask.objects.filter(processed__isnull=True).count(), 0)
+
+    def test_retry_with_backoff(self):
+        """
+        Tests that a failed task waits for its next attempt, with a growing delay.
+        """
+        submission_queue.enqueue('user', {'ref': 'r1'}, 'k1')
+        self.failures['write'] = 2
+
+        task = self.process()
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.processed, None)
+        self.assertTrue(task.next_attempt_at > timezone.now())
+        self.assertEqual(self.process(), None)
+        self.assertEqual(submission_queue.queue_status()['retrying'], 1)
+
+        self.make_due()
+        task = self.process()
+        self.assertEqual(task.attempts, 2)
+        self.assertTrue(submission_queue.retry_delay(2) > submission_queue.retry_delay(1))
+
+        self.make_due()
+        task = self.process()
+        self.assertNotEqual(task.processed, None)
+        self.assertEqual(task.next_attempt_at, None)
+        self.assertEqual(self.writes, ['k1'])
+        self.assertEqual(self.records, [('user', 'r1')])
+
+    def test_retry_after_write(self):
+        """
+        Tests that a task failing after its submission was written isn't written again, but recorded once on retry.
+        """
+        submission_queue.enqueue('user', {'ref': 'r1'}, 'k1')
+        self.failures['record'] = 1
+
+        task = self.process()
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(self.records, [])
+
+        self.make_due()
+        task = self.process()
+        self.assertNotEqual(task.processed, None)
+        self.assertEqual(self.writes, ['k1'])
+        self.assertEqual(self.records, [('user', 'r1')])
+
+    @override_settings(SUBMISSION_QUEUE_MAX_ATTEMPTS=1)
+    def test_requeue_failed(self):
+        """
+        Tests that failed tasks are given up and processed again after requeue_failed.
+        """
+        submission_queue.enqueue('user', {'ref': 'r1'}, 'k1')
+        self.failures['write'] = 1
+        self.process()
+        self.make_due()
+        self.assertEqual(self.process(), None)
+        self.assertEqual(submission_queue.queue_status()['failed'], 1)
+
+        self.assertEqual(submission_queue.requeue_failed(['k2']), 0)
+        self.assertEqual(submission_queue.requeue_failed(), 1)
+        task = self.process()
+        self.assertNotEqual(task.processed, None)
+        self.assertEqual(task.error, '')
+        self.assertEqual(self.records, [('user', 'r1')])
+
+
+class VersionedCacheTest(SimpleTestCase):
+
+    def test_key(self):
+        """
+        Tests that keys depend on the object, the representation and the parameters, not on their order.
+        """
+        cache = VersionedCache('test')
+        self.assertEqual(cache.key(1, 'full', {'a': '1', 'b': '2'}), cache.key(1, 'full', {'b': '2', 'a': '1'}))
+        self.assertNotEqual(cache.key(1, 'full'), cache.key(1, 'short'))
+        self.assertNotEqual(cache.key(1, 'full'), cache.key(2, 'full'))
+        self.assertNotEqual(cache.key(1, 'full'), cache.key(1, 'full', {'a': '1'}))
+        self.assertEqual(cache.key(1, 'full')[-1], corpus_version())
+
+    def test_shared_entries(self):
+        """
+        Tests that entries are shared with other processes through the Django cache.
+        """
+        cache = VersionedCache('test')
+        key = cache.key(time.time(), 'full')
+        self.assertEqual(cache.get(key), None)
+        cache.set(key, {'CTS': WORK})
+        self.assertEqual(cache.get(key), {'CTS': WORK})
+
+        other = VersionedCache('test')
+        self.assertEqual(other.get(key), {'CTS': WORK})
+        self.assertEqual((cache.hits, cache.misses, other.shared_hits), (1, 1, 1))
+
+    def test_bump_invalidates(self):
+        """
+        Tests that bumping the corpus version makes the cached entries unreachable.
+        """
+        cache = VersionedCache('test')
+        id = time.time()
+        cache.set(cache.key(id, 'full'), {'CTS': WORK})
+        version = corpus_version()
+
+        self.assertTrue(bump_corpus_version() > version)
+        self.assertEqual(cache.key(id, 'full')[-1], corpus_version())
+        self.assertEqual(cache.get(cache.key(id, 'full')), None)
+
+    def test_lost_version(self):
+        """
+        Tests that a lost corpus version is replaced by a newer one, so old entries stay unreachable.
+        """
+        version = bump_corpus_version()
+        time.sleep(0.01)
+        _version_cache().delete(CORPUS_VERSION_KEY)
+        self.assertTrue(corpus_version() > version)
+
+    @override_settings(API_CACHE_POLICIES={'timed': {'timeout': 5}})
+    def test_timeout(self):
+        """
+        Tests that entries get the policy timeout, without one the timeout of the default cache instead of none.
+        """
+        self.assertEqual(VersionedCache('timed').timeout, 5)
+        self.assertEqual(VersionedCache('test').timeout, caches['default'].default_timeout)
+        self.assertNotEqual(VersionedCache('test').timeout, None)
+
+    def test_maxsize(self):
+        """
+        Tests that a process keeps at most maxsize entries in memory.
+        """
+        cache = VersionedCache('test', maxsize=2)
+        for id in range(3):
+            cache.set(cache.key(id, 'full'), id)
+        self.assertEqual(cache.stats()['size'], 2)
+
+
+class WordIndexTest(SimpleTestCase):
+
+    VALUES = ['logos', 'logikos', 'legw', 'o', 'os', 'anthropos', 'polemos', 'lo', 'ologos', 'polis']
+
+    def setUp(self):
+        self.index = WordIndex()
+        self.words = {}
+        for id, value in enumerate(self.VALUES * 2):
+            properties = {'value': value, 'lemma': value[::-1]}
+            self.words[id] = properties
+            self.index.add(id, properties)
+        self.index.freeze()
+
+    def brute_force(self, attribute, operator, needles):
+        tests = {'contains': lambda value, needle: needle in value,
+                 'startswith': lambda value, needle: value.startswith(needle),
+                 'endswith': lambda value, needle: value.endswith(needle)}
+        return sorted(id for id, properties in self.words.items()
+                      if any(tests[operator](properties[attribute], needle) for needle in needles))
+
+    def test_lookup(self):
+        """
+        Tests that the index finds the same words as comparing every value, for short and long needles.
+        """
+        needles = ['o', 'lo', 'os', 'log', 'logos', 'pol', 'x', 'ologos', 'olog', 'emo']
+        for attribute in ('value', 'lemma'):
+            for operator in ('contains', 'startswith', 'endswith'):
+                for needle in needles:
+                    self.assertEqual(self.index.lookup(attribute, operator, [needle], max_ids=100),
+                                     self.brute_force(attribute, operator, [needle]), (attribute, operator, needle))
+                self.assertEqual(self.index.lookup(attribute, operator, ['lo', 'pol'], max_ids=100),
+                                 self.brute_force(attribute, operator, ['lo', 'pol']))
+
+    def test_unresolved(self):
+        """
+        Tests that empty needles and too many matching words aren't resolved by the index.
+        """
+        self.assertEqual(self.index.lookup('value', 'endswith', [''], max_ids=100), None)
+        self.assertEqual(self.index.lookup('value', 'contains', ['os', ''], max_ids=100), None)
+        self.assertEqual(self.index.lookup('value', 'contains', ['o'], max_ids=5), None)
+        self.assertEqual(len(self.index.lookup('value', 'endswith', ['os'], max_ids=12)), 12)
+
+    def test_where_clause(self):
+        """
+        Tests that the filters the index resolves become ID conditions, the others stay regular expressions.
+        """
+        where, params = where_clause('w', {'value__startswith': 'log', 'pos': 'noun'}, index=self.index)
+        self.assertEqual(where, 'HAS (w.pos) AND w.pos = {w_pos_eq_0} AND ID(w) IN {w_value_startswith_ids}')
+        self.assertEqual(params['w_value_startswith_ids'], self.brute_force('value', 'startswith', ['log']))
+
+        where, params = where_clause('w', {'lemma__endswith': ''}, index=self.index)
+        self.assertEqual(where, 'HAS (w.lemma) AND w.lemma =~ {w_lemma_endswith_0}')
+        self.assertEqual(params, {'w_lemma_endswith_0': '.*'})
+
+        where, params = where_clause('w', {'case__contains': 'o'}, index=self.index)
+        self.assertEqual(where, 'HAS (w.case) AND w.case =~ {w_case_contains_0}')
+
+
+def word(tbwid, head, relation, pos):
+    return {'tbwid': tbwid, 'head': head, 'relation': relation, 'pos': pos, 'value': 'w%d' % tbwid, 'CTS': '%s:1.1.1:%d' % (WORK, tbwid)}
+
+
+"""
+The tree walk of the former SentenceResource.shorten (without filters), returns the tbwids of the short sentence.
+"""
+def reference_shorten(words):
+
+    byId = dict((w['tbwid'], w) for w in words)
+    children = dict((w['tbwid'], []) for w in words)
+    verbs = []
+    for w in words:
+        if w['head'] != 0:
+            children[w['head']].append(w)
+        if w['relation'] == 'PRED' or w['relation'] == 'PRED_CO':
+            verbs.append(w)
+
+    for verb in verbs:
+        u, i = [], []
+        aim = []
+        for c in children[verb['tbwid']]:
+            if c['relation'] == 'COORD':
+                u.append(c['tbwid'])
+                for w in children[c['tbwid']]:
+                    if w['relation'] in ('OBJ_CO', 'ADV_CO') and w['pos'] != 'participle' and w['pos'] != 'verb':
+                        i.append(w['tbwid'])
+            elif c['relation'] == 'AuxP':
+                aim.append(c)
+                for w in children[c['tbwid']]:
+                    if w['relation'] != 'AuxC' and w['pos'] != 'participle':
+                        aim.append(w)
+                        for w2 in children[w['tbwid']]:
+                            if w2['relation'] == 'ATR' and w2['pos'] != 'verb':
+                                aim.append(w2)
+            elif c['relation'] != 'AuxC' and c['pos'] != 'participle':
+                aim.append(c)
+                for w in children[c['tbwid']]:
+                    if w['relation'] == 'ATR' and w['pos'] != 'verb':
+                        aim.append(w)
+        for id in u:
+            for id2 in i:
+                if byId[id2]['head'] == id:
+                    aim.append(byId[id2])
+            if i:
+                aim.append(byId[id])
+        aim.append(verb)
+        if len(aim) > 1:
+            return sorted(w['tbwid'] for w in aim)
+    return None
+
+
+class ShortSentenceTest(SimpleTestCase):
+
+    def shorten(self, words):
+        tree = SentenceTree.from_words(words)
+        if tree is None:
+            return None
+        positions = short_sentence(tree)
+        return None if positions is None else [words[i]['tbwid'] for i in positions]
+
+    def test_sentence(self):
+        """
+        Tests the short sentence of a predicate with attributes, a preposition and a participle.
+        """
+        words = [word(1, 3, 'ATR', 'article'), word(2, 6, 'AuxY', 'particle'), word(3, 6, 'SBJ', 'adj'),
+                 word(4, 6, 'ADV', 'noun'), word(5, 4, 'ATR', 'pronoun'), word(6, 0, 'PRED', 'verb'),
+                 word(7, 6, 'AuxP', 'preposition'), word(8, 9, 'ATR', 'article'), word(9, 7, 'OBJ', 'noun'),
+                 word(10, 6, 'ADV', 'participle'), word(11, 10, 'OBJ', 'noun')]
+        self.assertEqual(self.shorten(words), [1, 2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(self.shorten(words), reference_shorten(words))
+
+    def test_coordination(self):
+        """
+        Tests that coordinators are kept if the predicate has coordinated objects or adverbials, participles and verbs left out.
+        """
+        words = [word(1, 0, 'PRED', 'verb'), word(2, 1, 'COORD', 'conjunction'), word(3, 2, 'OBJ_CO', 'noun'),
+                 word(4, 2, 'OBJ_CO', 'participle'), word(5, 1, 'COORD', 'conjunction'), word(6, 5, 'ADV_CO', 'verb')]
+        self.assertEqual(self.shorten(words), [1, 2, 3, 5])
+        self.assertEqual(self.shorten(words), reference_shorten(words))
+
+        words = [word(1, 0, 'PRED', 'verb'), word(2, 1, 'OBJ', 'noun'), word(3, 1, 'COORD', 'conjunction'), word(4, 3, 'OBJ_CO', 'verb')]
+        self.assertEqual(self.shorten(words), [1, 2])
+        self.assertEqual(self.shorten(words), reference_shorten(words))
+
+    def test_no_short_sentence(self):
+        """
+        Tests sentences without predicate, with a lonely predicate and without syntactic information.
+        """
+        self.assertEqual(self.shorten([word(1, 0, 'SBJ', 'noun'), word(2, 1, 'ATR', 'adj')]), None)
+        self.assertEqual(self.shorten([word(1, 0, 'PRED', 'verb'), word(2, 1, 'ADV', 'participle')]), None)
+        self.assertEqual(self.shorten([{'tbwid': 1, 'value': 'w1'}]), None)
+        self.assertEqual(self.shorten([]), None)
+
+    def test_random_trees(self):
+        """
+        Tests that random trees are shortened like before.
+        """
+        relations = ['PRED', 'PRED_CO', 'COORD', 'AuxP', 'AuxC', 'ATR', 'OBJ_CO', 'ADV_CO', 'SBJ', 'OBJ', 'ADV']
+        pos = ['verb', 'participle', 'noun', 'adj', 'article', 'preposition']
+        rand = random.Random(89)
+        for n in range(500):
+            size = rand.randint(1, 15)
+            words = [word(tbwid, rand.choice([h for h in range(size + 1) if h != tbwid]), rand.choice(relations), rand.choice(pos))
+                     for tbwid in range(1, size + 1)]
+            self.assertEqual(self.shorten(words), reference_shorten(words), words)
+
+
+class FakeGraph(object):
+
+    def __init__(self, table):
+        self.table = table
+        self.queries = 0
+
+    def query(self, q, params=None):
+        self.queries = self.queries + 1
+        self.last = (q, params)
+        return self.table
+
+
+class PositionIndexTest(SimpleTestCase):
+
+    def test_positions(self):
+        """
+        Tests that the words of a document are numbered in CTS order.
+        """
+        graph = FakeGraph([[7, WORK + ':1.10.1:2'], [8, WORK + ':1.9.1:10'], [9, WORK + ':1.10.1:1'], [10, WORK + ':1.9.1:9']])
+        self.assertEqual(index_positions(graph, WORK), 4)
+        self.assertEqual(graph.queries, 2)
+        self.assertEqual(graph.last[1]['words'], [{'id': 10, 'position': 1}, {'id': 8, 'position': 2},
+                                                  {'id': 9, 'position': 3}, {'id': 7, 'position': 4}])
+
+
+class ShortSentenceCandidatesTest(SimpleTestCase):
+
+    def setUp(self):
+        def node(w):
+            return {'data': dict(w, lemma='lemma%d' % w['tbwid'])}
+        self.graph = FakeGraph([
+            [11, WORK + ':1.89.10', [node(word(2, 1, 'OBJ', 'noun')), node(word(1, 0, 'PRED', 'verb'))]],
+            [12, WORK + ':1.89.1', [node(word(1, 0, 'PRED', 'verb')), node(word(2, 1, 'ADV', 'participle')), node(word(3, 2, 'OBJ', 'noun'))]],
+            [13, WORK + ':1.89.2', [node(word(1, 0, 'PRED', 'verb')), node(word(2, 1, 'SBJ', 'noun')), node(word(3, 1, 'OBJ', 'noun'))]],
+            [14, WORK + ':1.89.3', [{'data': {'tbwid': 1, 'value': 'w1', 'CTS': WORK + ':1.89.3:1'}}]]
+        ])
+        self.get_graph = sentence.get_graph
+        sentence.get_graph = lambda: self.graph
+        # cached searches of earlier runs are unreachable
+        bump_corpus_version()
+
+    def tearDown(self):
+        sentence.get_graph = self.get_graph
+
+    def test_candidates(self):
+        """
+        Tests that the sentences with a short sentence are found in CTS order, with one query per document and filters.
+        """
+        candidates = sentence.short_sentence_candidates(WORK, {})
+        self.assertEqual([c['id'] for c in candidates], [13, 11])
+        self.assertEqual(candidates[0], {'id': 13, 'CTS': WORK + ':1.89.2', 'resource_uri': API_PATH + 'sentence/13/'})
+        self.assertEqual(sentence.short_sentence_candidates(WORK, {}), candidates)
+        self.assertEqual(self.graph.queries, 1)
+
+    def test_filtered_candidates(self):
+        """
+        Tests that the short sentence has to contain a word matching the filters.
+        """
+        self.assertEqual([c['id'] for c in sentence.short_sentence_candidates(WORK, {'lemma': 'lemma3'})], [13])
+        self.assertEqual([c['id'] for c in sentence.short_sentence_candidates(WORK, {'pos': 'noun', 'tbwid__lt': '3'})], [13, 11])
+
+    def test_words_out_of_order(self):
+        """
+        Tests that the short sentence is the one of the first predicate in CTS order, whatever order the words are read in.
+        """
+        words = [{'data': dict(word(1, 0, 'PRED', 'verb'), lemma='y')}, {'data': dict(word(2, 1, 'OBJ', 'noun'), lemma='y')},
+                 {'data': dict(word(3, 0, 'PRED_CO', 'verb'), lemma='y')}, {'data': dict(word(4, 3, 'OBJ', 'noun'), lemma='x')}]
+        self.graph.table = [[15, WORK + ':1.90.1', list(reversed(words))]]
+        self.assertEqual(sentence.short_sentence_candidates(WORK, {'lemma': 'x'}), [])
+        self.assertEqual([c['id'] for c in sentence.short_sentence_candidates(WORK, {'lemma': 'y'})], [15])
+
+
+class MorphKnownCountTest(SimpleTestCase):
+
+    def setUp(self):
+        self.graph = FakeGraph([[42]])
+        self.get_graph = knowledge.get_graph
+        knowledge.get_graph = lambda: self.graph
+
+    def tearDown(self):
+        knowledge.get_graph = self.get_graph
+
+    def test_count(self):
+        """
+        Tests that the words of all practiced refs are counted with one query, refs without filters are left out.
+        """
+        refs = {'ref1': {'pos': 'noun'}, 'ref2': {'pos': 'verb', 'tense': 'aorist'}, 'ref3': {}}
+        self.assertEqual(knowledge.morph_known_count({'refs': refs}), 42)
+        self.assertEqual(self.graph.queries, 1)
+        q, params = self.graph.last
+        self.assertTrue('(HAS (w.pos) AND w.pos = {r0_pos_eq_0}) OR (HAS (w.pos) AND w.pos = {r1_pos_eq_0} AND HAS (w.tense)' in q)
+        self.assertEqual(params, {'r0_pos_eq_0': 'noun', 'r1_pos_eq_0': 'verb', 'r1_tense_eq_0': 'aorist'})
+
+    def test_no_refs(self):
+        """
+        Tests that nothing is queried for a user without practiced grammar.
+        """
+        self.assertEqual(knowledge.morph_known_count({'refs': {}}), 0)
+        self.assertEqual(self.graph.queries, 0)
+
+
+class FieldProjectionTest(SimpleTestCase):
+
+    def assertProjected(self, resource, data):
+        bundle = resource.full_dehydrate(resource.build_bundle(obj=DataObject(data['id'], dict(data)), request=HttpRequest()), for_list=True)
+        dehydrated = dict(bundle.data)
+        dehydrated.pop('resource_uri')
+
+        projected = FieldProjection(resource, API_PATH).project(dict(data))
+        self.assertEqual(projected.pop('resource_uri'), '%s%s/%s/' % (API_PATH, resource._meta.resource_name, data['id']))
+        self.assertEqual(projected, dehydrated)
+        self.assertEqual(dict((k, type(v)) for k, v in projected.items()), dict((k, type(v)) for k, v in dehydrated.items()))
+
+    def test_word(self):
+        """
+        Tests that the projection of a word equals its dehydrated bundle, with missing attributes and values to convert.
+        """
+        self.assertProjected(WordResource(), {'id': '7', 'CTS': WORK + ':1.89.1:3', 'value': u'\u1f08\u03b8\u03b7\u03bd\u03b1\u1fd6\u03bf\u03b9',
+                                              'lemma': 'Athenaios', 'tbwid': 3, 'head': '6', 'length': 8, 'pos': 'adj',
+                                              'translations': ('the', 'Athenians')})
 
-class SimpleTest(TestCase):
-    def test_basic_addition(self):
+    def test_lemma(self):
         """
-        Tests that 1 + 1 always equals 2.
+        Tests that the projection of a lemma equals its dehydrated bundle.
         """
-        self.assertEqual(1 + 1, 2)
+        self.assertProjected(LemmaResource(), {'id': '12', 'CITE': 'urn:cite:perseus:grclexent.lex1', 'value': 'logos',
+                                               'frequency': 10, 'values': [{'value': 'logoi'}]})
@@ -1,258 +1,223 @@
 
+from collections import OrderedDict
+import threading
+
+
 """
 Simple object for creating the instances.
+The properties live in one dict, which is taken over as it is (e.g. the data of a node from a query) and returned
+by to_dict() without copying. Instances have no __dict__ of their own.
 """        
 class DataObject(object):
     
-    def __init__(self, id=None):
+    __slots__ = ('_data',)
+    
+    def __init__(self, id=None, data=None):
         
-        self.__dict__['_data'] = {}
+        object.__setattr__(self, '_data', data if data is not None else {})
         
         if not hasattr(id, 'id') and id is not None:
             
-            self.__dict__['_data']['id'] = id
+            self._data['id'] = id
        
     def __getattr__(self, name):
-        if name.startswith('__'):
-            raise AttributeError
+        if name.startswith('__') or name == '_data':
+            raise AttributeError(name)
         return self._data.get(name, None)
 
     def __setattr__(self, name, value):
-        self.__dict__['_data'][name] = value
+        self._data[name] = value
+
+    def __getstate__(self):
+        return self._data
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_data', state)
 
     def to_dict(self):
         return self._data
 
 
 """
-Sort function for returning object words ordered by CTS globally if index on neo4j nodes enables reuse of deleted node's ids.
+Small thread safe LRU cache, used for memoizing parsed CTS URNs.
 """
-def sort_object_words(array):
+class LRUCache(object):
+    
+    def __init__(self, maxsize=10000):
         
-    if array == []:
-        return []
-    else:
-        pivot = array[0]
-        lesser = sort_object_words([x for x in array[1:] if less_than_words(x, pivot)])    
-        greater = sort_object_words([x for x in array[1:] if greater_equal_words(x, pivot)])
-        return lesser + [pivot] + greater  
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            # re-insert to mark the entry as the most recently used one
+            self._entries[key] = value
+            return value
+    
+    def set(self, key, value):
+        
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
 
 
 """
-Operator functions for globally returning words based on urn:cts:...:book:chapter:sentence:word number
+Immutable, parsed CTS URN, e.g. urn:cts:greekLit:tlg0003.tlg001.perseus-grc:1.89.1:4
+Use CtsUrn.parse() to share instances of the same URN via a bounded memo cache instead of slicing CTS strings by hand.
+A word reference may also be a range, e.g. urn:cts:greekLit:tlg0003.tlg001.perseus-grc:1.90.4:11-19
 """
-def less_than_words(left, pivot):
+class CtsUrn(object):
+    
+    __slots__ = ('urn', 'namespace', 'work', 'passage', 'word', 'word_range', 'key')
     
-    left_CTS = left.__dict__['_data']['CTS']
-    pivot_CTS = pivot.__dict__['_data']['CTS']
+    _cache = LRUCache(maxsize=20000)
     
-    # urn:cts:greekLit:tlg0003.tlg001.perseus-grc    
-    left_prefix = left_CTS[:-len(left_CTS.split(':')[len(left_CTS.split(':'))-2]+left_CTS.split(':')[len(left_CTS.split(':'))-1])-1]
-    pivot_prefix = pivot_CTS[:-len(pivot_CTS.split(':')[len(pivot_CTS.split(':'))-2]+pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1])-1]
-    # 1.89.1
-    left_arr = left_CTS.split(':')[len(left_CTS.split(':'))-2].split('.')
-    pivot_arr = pivot_CTS.split(':')[len(pivot_CTS.split(':'))-2].split('.')
-    # word no within sentence
-    left_suffix = left_CTS.split(':')[len(left_CTS.split(':'))-1]
-    pivot_suffix = pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1]
+    @classmethod
+    def parse(cls, urn):
+        
+        parsed = cls._cache.get(urn)
+        if parsed is None:
+            parsed = cls(urn)
+            cls._cache.set(urn, parsed)
+        return parsed
     
-                
-    if left_prefix > pivot_prefix:
-        return False
-    elif left_prefix < pivot_prefix:
-        return True
-    else:       
-        if int(left_arr[0]) > int(pivot_arr[0]):
-            return False
-        elif int(left_arr[0]) < int(pivot_arr[0]):
-            return True
-        else:
-            if int(left_arr[1]) > int(pivot_arr[1]):
-                return False
-            elif int(left_arr[1]) < int(pivot_arr[1]):
-                return True
-            else:
-                if int(left_arr[2]) > int(pivot_arr[2]):
-                    return False
-                elif int(left_arr[2]) < int(pivot_arr[2]):
-                    return True
+    def __init__(self, urn):
+        
+        parts = urn.split(':')
+        setter = super(CtsUrn, self).__setattr__
+        setter('urn', urn)
+        setter('namespace', parts[2] if len(parts) > 2 else None)
+        setter('work', parts[3] if len(parts) > 3 else None)
+        setter('passage', tuple(parts[4].split('.')) if len(parts) > 4 else ())
+        
+        word = None
+        word_range = None
+        if len(parts) > 5:
+            bounds = parts[5].split('-')
+            try:
+                if len(bounds) == 2:
+                    word_range = (int(bounds[0]), int(bounds[1]))
                 else:
-                    if int(left_suffix) >= int(pivot_suffix):
-                        return False
-                    else:
-                        return True        
-    return False 
-            
-def greater_equal_words(right, pivot):
+                    word = int(parts[5])
+            except ValueError:
+                pass
+        setter('word', word)
+        setter('word_range', word_range)
+        
+        key = [':'.join(parts[:4])]
+        for part in parts[4:]:
+            key.append(tuple(_citation_level(level) for level in part.split('.')))
+        setter('key', tuple(key))
     
-    right_CTS = right.__dict__['_data']['CTS']
-    pivot_CTS = pivot.__dict__['_data']['CTS']
+    def __setattr__(self, name, value):
+        raise AttributeError("CtsUrn is immutable.")
     
-    #urn:cts:greekLit:tlg0003.tlg001.perseus-grc
-    right_prefix = right_CTS[:-len(right_CTS.split(':')[len(right_CTS.split(':'))-2]+right_CTS.split(':')[len(right_CTS.split(':'))-1])-1]
-    pivot_prefix = pivot_CTS[:-len(pivot_CTS.split(':')[len(pivot_CTS.split(':'))-2]+pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1])-1]
+    @property
+    def work_urn(self):
+        return 'urn:cts:%s:%s' % (self.namespace, self.work)
     
-    # 1.89.1
-    right_arr = right_CTS.split(':')[len(right_CTS.split(':'))-2].split('.')
-    pivot_arr = pivot_CTS.split(':')[len(pivot_CTS.split(':'))-2].split('.')
-
-    # word no within sentence
-    right_suffix = right_CTS.split(':')[len(right_CTS.split(':'))-1]
-    pivot_suffix = pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1]
+    @property
+    def passage_urn(self):
+        return '%s:%s' % (self.work_urn, '.'.join(self.passage))
     
-    if right_prefix < pivot_prefix:
-        #print "1: " + right_prefix + " is not < " + pivot_prefix
-        return False
-    elif right_prefix > pivot_prefix:
-        #print "1: " + right_prefix + " is > " + pivot_prefix
-        return True
-    else:             
-        if int(right_arr[0]) < int(pivot_arr[0]):
-            #print "2: " + right_arr[0] + " is not < " + pivot_arr[0]
-            return False
-        elif int(right_arr[0]) > int(pivot_arr[0]):
-            #print "2: " + right_arr[0] + " is > " + pivot_arr[0]
-            return True
-        else:
-            if int(right_arr[1]) < int(pivot_arr[1]):
-                #print "3: " + right_arr[1] + " is not < " + pivot_arr[1]
-                return False
-            elif int(right_arr[1]) > int(pivot_arr[1]):
-                #print "3: " + right_arr[1] + " is > " + pivot_arr[1]
-                return True
-            else:
-                if int(right_arr[2]) < int(pivot_arr[2]):
-                    #print "4: " + right_arr[2] + " is not < " + pivot_arr[2]
-                    return False
-                elif int(right_arr[2]) > int(pivot_arr[2]):
-                    #print "4: " + right_arr[2] + " is > " + pivot_arr[2]
-                    return True
-                else:
-                    if int(right_suffix) < int(pivot_suffix):
-                        #print "5: " + right_suffix + " is not < " + pivot_suffix
-                        return False
-                    else:
-                        #print "5: " + right_suffix + " is >= " + pivot_suffix
-                        return True             
-    return False
-
+    @property
+    def lang(self):
+        """
+        Language suffix of the edition, e.g. grc for tlg0003.tlg001.perseus-grc
+        """
+        if self.work is None or '-' not in self.work:
+            return None
+        return self.work.rsplit('-', 1)[1]
     
-"""
-Sort function for returning words ordered by CTS within a sentence if index on neo4j nodes enables reuse of deleted node's ids.
-"""
-def sort_words(array):
-        
-    if array == []:
-        return []
-    else:
-        pivot = array[0]        
-        lesser = sort_words([x for x in array[1:] if
-                             int( x['CTS'].split(':')[len(x['CTS'].split(':'))-1] ) 
-                             <
-                             int(pivot['CTS'].split(':')[len(pivot['CTS'].split(':'))-1])
-                            ])
-        greater = sort_words([x for x in array[1:] if
-                              int( x['CTS'].split(':')[len(x['CTS'].split(':'))-1] ) 
-                              >=
-                              int(pivot['CTS'].split(':')[len(pivot['CTS'].split(':'))-1])
-                            ])
-        return lesser + [pivot] + greater
-
-
-"""
-Sort function for returning sentences ordered by CTS if index on neo4j nodes enables reuse of deleted node's ids.
-"""
-def sort_sentences(array):
-        
-    if array == []:
-        return []
-    else:
-        pivot = array[0]
-        lesser = sort_sentences([x for x in array[1:] if less_than(x, pivot)])    
-        greater = sort_sentences([x for x in array[1:] if greater_equal(x, pivot)])
-        return lesser + [pivot] + greater         
+    @property
+    def sentence(self):
+        return CtsUrn.parse(self.passage_urn)
     
-"""
-Operators for sentence ordering based on urn:cts:...:book.chapter.sentence number
-"""
-def less_than(left, pivot):
+    def expand(self):
+        """
+        Returns the URNs of every word of a range, or the URN itself if it isn't one.
+        """
+        if self.word_range is None:
+            return [self]
+        prefix = self.passage_urn + ':'
+        return [CtsUrn.parse(prefix + str(num)) for num in range(self.word_range[0], self.word_range[1] + 1)]
     
-    try:
-        left_CTS = left['CTS']
-        pivot_CTS = pivot['CTS']
-    # in except, the sentence is an object from the sentence resource, not a dict attribute from the document resource
-    except:
-        left_CTS = left.__dict__['_data']['CTS']
-        pivot_CTS = pivot.__dict__['_data']['CTS']
+    def __eq__(self, other):
+        return isinstance(other, CtsUrn) and self.urn == other.urn
     
-    # urn:cts:greekLit:tlg0003.tlg001.perseus-grc    
-    left_prefix = left_CTS[:-len(left_CTS.split(':')[len(left_CTS.split(':'))-1])]
-    pivot_prefix = pivot_CTS[:-len(pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1])]
-    # 1.89.1
-    left_arr = left_CTS.split(':')[len(left_CTS.split(':'))-1].split('.')
-    pivot_arr = pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1].split('.')
-                
-    if left_prefix > pivot_prefix:
-        return False
-    elif left_prefix < pivot_prefix:
-        return True
-    else:       
-        if int(left_arr[0]) > int(pivot_arr[0]):
-            return False
-        elif int(left_arr[0]) < int(pivot_arr[0]):
-            return True
-        else:
-            if int(left_arr[1]) > int(pivot_arr[1]):
-                return False
-            elif int(left_arr[1]) < int(pivot_arr[1]):
-                return True
-            else:
-                if int(left_arr[2]) >= int(pivot_arr[2]):
-                    return False
-                else:
-                    return True             
-    return False 
-            
-def greater_equal(right, pivot):
+    def __ne__(self, other):
+        return not self.__eq__(other)
     
-    try:
-        right_CTS = right['CTS']
-        pivot_CTS = pivot['CTS']
-    # in except, the sentence is an object from the sentence resource, not a dict attribute from the document resource
-    except:
-        right_CTS = right.__dict__['_data']['CTS']
-        pivot_CTS = pivot.__dict__['_data']['CTS']
+    def __lt__(self, other):
+        return self.key < other.key
     
-    # urn:cts:greekLit:tlg0003.tlg001.perseus-grc
-    right_prefix = right_CTS[:-len(right_CTS.split(':')[len(right_CTS.split(':'))-1])]
-    pivot_prefix = pivot_CTS[:-len(pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1])]
-    # 1.89.1
-    right_arr = right_CTS.split(':')[len(right_CTS.split(':'))-1].split('.')
-    pivot_arr = pivot_CTS.split(':')[len(pivot_CTS.split(':'))-1].split('.')
-
+    def __le__(self, other):
+        return self.key <= other.key
     
-    if right_prefix < pivot_prefix:
-        return False
-    elif right_prefix > pivot_prefix:
-        return True
-    else:             
-        if int(right_arr[0]) < int(pivot_arr[0]):
-            return False
-        elif int(right_arr[0]) > int(pivot_arr[0]):
-            return True
-        else:
-            if int(right_arr[1]) < int(pivot_arr[1]):
-                return False
-            elif int(right_arr[1]) > int(pivot_arr[1]):
-                return True
-            else:
-                if int(right_arr[2]) < int(pivot_arr[2]):
-                    return False
-                else:
-                    return True             
-    return False
+    def __gt__(self, other):
+        return self.key > other.key
+    
+    def __ge__(self, other):
+        return self.key >= other.key
+    
+    def __hash__(self):
+        return hash(self.urn)
+    
+    def __str__(self):
+        return self.urn
+    
+    def __repr__(self):
+        return 'CtsUrn(%r)' % self.urn
+
+
+"""
+Sort key for CTS URNs, e.g. urn:cts:greekLit:tlg0003.tlg001.perseus-grc:1.89.1:4
+The work prefix is compared as a string, every following citation level (passage, word number, ...) numerically level by level.
+Works on any citation depth, so sentences (book.chapter.sentence) and words (book.chapter.sentence:word) share the same key.
+"""
+def cts_sort_key(cts):
     
+    return CtsUrn.parse(cts).key
+
+# numbers sort before non-numeric references (e.g. 1a), which are ordered as strings
+def _citation_level(level):
     
+    try:
+        return (0, int(level), '')
+    except ValueError:
+        return (1, 0, level)
+
+
+"""
+Returns the CTS of a dict (sentence/word data of a query) or of a DataObject created by a resource.
+"""
+def _cts_of(obj):
     
+    if isinstance(obj, dict):
+        return obj['CTS']
+    return obj.to_dict()['CTS']
+
+
+"""
+Sort function for returning documents, sentences and words ordered by CTS, if index on neo4j nodes enables reuse of deleted node's ids.
+Each CTS is parsed exactly once.
+"""
+def sort_by_cts(array):
     
-    
\ No newline at end of file
+    return sorted(array, key=lambda obj: cts_sort_key(_cts_of(obj)))
@@ -0,0 +1,150 @@
+"""
+Caches for representations built from the graph, invalidated by a global corpus version.
+
+Entries are keyed on the object and the corpus version. bump_corpus_version() is called after imports
+(manage.py bump_corpus_version) and contributions, which makes every cached entry unreachable at once.
+Timeouts and in-process sizes come from API_CACHE_POLICIES in the settings.
+
+The corpus version is kept in the 'versions' cache (see CACHES), which holds nothing else, so it is never culled.
+Versions are millisecond timestamps and only grow: a lost version is replaced by the current time, never by an old
+number whose stale entries would become live again, and concurrent bumps can't hand out a version used before.
+"""
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from tastypie.cache import SimpleCache
+
+import hashlib
+import threading
+import time
+
+# imported from the phaidra api
+from utils import LRUCache
+
+
+CORPUS_VERSION_KEY = 'phaidra_corpus_version'
+
+
+def _version_cache():
+    return caches['versions'] if 'versions' in settings.CACHES else cache
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def corpus_version():
+
+    versions = _version_cache()
+    version = versions.get(CORPUS_VERSION_KEY)
+    if version is None:
+        versions.add(CORPUS_VERSION_KEY, _now(), None)
+        version = versions.get(CORPUS_VERSION_KEY) or _now()
+    return version
+
+
+def bump_corpus_version():
+
+    version = max(corpus_version() + 1, _now())
+    _version_cache().set(CORPUS_VERSION_KEY, version, None)
+    return version
+
+
+"""
+Returns the cache policy of a resource, e.g. {'timeout': 3600, 'maxsize': 2000}.
+"""
+def cache_policy(name):
+
+    return getattr(settings, 'API_CACHE_POLICIES', {}).get(name, {})
+
+
+"""
+Returns the timeout of a resource's cached objects in seconds, the TIMEOUT of the default cache if the policy has none.
+It is always passed to the cache explicitly, a timeout of None would make the entries never expire.
+"""
+def policy_timeout(name):
+
+    timeout = cache_policy(name).get('timeout')
+    return timeout if timeout is not None else caches['default'].default_timeout
+
+
+class VersionedSimpleCache(SimpleCache):
+    """
+    Tastypie cache of a resource using the resource's policy timeout and the corpus version in its keys.
+    The server side timeout isn't sent to clients, responses carry the short API_HTTP_MAX_AGE instead (no-cache if 0),
+    so browsers and proxies pick up a bumped corpus version.
+    """
+    def __init__(self, name, *args, **kwargs):
+        kwargs.setdefault('timeout', policy_timeout(name))
+        super(VersionedSimpleCache, self).__init__(*args, **kwargs)
+
+    def cache_control(self):
+        maxAge = getattr(settings, 'API_HTTP_MAX_AGE', 0)
+        if not maxAge:
+            return {'no_cache': True}
+        return {'max_age': maxAge, 's_maxage': maxAge}
+
+    def get(self, key, **kwargs):
+        return super(VersionedSimpleCache, self).get('%s:%s' % (key, corpus_version()), **kwargs)
+
+    def set(self, key, value, timeout=None):
+        return super(VersionedSimpleCache, self).set('%s:%s' % (key, corpus_version()), value, timeout or self.timeout)
+
+
+class VersionedCache(object):
+    """
+    Keeps entries keyed on (object id, representation, query parameters, corpus version) in a bounded LRU per process
+    in front of the shared Django cache.
+    """
+    def __init__(self, name, maxsize=None, timeout=None):
+
+        policy = cache_policy(name)
+        self.name = name
+        self.maxsize = maxsize or policy.get('maxsize', 1000)
+        self.timeout = timeout or policy_timeout(name)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = LRUCache(self.maxsize)
+        self._lock = threading.Lock()
+
+    def key(self, id, representation, params=None):
+        return (id, representation, tuple(sorted((params or {}).items())), corpus_version())
+
+    def _shared_key(self, key):
+        # memcached accepts short ascii keys only
+        return 'phaidra:%s:%s' % (self.name, hashlib.md5(repr(key)).hexdigest())
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+
+        value = self._entries.get(key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        value = cache.get(self._shared_key(key))
+        if value is not None:
+            self._entries.set(key, value)
+            self._count('shared_hits')
+        else:
+            self._count('misses')
+        return value
+
+    def set(self, key, value):
+
+        self._entries.set(key, value)
+        cache.set(self._shared_key(key), value, self.timeout)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Counters of this process.
+        """
+        return {'name': self.name, 'hits': self.hits, 'shared_hits': self.shared_hits, 'misses': self.misses,
+                'size': len(self._entries), 'maxsize': self.maxsize, 'corpus_version': corpus_version()}
@@ -1,14 +1,16 @@
 from phaidra.settings import GRAPH_DATABASE_REST_URL, API_PATH, ENABLE_WORD_LIST_SORTING
 
+from django.conf import settings
+
 from tastypie import fields
 from tastypie.bundle import Bundle
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.resources import Resource
-from tastypie.cache import SimpleCache
-
-from neo4jrestclient.client import GraphDatabase
+from tastypie.exceptions import BadRequest
+from tastypie.http import HttpBadRequest
 
-from app.models import Grammar
+from common.utils.graph import get_graph
+from common.utils.serializers import FieldProjection, fast_list_response, wants_fast
 
 import json
 import os
@@ -16,7 +18,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "phaidra.settings")
 
 # imported from the phaidra api
 from validation import ResourceValidation
-from utils import DataObject, sort_object_words
+from utils import DataObject, sort_by_cts
+from versioned_cache import VersionedSimpleCache
+from cypher import WORD_ATTRIBUTES, WORD_INTEGER_ATTRIBUTES, filter_params, where_clause
+from grammar_query import compiled_query
+from word_index import word_index
 
 
 class WordResource(Resource):
@@ -59,7 +65,7 @@ class WordResource(Resource):
         object_class = DataObject
         resource_name = 'word'
         authorization = ReadOnlyAuthorization()
-        cache = SimpleCache(timeout=None)
+        cache = VersionedSimpleCache('word')
         validation =  ResourceValidation()
 
     
@@ -74,133 +80,28 @@ class WordResource(Resource):
     
     def get_object_list(self, request):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
-        attrlist = ['lang','CTS', 'length', 'case', 'dialect', 'head', 'form', 'posClass', 'cid', 'gender', 'tbwid', 'pos', 'value', 'degree', 'number','lemma', 'relation', 'isIndecl', 'ref', 'posAdd', 'mood', 'tense', 'voice', 'person']
+        gdb = get_graph()
         words = []
         query_params = {}
         
         if request.GET.get('ref'):
                 
-            try:
-                grammarParams = Grammar.objects.filter(ref=request.GET.get('ref'))[0].query.split('&')        
-                for pair in grammarParams:
-                    query_params[pair.split('=')[0]] = pair.split('=')[1]
-            except KeyError as k:
-                return words            
+            compiled = compiled_query(request.GET.get('ref'))
+            if compiled is None:
+                return words
+            query_params = dict(compiled.params)
         
         # query by ordinary filters        
-        for obj in request.GET.keys():
-            if obj in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
-            elif obj.split('__')[0] in attrlist and request.GET.get(obj) is not None:
-                query_params[obj] = request.GET.get(obj)
+        query_params.update(filter_params(request.GET, WORD_ATTRIBUTES))
         
         # implement filtering
         if len(query_params) > 0:
             
             # generate query
-            q = """MATCH (s:`Sentence`)-[:words]->(w:`Word`) WHERE """
+            where, params = where_clause('w', query_params, WORD_INTEGER_ATTRIBUTES, index=word_index())
+            q = """MATCH (s:`Sentence`)-[:words]->(w:`Word`) WHERE """ + where + """ RETURN w, s ORDER BY ID(w)"""
             
-            # filter word on parameters
-            for key in query_params:     
-                # fuzzy match           
-                if len(key.split('__')) > 1:
-                    if key.split('__')[1] == 'contains':
-                        # multi values
-                        if "__" in query_params[key]:
-                            q = q + """("""
-                            chunks = query_params[key].split('__')
-                            for chunk in chunks:
-                                q = q + """ w."""+key.split('__')[0]+ """=~'.*""" +chunk+ """.*' OR """
-                            q = q[:len(q)-3]
-                            q = q + """) AND """
-                        # one value
-                        else:
-                            q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'startswith':
-                        if "__" in query_params[key]:
-                            q = q + """("""
-                            chunks = query_params[key].split('__')
-                            for chunk in chunks:
-                                q = q + """ w."""+key.split('__')[0]+ """=~'""" +chunk+ """.*' OR """
-                            q = q[:len(q)-3]
-                            q = q + """) AND """
-                        else:
-                            q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """=~'""" +query_params[key]+ """.*' AND """
-                    elif key.split('__')[1] == 'endswith':
-                        if "__" in query_params[key]:
-                            q = q + """("""
-                            chunks = query_params[key].split('__')
-                            for chunk in chunks:
-                                q = q + """ w."""+key.split('__')[0]+ """=~'.*""" +chunk+ """' OR """
-                            q = q[:len(q)-3]
-                            q = q + """) AND """
-                        else:
-                            q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """=~'.*""" +query_params[key]+ """' AND """
-                    # only for integer values
-                    elif key.split('__')[1] == 'gt':
-                        q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """>""" +query_params[key]+ """ AND """
-                    # only for integer values
-                    elif key.split('__')[1] == 'lt':
-                        q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """<""" +query_params[key]+ """ AND """        
-                    # negated match
-                    elif key.split('__')[1] == 'isnot':
-                        # integer values
-                        if key.split('__')[0] in ['tbwid', 'head', 'length', 'cid']:
-                            # multiple values
-                            if "__" in query_params[key]:   
-                                q = q + """("""
-                                chunks = query_params[key].split('__')
-                                for chunk in chunks:
-                                    q = q + """ w."""+key.split('__')[0]+ """<>""" +chunk+ """ OR """
-                                q = q[:len(q)-3]
-                                q = q + """) AND """
-                            # one value
-                            else:
-                                q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """<>""" +query_params[key]+ """ AND """
-                        # string values
-                        else:
-                            # multi values
-                            if "__" in query_params[key]:   
-                                q = q + """("""
-                                chunks = query_params[key].split('__')
-                                for chunk in chunks:
-                                    q = q + """ w."""+key.split('__')[0]+ """<>'""" +chunk+ """' OR """
-                                q = q[:len(q)-3]
-                                q = q + """) AND """
-                            # one value
-                            else:
-                                q = q + """HAS (w.""" +key.split('__')[0]+ """) AND w.""" +key.split('__')[0]+ """<>'""" +query_params[key]+ """' AND """
-                # perfect match
-                else:
-                    # integer values
-                    if key in ['tbwid', 'head', 'length', 'cid']:
-                        # multi values
-                        if "__" in query_params[key]:   
-                                q = q + """("""
-                                chunks = query_params[key].split('__')
-                                for chunk in chunks:
-                                    q = q + """ w."""+key.split('__')[0]+ """=""" +chunk+ """ OR """
-                                q = q[:len(q)-3]
-                                q = q + """) AND """
-                        # one value
-                        else:
-                            q = q + """HAS (w.""" +key+ """) AND w.""" +key+ """=""" +query_params[key]+ """ AND """
-                    # string values
-                    else:
-                        if "__" in query_params[key]:
-                            q = q + """("""
-                            chunks = query_params[key].split('__')
-                            for chunk in chunks:
-                                q = q + """ w."""+key.split('__')[0]+ """='""" +chunk+ """' OR """
-                            q = q[:len(q)-3]
-                            q = q + """) AND """
-                        else:
-                            q = q + """HAS (w.""" +key+ """) AND w.""" +key+ """='""" +query_params[key]+ """' AND """
-            q = q[:len(q)-4]
-            q = q + """RETURN w, s ORDER BY ID(w)"""
-            
-            table = gdb.query(q)
+            table = gdb.query(q, params=params)
             
             # create the objects which was queried for and set all necessary attributes
             for t in table:
@@ -209,52 +110,117 @@ class WordResource(Resource):
                 url = word['self'].split('/')
                 urlSent = sentence['self'].split('/')        
                     
-                new_obj = DataObject(url[len(url)-1])
-                new_obj.__dict__['_data'] = word['data']        
-                new_obj.__dict__['_data']['id'] = url[len(url)-1]
-                new_obj.__dict__['_data']['sentence_resource_uri'] = API_PATH + 'sentence/' + urlSent[len(urlSent)-1] +'/'
+                new_obj = DataObject(url[len(url)-1], word['data'])
+                new_obj.sentence_resource_uri = API_PATH + 'sentence/' + urlSent[len(urlSent)-1] +'/'
                         
                 words.append(new_obj)
             
             if ENABLE_WORD_LIST_SORTING:
-                return sort_object_words(words[:500]) 
+                return sort_by_cts(words) 
             else:
                 return words
             #return words   
         
-        # default querying on big dataset (CTS required)
-        elif request.GET.get('document_CTS'):    
-
-            # delted this so our word list is smaller
-            #documentTable = gdb.query("""MATCH (n:`Document`) RETURN n ORDER BY ID(n)""")    
-            #for d in documentTable:
-            #document = d[0]
-            wordTable = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`)-[:words]->(w:`Word`) WHERE d.CTS = '""" + request.GET.get('document_CTS') + """' RETURN w,s ORDER BY ID(w)""")
-                            
-            # get sent id
-            for w in wordTable:
-                word = w[0]
-                sentence = w[1]
-                url = word['self'].split('/')
-                urlSent = sentence['self'].split('/')    
-                        
-                new_obj = DataObject(url[len(url)-1])
-                new_obj.__dict__['_data'] = word['data']
-                                    
-                new_obj.__dict__['_data']['id'] = url[len(url)-1]
-                new_obj.__dict__['_data']['sentence_resource_uri'] = API_PATH + 'sentence/' + urlSent[len(urlSent)-1] +'/'
-                                    
-                words.append(new_obj)
-            
-            if ENABLE_WORD_LIST_SORTING:
-                return sort_object_words(words[:500]) 
-            else:
-                return words
         # no parameter for filtering, return empty
         else:
             return words
         
     
+    """
+    Returns a page of the words of a document in CTS order, starting after the word CTS cursor, and whether more words follow.
+    Cursor, order and limit are applied by neo4j on the positions of the words (see manage.py index_positions).
+    """
+    def document_page(self, document_CTS, cursor, limit):
+        
+        gdb = get_graph()
+        
+        after = 0
+        if cursor:
+            cursorTable = gdb.query("""MATCH (w:`Word`) WHERE w.CTS = {cursor} RETURN w.position""", params={'cursor': cursor})
+            if len(cursorTable) < 1 or cursorTable[0][0] is None:
+                raise BadRequest("Invalid cursor provided. Please provide the CTS of a word of the document.")
+            after = cursorTable[0][0]
+        
+        # one more word than the page tells whether more words follow
+        table = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`)-[:words]->(w:`Word`) WHERE d.CTS = {document_CTS} AND w.position > {after}
+                             RETURN w, ID(s) ORDER BY w.position LIMIT {limit}""", params={'document_CTS': document_CTS, 'after': after, 'limit': limit + 1})
+        rows = [row for row in table]
+        
+        words = []
+        for row in rows[:limit]:
+            word = row[0]
+            url = word['self'].split('/')
+            
+            new_obj = DataObject(url[len(url)-1], word['data'])
+            new_obj.sentence_resource_uri = API_PATH + 'sentence/' + str(row[1]) +'/'
+            words.append(new_obj)
+        
+        return words, len(rows) > limit
+    
+    
+    def projection(self):
+        
+        if getattr(self, '_projection', None) is None:
+            self._projection = FieldProjection(self, API_PATH)
+        return self._projection
+    
+    def get_list(self, request, **kwargs):
+        """
+        The words of a document (document_CTS without further filters) are paged by cursor instead of offset:
+        the cursor is the CTS of the last word of the previous page, meta.next links to the next page.
+        With fast=1 the words are serialized to JSON by the precompiled projection of the fields instead of being dehydrated.
+        """
+        fast = wants_fast(self, request)
+        if not request.GET.get('document_CTS') or request.GET.get('ref') or filter_params(request.GET, WORD_ATTRIBUTES):
+            if not fast:
+                return super(WordResource, self).get_list(request, **kwargs)
+            return self.fast_get_list(request, **kwargs)
+        
+        errors = self._meta.validation.is_valid(self.build_bundle(request=request), request)
+        if len(errors) > 0:
+            return self.error_response(request, errors, response_class=HttpBadRequest)
+        
+        try:
+            limit = int(request.GET.get('limit', getattr(settings, 'API_LIMIT_PER_PAGE', 20)))
+        except ValueError:
+            raise BadRequest("Invalid limit provided. Please provide a positive integer.")
+        if limit <= 0 or limit > self._meta.max_limit:
+            limit = self._meta.max_limit
+        
+        cursor = request.GET.get('cursor')
+        words, more = self.document_page(request.GET.get('document_CTS'), cursor, limit)
+        
+        meta = {'limit': limit, 'cursor': cursor, 'next_cursor': None, 'next': None}
+        if more and words:
+            params = request.GET.copy()
+            params['cursor'] = words[-1].CTS
+            meta['next_cursor'] = words[-1].CTS
+            meta['next'] = request.path + '?' + params.urlencode()
+        
+        if fast:
+            return fast_list_response(self.projection(), meta, words)
+        
+        bundles = [self.full_dehydrate(self.build_bundle(obj=obj, request=request), for_list=True) for obj in words]
+        to_be_serialized = self.alter_list_data_to_serialize(request, {'meta': meta, 'objects': bundles})
+        return self.create_response(request, to_be_serialized)
+    
+    def fast_get_list(self, request, **kwargs):
+        """
+        The filtered list like tastypie's get_list, paginated the same way, but serialized by the projection.
+        """
+        base_bundle = self.build_bundle(request=request)
+        errors = self._meta.validation.is_valid(base_bundle, request)
+        if len(errors) > 0:
+            return self.error_response(request, errors, response_class=HttpBadRequest)
+        
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+        
+        paginator = self._meta.paginator_class(request.GET, sorted_objects, resource_uri=self.get_resource_uri(), limit=self._meta.limit, max_limit=self._meta.max_limit, collection_name=self._meta.collection_name)
+        page = paginator.page()
+        return fast_list_response(self.projection(), page['meta'], page[self._meta.collection_name])
+    
+    
     def obj_get_list(self, bundle, **kwargs):
                 
         dict = self._meta.validation.is_valid(bundle, bundle.request)
@@ -266,21 +232,19 @@ class WordResource(Resource):
     
     def obj_get(self, bundle, **kwargs):
         
-        gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
+        gdb = get_graph()
         word = gdb.nodes.get(GRAPH_DATABASE_REST_URL + "node/" + kwargs['pk'] + '/')
         
         # ge the data of the word
-        new_obj = DataObject(kwargs['pk'])
-        new_obj.__dict__['_data'] = word.properties
-        new_obj.__dict__['_data']['id'] = kwargs['pk']
-        new_obj.__dict__['_data']['sentence_resource_uri'] = API_PATH + 'sentence/' + str(word.relationships.incoming(types=["words"])[0].start.id) + '/'
+        new_obj = DataObject(kwargs['pk'], word.properties)
+        new_obj.sentence_resource_uri = API_PATH + 'sentence/' + str(word.relationships.incoming(types=["words"])[0].start.id) + '/'
         
         # get the lemma
         lemmaRels = word.relationships.incoming(types=["values"])
         if len(lemmaRels) > 0:
-            new_obj.__dict__['_data']['lemma_resource_uri'] = API_PATH + 'lemma/' + str(lemmaRels[0].start.id) + '/'
+            new_obj.lemma_resource_uri = API_PATH + 'lemma/' + str(lemmaRels[0].start.id) + '/'
             
-        translations = gdb.query("""MATCH (d:`Word`)-[:translation]->(w:`Word`) WHERE d.CTS='""" +word.properties['CTS']+ """' RETURN DISTINCT w ORDER BY ID(w)""")
+        translations = gdb.query("""MATCH (d:`Word`)-[:translation]->(w:`Word`) WHERE d.CTS = {CTS} RETURN DISTINCT w ORDER BY ID(w)""", params={'CTS': word.properties['CTS']})
         translationArray = []
         for t in translations:
             trans = t[0]
@@ -288,7 +252,7 @@ class WordResource(Resource):
             trans['data']['resource_uri'] = API_PATH + 'word/' + url[len(url)-1] + '/'
             translationArray.append(trans['data'])
                 
-        new_obj.__dict__['_data']['translations'] = translationArray
+        new_obj.translations = translationArray
                 
         return new_obj
 
@@ -0,0 +1,193 @@
+"""
+Token index of the word attributes value, form and lemma.
+
+The contains, startswith and endswith filters are regular expressions in Cypher (=~ '.*os'), which neo4j evaluates
+on every Word node. The index keeps the distinct values of each attribute sorted (startswith), sorted reversed
+(endswith) and by their trigrams (contains), with the node ids per value, so where_clause turns these filters into
+ID(w) IN {ids}. It covers the words of the sentences, is built after imports by manage.py build_word_index and
+saved to WORD_INDEX_PATH; processes load it on first use and again when the file changes, which they check at most
+every WORD_INDEX_CHECK_INTERVAL seconds. Without the file the filters stay regular expressions.
+
+Empty needles (e.g. lemma__endswith=) and filters matching more than WORD_INDEX_MAX_IDS words aren't resolved by the
+index, since they would send a large part of the corpus along with the query; they stay regular expressions as well.
+"""
+from django.conf import settings
+
+from bisect import bisect_left
+
+import cPickle as pickle
+import os
+import threading
+import time
+
+
+INDEXED_ATTRIBUTES = ('value', 'form', 'lemma')
+INDEXED_OPERATORS = ('contains', 'startswith', 'endswith')
+
+# length of the n-grams of the substring index
+NGRAM = 3
+
+# default of WORD_INDEX_MAX_IDS
+MAX_IDS = 5000
+
+# default of WORD_INDEX_CHECK_INTERVAL
+CHECK_INTERVAL = 10
+
+
+def _ngrams(value):
+    return set(value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1))
+
+
+class AttributeIndex(object):
+
+    def __init__(self):
+
+        self.ids = {}
+        self.values = []
+        self.reversed = []
+        self.ngrams = {}
+
+    def add(self, value, id):
+        self.ids.setdefault(value, []).append(id)
+
+    def freeze(self):
+        """
+        Builds the sorted and n-gram indexes after all values were added.
+        """
+        self.values = sorted(self.ids)
+        self.reversed = sorted(value[::-1] for value in self.values)
+        self.ngrams = {}
+        for value in self.values:
+            for ngram in _ngrams(value):
+                self.ngrams.setdefault(ngram, []).append(value)
+
+    def _prefixed(self, values, prefix):
+
+        i = bisect_left(values, prefix)
+        while i < len(values) and values[i].startswith(prefix):
+            yield values[i]
+            i = i + 1
+
+    def matching_values(self, operator, needle):
+
+        if operator == 'startswith':
+            return list(self._prefixed(self.values, needle))
+        if operator == 'endswith':
+            return [value[::-1] for value in self._prefixed(self.reversed, needle[::-1])]
+
+        # contains: candidates share all n-grams of the needle, short needles are looked up in the distinct values
+        if len(needle) < NGRAM:
+            candidates = self.values
+        else:
+            ngrams = sorted(_ngrams(needle), key=lambda ngram: len(self.ngrams.get(ngram, ())))
+            candidates = self.ngrams.get(ngrams[0], [])
+        return [value for value in candidates if needle in value]
+
+    def lookup(self, operator, needle):
+        """
+        Returns the sorted ids of the words whose value matches.
+        """
+        ids = []
+        for value in self.matching_values(operator, needle):
+            ids.extend(self.ids[value])
+        return sorted(ids)
+
+
+class WordIndex(object):
+
+    def __init__(self, attributes=INDEXED_ATTRIBUTES):
+        self.attributes = dict((attribute, AttributeIndex()) for attribute in attributes)
+        self.version = None
+
+    def add(self, id, properties):
+
+        for attribute, index in self.attributes.items():
+            value = properties.get(attribute)
+            if isinstance(value, basestring) and value:
+                index.add(value, id)
+
+    def freeze(self):
+        for index in self.attributes.values():
+            index.freeze()
+
+    def covers(self, attribute, operator):
+        return attribute in self.attributes and operator in INDEXED_OPERATORS
+
+    def lookup(self, attribute, operator, needles, max_ids=None):
+        """
+        Returns the sorted ids of the words matching any of the needles, None if a needle is empty
+        or more than max_ids (default: WORD_INDEX_MAX_IDS) words match.
+        """
+        if max_ids is None:
+            max_ids = getattr(settings, 'WORD_INDEX_MAX_IDS', MAX_IDS)
+        ids = set()
+        for needle in needles:
+            if not needle:
+                return None
+            ids.update(self.attributes[attribute].lookup(operator, needle))
+            if len(ids) > max_ids:
+                return None
+        return sorted(ids)
+
+
+"""
+Reads the indexed attributes of all sentence words from the graph and builds the index.
+"""
+def build_word_index(gdb):
+
+    index = WordIndex()
+    table = gdb.query("""MATCH (s:`Sentence`)-[:words]->(w:`Word`) RETURN ID(w), """ + ', '.join('w.' + attribute for attribute in INDEXED_ATTRIBUTES))
+    for row in table:
+        index.add(row[0], dict(zip(INDEXED_ATTRIBUTES, row[1:])))
+    index.freeze()
+    return index
+
+
+def index_path():
+    return getattr(settings, 'WORD_INDEX_PATH', None)
+
+
+def save_word_index(index, path=None):
+
+    path = path or index_path()
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    # written next to the file and renamed, so processes never load a partial index
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
+
+
+_index = None
+_checked = None
+_lock = threading.Lock()
+
+"""
+Returns the word index of this process, None if no index was built.
+"""
+def word_index():
+
+    global _index, _checked
+    # the file is looked at once per interval only, not on every request
+    now = time.time()
+    if _checked is not None and now - _checked < getattr(settings, 'WORD_INDEX_CHECK_INTERVAL', CHECK_INTERVAL):
+        return _index
+    _checked = now
+
+    path = index_path()
+    try:
+        version = os.stat(path).st_mtime if path else None
+    except OSError:
+        version = None
+    if version is None:
+        _index = None
+        return None
+
+    if _index is None or _index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                with open(path, 'rb') as f:
+                    index = pickle.load(f)
+                index.version = version
+                _index = index
+    return _index
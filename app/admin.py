@@ -1,5 +1,5 @@
 from django.contrib import admin
-from app.models import Language, Category, AppUser, Grammar, Content, Aspect, Task, TaskSequence, TaskContext
+from app.models import Language, Category, AppUser, Grammar, Content, Aspect, Task, TaskSequence, TaskContext, SubmissionTask
 from django import forms
 from django.db import models
 
@@ -104,6 +104,18 @@ class AppUserAdmin(admin.ModelAdmin):
     }
 
 
+class SubmissionTaskAdmin(admin.ModelAdmin):
+    list_display = ('key', 'username', 'created', 'processed', 'attempts', 'next_attempt_at', 'error')
+    list_filter = ('processed', 'attempts')
+    search_fields = ('key', 'username')
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        from api.submission_queue import requeue_failed
+        count = requeue_failed(list(queryset.values_list('key', flat=True)))
+        self.message_user(request, '%d failed submissions queued again.' % count)
+    requeue.short_description = 'Queue the selected failed submissions again'
+
 admin.site.register(AppUser, AppUserAdmin)
 admin.site.register(Language, LanguageAdmin)
 admin.site.register(Category, CategoryAdmin)
@@ -113,3 +125,4 @@ admin.site.register(Aspect)
 admin.site.register(Task, TaskAdmin)
 admin.site.register(TaskSequence, TaskSequenceAdmin)
 admin.site.register(TaskContext, TaskContextAdmin)
+admin.site.register(SubmissionTask, SubmissionTaskAdmin)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from common.utils.graph import get_graph
+
+from api.word_index import build_word_index, index_path, save_word_index
+
+
+class Command(BaseCommand):
+	help = 'Builds the index of the word attributes used by the contains, startswith and endswith filters, run it after importing into neo4j.'
+
+	def handle(self, *args, **options):
+		if not index_path():
+			self.stderr.write('WORD_INDEX_PATH is not set.')
+			return
+
+		index = build_word_index(get_graph())
+		save_word_index(index)
+		for attribute, attributeIndex in sorted(index.attributes.items()):
+			self.stdout.write('%s: %s values, %s trigrams' % (attribute, len(attributeIndex.values), len(attributeIndex.ngrams)))
+		self.stdout.write('Word index saved to %s.' % index_path())
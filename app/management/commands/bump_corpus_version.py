@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api.versioned_cache import bump_corpus_version
+
+
+class Command(BaseCommand):
+	help = 'Invalidates the cached API representations of the corpus, run it after importing into neo4j.'
+
+	def handle(self, *args, **options):
+		self.stdout.write('Corpus version is now %s.' % bump_corpus_version())
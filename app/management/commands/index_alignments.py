@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from common.utils.graph import get_graph
+from common.utils.neo4j_import.alignment_index import index_alignment
+
+
+class Command(BaseCommand):
+	args = '[<document CTS> ...]'
+	help = 'Creates the aligned_with and translated_as relationships of the documents (default: all) from their word translations.'
+
+	def handle(self, *args, **options):
+		gdb = get_graph()
+		documents = list(args) or [row[0] for row in gdb.query("""MATCH (d:`Document`) RETURN d.CTS ORDER BY ID(d)""")]
+
+		for documentCTS in documents:
+			index_alignment(gdb, documentCTS)
+			self.stdout.write('%s indexed.' % documentCTS)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from common.utils.graph import get_graph
+from common.utils.neo4j_import.position_index import index_positions
+
+
+class Command(BaseCommand):
+	args = '[<document CTS> ...]'
+	help = 'Sets the CTS order positions of the words of the documents (default: all), which page the word lists.'
+
+	def handle(self, *args, **options):
+		gdb = get_graph()
+		documents = list(args) or [row[0] for row in gdb.query("""MATCH (d:`Document`) RETURN d.CTS ORDER BY ID(d)""")]
+
+		for documentCTS in documents:
+			count = index_positions(gdb, documentCTS)
+			self.stdout.write('%s: %d words indexed.' % (documentCTS, count))
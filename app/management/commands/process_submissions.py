@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from optparse import make_option
+import time
+
+from api.submission import record_knowledge, write_submission
+from api.submission_queue import create_indexes, process_next
+
+
+class Command(BaseCommand):
+	help = 'Writes the queued submissions to neo4j (see ENABLE_SUBMISSION_QUEUE).'
+
+	option_list = BaseCommand.option_list + (
+		make_option('--once', action='store_true', dest='once', default=False,
+			help='Write the pending submissions and exit instead of waiting for new ones.'),
+		make_option('--interval', type='float', dest='interval', default=1.0,
+			help='Seconds to wait when no task is due.'),
+	)
+
+	def handle(self, *args, **options):
+		create_indexes()
+		while True:
+			task = process_next(write_submission, record_knowledge)
+			if task is None:
+				if options['once']:
+					return
+				time.sleep(options['interval'])
+			elif task.processed is None:
+				self.stderr.write('%s failed (attempt %d): %s' % (task.key, task.attempts, task.error))
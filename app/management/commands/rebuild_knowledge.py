@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from common.utils.graph import get_graph
+
+from api.knowledge import rebuild
+
+
+class Command(BaseCommand):
+	args = '[username ...]'
+	help = 'Recalculates the knowledge maps of the given users (all users with submissions if none are given) from their submissions.'
+
+	def handle(self, *args, **options):
+		usernames = list(args)
+		if not usernames:
+			table = get_graph().query("""MATCH (u:`User`)-[:submits]->(s:`Submission`) WHERE HAS (u.username) RETURN DISTINCT u.username""")
+			usernames = [row[0] for row in table]
+
+		for username in usernames:
+			knowledge = rebuild(username)
+			self.stdout.write('%s: %d words, %d lemmas, %d refs' % (username, len(knowledge['vocab']), len(knowledge['lemmas']), len(knowledge['refs'])))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.submission_queue import requeue_failed
+
+
+class Command(BaseCommand):
+	args = '[<idempotency key> ...]'
+	help = 'Queues the failed submissions (default: all) again, e.g. after neo4j was unavailable for a while.'
+
+	def handle(self, *args, **options):
+		self.stdout.write('%d failed submissions queued again.' % requeue_failed(list(args)))
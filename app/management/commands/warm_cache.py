@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.test.client import RequestFactory
+
+from common.utils.graph import get_graph
+
+from api.document import DocumentResource
+from api.sentence import SentenceResource
+
+
+class Command(BaseCommand):
+	args = '[<document CTS> ...]'
+	help = 'Fills the API caches with the documents and their sentences (default and full representations), run it after bump_corpus_version.'
+
+	def handle(self, *args, **options):
+		gdb = get_graph()
+		if args:
+			table = gdb.query("""MATCH (d:`Document`) WHERE d.CTS IN {ctss} RETURN ID(d), d.CTS ORDER BY ID(d)""", params={'ctss': list(args)})
+		else:
+			table = gdb.query("""MATCH (d:`Document`) RETURN ID(d), d.CTS ORDER BY ID(d)""")
+
+		factory = RequestFactory()
+		documentResource = DocumentResource()
+		sentenceResource = SentenceResource()
+
+		for documentId, documentCTS in table:
+			request = factory.get('/')
+			documentResource.cached_obj_get(documentResource.build_bundle(request=request), pk=str(documentId))
+
+			sentences = gdb.query("""MATCH (d:`Document`)-[:sentences]->(s:`Sentence`) WHERE ID(d) = {id} RETURN ID(s)""", params={'id': documentId})
+			for query in ({}, {'full': 'true'}):
+				request = factory.get('/', query)
+				for s in sentences:
+					sentenceResource.obj_get(sentenceResource.build_bundle(request=request), pk=str(s[0]))
+
+			self.stdout.write('%s: %s sentences' % (documentCTS, len(sentences)))
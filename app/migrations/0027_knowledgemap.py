@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_auto_20141117_2002'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeMap',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('username', models.CharField(help_text=b'Username of the neo4j user node.', unique=True, max_length=30, verbose_name=b'username')),
+                ('vocab', models.TextField(default=b'{}', help_text=b'Word CTS -> number of times seen.', verbose_name=b'encountered words')),
+                ('lemmas', models.TextField(default=b'{}', help_text=b'Lemma value -> frequency of the lemma.', verbose_name=b'known lemmas')),
+                ('refs', models.TextField(default=b'{}', help_text=b'Grammar ref -> filters of its query.', verbose_name=b'practiced grammar')),
+                ('lemma_frequency', models.IntegerField(default=0, verbose_name=b'summed lemma frequency')),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
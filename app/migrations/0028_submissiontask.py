@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_knowledgemap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionTask',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(help_text=b'\nSending the same submission twice with \nthe same key queues it once.\n', unique=True, max_length=64, verbose_name=b'idempotency key')),
+                ('username', models.CharField(max_length=30, verbose_name=b'username')),
+                ('data', models.TextField(verbose_name=b'submission data (JSON)')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('processed', models.DateTimeField(db_index=True, null=True, blank=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(default=b'', blank=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_submissiontask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissiontask',
+            name='next_attempt_at',
+            field=models.DateTimeField(db_index=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -381,6 +381,81 @@ class Content(models.Model):
         return unicode(self.title) or u''
 
 
+"""
+Knowledge Map Model for Phaidra
+"""
+class KnowledgeMap(models.Model):
+    """
+    Summary of what a user has learned so far, updated with every 
+    submission (see api/knowledge.py), so the visualizations don't 
+    have to replay the whole submission history kept in neo4j. 
+    The maps are stored as JSON.
+    """
+    username = models.CharField('username', 
+                            max_length=30, 
+                            unique=True, 
+                            help_text='Username of the neo4j user node.')
+
+    vocab = models.TextField('encountered words', 
+                            default='{}', 
+                            help_text='Word CTS -> number of times seen.')
+
+    lemmas = models.TextField('known lemmas', 
+                            default='{}', 
+                            help_text='Lemma value -> frequency of the lemma.')
+
+    refs = models.TextField('practiced grammar', 
+                            default='{}', 
+                            help_text='Grammar ref -> filters of its query.')
+
+    lemma_frequency = models.IntegerField('summed lemma frequency', 
+                            default=0)
+
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return unicode(self.username) or u''
+
+
+"""
+Submission Task Model for Phaidra
+"""
+class SubmissionTask(models.Model):
+    """
+    Queued submission. The API stores submissions here and responds 
+    right away, the process_submissions command writes them and the 
+    user's knowledge relationships to neo4j (see api/submission_queue.py).
+    """
+    key = models.CharField('idempotency key', 
+                            max_length=64, 
+                            unique=True, 
+                            help_text=textwrap.dedent("""
+                                Sending the same submission twice with 
+                                the same key queues it once.
+                            """))
+
+    username = models.CharField('username', 
+                            max_length=30)
+
+    data = models.TextField('submission data (JSON)')
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    processed = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    attempts = models.IntegerField(default=0)
+
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['id']
+
+    def __unicode__(self):
+        return unicode(self.key) or u''
+
+
 # SIGNALS
 def signals_import():
     """
@@ -390,4 +465,10 @@ def signals_import():
 
     models.signals.post_save.connect(create_api_key, sender=AppUser)
 
+    # compiled grammar queries of the api
+    from api.grammar_query import invalidate_compiled_queries
+
+    models.signals.post_save.connect(invalidate_compiled_queries, sender=Grammar, dispatch_uid='grammar_query_post_save')
+    models.signals.post_delete.connect(invalidate_compiled_queries, sender=Grammar, dispatch_uid='grammar_query_post_delete')
+
 signals_import()
@@ -0,0 +1,140 @@
+"""
+Process-wide connection to the neo4j REST interface.
+
+Creating a GraphDatabase fetches the service root and opens a new HTTP session, so instead of doing this on every
+API call each (uWSGI) process keeps one connection with a keep-alive pool. It is created lazily on first use and
+created again after a connection failure. Resources get it via get_graph().
+"""
+import json
+import re
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from neo4jrestclient import request as neo4j_request
+from neo4jrestclient.client import GraphDatabase
+
+
+CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, socket.error)
+
+# clauses of Cypher queries which change the graph, these are never sent twice
+WRITE_CLAUSES = re.compile(r'\b(CREATE|MERGE|SET|DELETE|REMOVE|FOREACH)\b', re.IGNORECASE)
+
+
+class GraphError(Exception):
+    """
+    Raised if the transactional endpoint reports errors for a set of statements.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super(GraphError, self).__init__('; '.join('%s: %s' % (e.get('code'), e.get('message')) for e in errors))
+
+
+class GraphConnection(object):
+
+    def __init__(self, url, pool_size=10, retries=1):
+
+        self.url = url if url.endswith('/') else url + '/'
+        self.pool_size = pool_size
+        self.retries = retries
+        self._gdb = None
+        self._lock = threading.Lock()
+
+        # session for the transactional endpoint
+        self.session = requests.Session()
+        self._mount(self.session)
+        # neo4jrestclient keeps a module level session, let it share the pool size
+        if isinstance(getattr(neo4j_request, 'session', None), requests.Session):
+            self._mount(neo4j_request.session)
+
+    def _mount(self, session):
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    @property
+    def gdb(self):
+        """
+        The neo4jrestclient instance, created on first use.
+        """
+        if self._gdb is None:
+            with self._lock:
+                if self._gdb is None:
+                    self._gdb = GraphDatabase(self.url)
+        return self._gdb
+
+    def reset(self):
+        """
+        Drops the current client, the next access connects again.
+        """
+        with self._lock:
+            self._gdb = None
+
+    def _retry(self, function, *args, **kwargs):
+
+        attempt = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except CONNECTION_ERRORS:
+                self.reset()
+                if attempt >= self.retries:
+                    raise
+                attempt = attempt + 1
+
+    def _once(self, function, *args, **kwargs):
+        # a failed write may have been committed before the connection broke, so it is left to the caller
+        try:
+            return function(*args, **kwargs)
+        except CONNECTION_ERRORS:
+            self.reset()
+            raise
+
+    def query(self, q, params=None, **kwargs):
+        """
+        Runs a Cypher query. Read queries reconnect once if neo4j went away in between, queries writing to the graph
+        aren't repeated: the connection error is raised.
+        """
+        run = self._once if WRITE_CLAUSES.search(q) else self._retry
+        return run(lambda: self.gdb.query(q, params=params or {}, **kwargs))
+
+    def commit(self, statements):
+        """
+        Sends a list of (statement, parameters) pairs to the transactional endpoint and commits them in one transaction.
+        Returns the rows of every statement. Connection errors are raised without sending the statements again,
+        the transaction may have been committed (see the idempotency keys of api/submission_queue.py).
+        """
+        body = json.dumps({'statements': [{'statement': statement, 'parameters': parameters or {}} for statement, parameters in statements]})
+        response = self._once(self.session.post, self.url + 'transaction/commit', data=body,
+                              headers={'Accept': 'application/json; charset=UTF-8', 'Content-Type': 'application/json'})
+        response.raise_for_status()
+        result = response.json()
+
+        if result.get('errors'):
+            raise GraphError(result['errors'])
+        return [[row['row'] for row in statement['data']] for statement in result['results']]
+
+    def __getattr__(self, name):
+        # nodes, relationships, labels, ... of the underlying client
+        return getattr(self.gdb, name)
+
+
+_connection = None
+_connection_lock = threading.Lock()
+
+"""
+Returns the connection of this process, configured by GRAPH_DATABASE_REST_URL and GRAPH_DATABASE_POOL_SIZE.
+"""
+def get_graph():
+
+    global _connection
+    if _connection is None:
+        from django.conf import settings
+        with _connection_lock:
+            if _connection is None:
+                _connection = GraphConnection(settings.GRAPH_DATABASE_REST_URL,
+                                              pool_size=getattr(settings, 'GRAPH_DATABASE_POOL_SIZE', 10))
+    return _connection
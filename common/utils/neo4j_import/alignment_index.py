@@ -0,0 +1,32 @@
+# coding: utf8
+"""
+Index of aligned sentences and translated documents.
+
+The word level translation relationships are summarised as direct relationships in both directions,
+Sentence-[:aligned_with]->Sentence and Document-[:translated_as]->Document, so the API finds the translations of a
+sentence or document with a single hop instead of walking over every word. import_alignment.py indexes each
+imported translation, manage.py index_alignments (re)builds the index of an existing database.
+The statements MERGE, running them again doesn't create duplicates.
+"""
+
+ALIGNED_WITH_STATEMENT = """MATCH (d:`Document`)-[:sentences]->(s:`Sentence`)-[:words]->(:`Word`)-[:translation]-(:`Word`)<-[:words]-(s1:`Sentence`)<-[:sentences]-(d1:`Document`)
+WHERE d.CTS = {CTS} AND d <> d1
+WITH DISTINCT s, s1
+MERGE (s)-[:aligned_with]->(s1)
+MERGE (s1)-[:aligned_with]->(s)"""
+
+TRANSLATED_AS_STATEMENT = """MATCH (d:`Document`)-[:sentences]->(:`Sentence`)-[:aligned_with]->(:`Sentence`)<-[:sentences]-(d1:`Document`)
+WHERE d.CTS = {CTS}
+WITH DISTINCT d, d1
+MERGE (d)-[:translated_as]->(d1)
+MERGE (d1)-[:translated_as]->(d)"""
+
+
+"""
+Indexes the alignments of a document with the documents its words are translated to (or from).
+gdb is anything with a query(q, params=...) method, a neo4jrestclient GraphDatabase or common.utils.graph.GraphConnection.
+"""
+def index_alignment(gdb, documentCTS):
+
+    gdb.query(ALIGNED_WITH_STATEMENT, params={'CTS': documentCTS})
+    gdb.query(TRANSLATED_AS_STATEMENT, params={'CTS': documentCTS})
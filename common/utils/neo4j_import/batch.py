@@ -0,0 +1,105 @@
+# coding: utf8
+"""
+Batched import of a document with its sentences and words.
+
+Instead of creating every node, property, label and relationship with its own REST call, sentences are collected
+and sent to the transactional endpoint as UNWIND parameter lists, committing every batch_size sentences.
+A backend is anything with a commit(statements) method taking a list of (statement, parameters) pairs,
+e.g. common.utils.graph.GraphConnection or the DryRunBackend below, which stands in for a local Neo4j.
+"""
+import json
+import sys
+import time
+
+
+INDEXES = [
+    """CREATE INDEX ON :Document(CTS)""",
+    """CREATE INDEX ON :Sentence(CTS)""",
+    """CREATE INDEX ON :Word(CTS)""",
+    """CREATE INDEX ON :Lemma(CITE)"""
+]
+
+DOCUMENT_STATEMENT = """MERGE (d:`Document` {CTS: {CTS}}) SET d += {properties}"""
+
+SENTENCES_STATEMENT = """UNWIND {sentences} AS sentence
+MATCH (d:`Document` {CTS: {document}})
+CREATE (s:`Sentence` {CTS: sentence.CTS, sentence: sentence.sentence, length: sentence.length})
+CREATE (d)-[:sentences]->(s)
+WITH s, sentence
+UNWIND sentence.words AS word
+CREATE (w:`Word`)
+SET w = word
+CREATE (s)-[:words]->(w)"""
+
+
+class DryRunBackend(object):
+    """
+    Stand-in for Neo4j: counts the committed statements and optionally writes them to a file as JSON lines.
+    """
+    def __init__(self, out=None):
+        self.out = out
+        self.transactions = 0
+        self.statements = 0
+
+    def commit(self, statements):
+        self.transactions = self.transactions + 1
+        self.statements = self.statements + len(statements)
+        if self.out is not None:
+            for statement, parameters in statements:
+                self.out.write(json.dumps({'statement': statement, 'parameters': parameters}) + '\n')
+        return [[] for statement in statements]
+
+
+class BatchImporter(object):
+
+    def __init__(self, backend, document_cts, batch_size=200, log=sys.stdout):
+
+        self.backend = backend
+        self.document_cts = document_cts
+        self.batch_size = batch_size
+        self.log = log
+
+        self.sentences = []
+        self.sentence_count = 0
+        self.word_count = 0
+        self.started = time.time()
+
+    def create_indexes(self):
+        # schema statements can't share a transaction with data
+        for index in INDEXES:
+            self.backend.commit([(index, {})])
+
+    def create_document(self, **properties):
+        self.backend.commit([(DOCUMENT_STATEMENT, {'CTS': self.document_cts, 'properties': properties})])
+
+    def add_sentence(self, cts, words, sentence=None):
+        """
+        Queues a sentence, words is a list of property dicts in reading order.
+        """
+        if sentence is None:
+            sentence = ' '.join(word.get('value', '') for word in words)
+
+        self.sentences.append({'CTS': cts, 'sentence': sentence, 'length': len(words), 'words': words})
+        if len(self.sentences) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+
+        if not self.sentences:
+            return
+
+        self.backend.commit([(SENTENCES_STATEMENT, {'document': self.document_cts, 'sentences': self.sentences})])
+
+        self.sentence_count = self.sentence_count + len(self.sentences)
+        self.word_count = self.word_count + sum(len(s['words']) for s in self.sentences)
+        self.sentences = []
+        self.report()
+
+    def report(self):
+
+        elapsed = max(time.time() - self.started, 0.001)
+        self.log.write("%d sentences, %d words imported (%.1f sentences/s, %.1f words/s)\n" %
+                       (self.sentence_count, self.word_count, self.sentence_count / elapsed, self.word_count / elapsed))
+
+    def close(self):
+        self.flush()
@@ -1,7 +1,11 @@
 # coding: utf8
 from neo4jrestclient.client import GraphDatabase
-from xml.dom import minidom
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..')))
+from common.utils.neo4j_import.readers import read_alignment
+from common.utils.neo4j_import.alignment_index import index_alignment
 
 ###### your alignment's meta data if you don't use the fabric file ######
 # The script assumes Alpheios alignment output with the references being unique in the document
@@ -39,11 +43,11 @@ languages = {
 }
 
 """
-Creates a sentence node in the database while saving the node set originating from the xml.
+Creates a sentence node in the database while saving the word records of one language of an aligned sentence.
 sntence_ref is needed as identifier.
 lang is needed for discriminating the reference target and to figure if a sentence has to be created.
 """
-def save_sentence(nodes, sentence_ref, lang, d, document):
+def save_sentence(words, sentence_ref, lang, d, document):
     
     wordcounter = 0
     referring_CTS_root = ''
@@ -56,36 +60,32 @@ def save_sentence(nodes, sentence_ref, lang, d, document):
         referring_CTS_root = document.primary_source_urn
         s = gdb.nodes.create(CTS=document.cts() + ":" + sentence_ref)
         
-    for node in nodes:
-        # not interested in empty text nodes
-        if node.attributes and node.tagName == 'w':
-            wordcounter = wordcounter + 1
-            # get the actual word value from the text node of the <text> node of the <w> node.
-            word_value = node.childNodes[1].childNodes[0].toxml()                
-                
-            # get the (greek) word from the database ...
-            if lang == 'grc': 
-                wordTable = gdb.query("""MATCH (w) WHERE w.CTS='""" + document.primary_source_urn + ":" + node.attributes['n'].value + """' RETURN w""")
-                w = gdb.nodes.get(wordTable[0][0]['self'])
-            # .. or create the word as a node if it is from a translation language
-            else:
-                sentence_string = sentence_string + word_value + " "
-                w = gdb.nodes.create(CTS=document.cts() + ":" + node.attributes['n'].value, value=word_value, length=len(word_value), lang=document.locale)
-                w.labels.add("Word")
-                s.words(w)
-                              
-            # get the referring translations
-            try:
-                array = node.childNodes[3].attributes['nrefs'].value.split(" ")
-                # loop over references
-                for ref in array:
-                    if not ref == "":
-                        table = gdb.query("""MATCH (w) WHERE w.CTS='""" + referring_CTS_root + ":" + ref + """' RETURN w""")
-                        translated_word = gdb.nodes.get(table[0][0]['self'])
-                        w.translation(translated_word)
-                        #print "word: " + node.attributes['n'].value + "; word_id: " + str(w.id); print "ref: " + ref + "; ref_word_id: " + str(translated_word.id)
-            except:
-                continue
+    for word in words:
+        wordcounter = wordcounter + 1
+        # the actual word value of the <text> node of the <w> node.
+        word_value = word['text'] or ''
+            
+        # get the (greek) word from the database ...
+        if lang == 'grc': 
+            wordTable = gdb.query("""MATCH (w) WHERE w.CTS='""" + document.primary_source_urn + ":" + word['n'] + """' RETURN w""")
+            w = gdb.nodes.get(wordTable[0][0]['self'])
+        # .. or create the word as a node if it is from a translation language
+        else:
+            sentence_string = sentence_string + word_value + " "
+            w = gdb.nodes.create(CTS=document.cts() + ":" + word['n'], value=word_value, length=len(word_value), lang=document.locale)
+            w.labels.add("Word")
+            s.words(w)
+                          
+        # get the referring translations
+        try:
+            # loop over references
+            for ref in word['refs']:
+                table = gdb.query("""MATCH (w) WHERE w.CTS='""" + referring_CTS_root + ":" + ref + """' RETURN w""")
+                translated_word = gdb.nodes.get(table[0][0]['self'])
+                w.translation(translated_word)
+                #print "word: " + word['n'] + "; word_id: " + str(w.id); print "ref: " + ref + "; ref_word_id: " + str(translated_word.id)
+        except:
+            continue
         
     # finish the creation of the translated sentence and save it to the document  
     if lang != 'grc':           
@@ -118,20 +118,15 @@ def align(lang):
         
     d.labels.add("Document")
         
-    # get first node from the xml parser instance
-    alignNode = minidom.parse(document.xml()).firstChild
-        
-    for sentence in alignNode.childNodes:
-            
-        # avoid the language nodes at the very beginning 
-        if sentence.attributes and sentence.tagName == 'sentence':    
-            # get the two node sets for the two languages after ensuring the order of the parsed alignments
-            if sentence.childNodes[1].attributes['lnum'].value == 'L1':
-                save_sentence(sentence.childNodes[3].childNodes, sentence.attributes['id'].value, 'translation', d, document)
-                save_sentence(sentence.childNodes[1].childNodes, sentence.attributes['id'].value, 'grc', d, document)
-            else:
-                save_sentence(sentence.childNodes[1].childNodes, sentence.attributes['id'].value, 'translation', d, document)
-                save_sentence(sentence.childNodes[3].childNodes, sentence.attributes['id'].value, 'grc', d, document) 
+    # sentences are streamed from the xml, the words of both languages are mapped by their xml:lang
+    for sentence in read_alignment(document.xml()):
+        # the translation first, so the greek references can find its words
+        save_sentence(sentence['languages'].get(document.lang, []), sentence['id'], 'translation', d, document)
+        save_sentence(sentence['languages'].get('grc', []), sentence['id'], 'grc', d, document)
+    
+    # direct relationships to the aligned sentences and documents for the API
+    index_alignment(gdb, document.cts())
+    print "Alignment index of " + document.cts() + " created."
         
     #print lang
           
@@ -146,8 +141,6 @@ gdb = GraphDatabase(GRAPH_DATABASE_REST_URL)
 
 if __name__ == "__main__":
     
-    import sys
-    
     if sys.argv[1] == 'lookup':
         print "Avaialble languages are: " + str(list(languages.keys())) + "."
         
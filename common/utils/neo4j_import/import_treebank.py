@@ -1,8 +1,7 @@
 # coding: utf8
-from neo4jrestclient.client import GraphDatabase
-from xml.dom import minidom
 import json
 import os
+import sys
 
 ################ set your xml's meta data #####################
 
@@ -12,6 +11,10 @@ document_cts = "urn:cts:greekLit:tlg0003.tlg001.perseus-grc"
 work_author = "Θουκυδίδης"
 work_title = "Πεντηκονταετία"
 work_language = "grc"
+# sentences per transaction
+batch_size = 200
+# pass --dry-run to only count the statements instead of writing to neo4j
+dry_run = '--dry-run' in sys.argv
 
 ################################################################
 
@@ -35,108 +38,68 @@ def decode_morphology(morphological_code):
 path = os.path.dirname(os.path.abspath(__file__))
 treebank_file = os.path.join(path, treebank_file_name)
 morph_code_file = os.path.join(path, "morph_codes.json")
-# create the graph database instance
-gdb = GraphDatabase(host)
+
+sys.path.append(os.path.abspath(os.path.join(path, '../../..')))
+from common.utils.neo4j_import.batch import BatchImporter, DryRunBackend
+from common.utils.neo4j_import.readers import read_treebank
 
 morph_content = {}
 with open(morph_code_file, 'r') as json_data:
     morph_content = json.load(json_data)
     json_data.close()
-    
-# create the document
-d = gdb.nodes.create(CTS=document_cts,
-                     author=work_author,
-                     title=work_title,
-                     lang=work_language) 
 
-d.labels.add("Document")   
-    
-# get first node from the xml parser instance
-alignNode = minidom.parse(treebank_file).firstChild
+# sentences, words and relationships are sent in batches through the transactional endpoint
+if dry_run:
+    backend = DryRunBackend()
+else:
+    from common.utils.graph import GraphConnection
+    backend = GraphConnection(host)
+importer = BatchImporter(backend, document_cts, batch_size=batch_size)
+
+# indexes first, so the document look-up of every batch is cheap
+importer.create_indexes()
 
+# create the document
+importer.create_document(author=work_author,
+                         title=work_title,
+                         lang=work_language)
+    
 chapter_old = 0
 sent_no = 0
-# run over sentences
-for sentence in alignNode.childNodes: 
-    sentence_string = ""
+# run over the sentences as they are parsed
+for sentence in read_treebank(treebank_file):
     
-    # no text nodes 
-    if sentence.attributes and sentence.tagName == 'sentence':
-        
-        sent_no = sent_no+1
-        # get sentence meta here
-        subdoc = sentence.attributes['subdoc'].value.split(':')
-        book = int(subdoc[0].split('=')[1])
-        chapter = int(subdoc[1].split('=')[1])
-        if chapter != chapter_old:
-            sent_no = 1
-            chapter_old = chapter
+    sent_no = sent_no+1
+    # get sentence meta here
+    book = sentence['book']
+    chapter = sentence['chapter']
+    if chapter != chapter_old:
+        sent_no = 1
+        chapter_old = chapter
+    
+    sentence_cts = document_cts + ":" + str(book) + "." + str(chapter) + "." + str(sent_no)
+    
+    # run over words
+    words = []
+    for word in sentence['words']:
         
-        # create the sentence node
-        s = gdb.nodes.create() 
-        s.labels.add("Sentence")
-        s['CTS'] = document_cts + ":" + str(book) + "." + str(chapter) + "." + str(sent_no)
-        print document_cts + ":" + str(book) + "." + str(chapter) + "." + str(sent_no) + " imported."
+        word_dict = {'cid': word['cid'],
+                'value': word['form'],
+                'head': word['head'],
+                'tbwid': word['id'],
+                'lemma': word['lemma'],
+                'relation': word['relation']} 
         
-        # run over word nodes
-        word_no = 0
-        for word in sentence.childNodes:
-            
-            if word.attributes and word.tagName == 'word':
-                
-                sentence_string = sentence_string + " " + word.attributes['form'].value
-                word_no = word_no+1
-                word_dict = {'cid': word.attributes['cid'].value,
-                        'value': word.attributes['form'].value,
-                        'head': word.attributes['head'].value,
-                        'tbwid': word.attributes['id'].value,
-                        'lemma': word.attributes['lemma'].value,
-                        'relation': word.attributes['relation'].value} 
-                               
-                morph = decode_morphology(word.attributes['postag'].value)                
-                #print document_cts + ":" + str(book) + "." + str(chapter) + "." + str(sent_no) + ":" + str(word_no)
-                
-                w = gdb.nodes.create()
-                w.labels.add("Word")
-                
-                # xml node attributes
-                for attr in word_dict:
-                    w[attr] = word_dict[attr]
-                    
-                # decoded morph codes
-                for key in morph:
-                    w[key] = morph[key]
-                    
-                w['length'] = len(word_dict['value'])
-                w['CTS'] = document_cts + ":" + str(book) + "." + str(chapter) + "." + str(sent_no) + ":" + str(word_no)
-                s.words(w)
+        # decoded morph codes
+        word_dict.update(decode_morphology(word['postag']))
         
-        s['sentence'] = sentence_string
-        s['length'] = word_no
-        d.sentences(s)
-                    
-                    
-# build indexes at the end:
-gdb.query("""CREATE INDEX ON :Document(CTS)""")
-gdb.query("""CREATE INDEX ON :Document(ID)""")
-gdb.query("""CREATE INDEX ON :Sentence(CTS)""")
-gdb.query("""CREATE INDEX ON :Sentence(ID)""")
-gdb.query("""CREATE INDEX ON :Word(CTS)""")
-gdb.query("""CREATE INDEX ON :Word(ID)""")
-gdb.query("""CREATE INDEX ON :Lemma(CITE)""")
-gdb.query("""CREATE INDEX ON :Lemma(ID)""")
-                
-            
-            
-            
-
-
-
-
-
-
-
-
-
+        word_dict['length'] = len(word_dict['value'])
+        word_dict['CTS'] = sentence_cts + ":" + str(len(words)+1)
+        words.append(word_dict)
+    
+    importer.add_sentence(sentence_cts, words, sentence="".join(" " + w['value'] for w in words))
 
-            
\ No newline at end of file
+# commit the last batch
+importer.close()
+if dry_run:
+    print "Dry run: %d statements in %d transactions." % (backend.statements, backend.transactions)
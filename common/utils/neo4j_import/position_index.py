@@ -0,0 +1,33 @@
+# coding: utf8
+"""
+Position of the words in their document, in CTS order.
+
+CTS order compares every citation level numerically (1.9 before 1.10), which a Cypher ORDER BY on the CTS strings
+can't do. Every Word of a document gets its rank in CTS order as position, so the word list of a document is paged
+in neo4j with WHERE w.position > {after} ORDER BY w.position LIMIT {limit}. manage.py index_positions (re)builds the
+positions of an existing database, the fab import tasks run it after every import.
+"""
+from api.utils import cts_sort_key
+
+
+POSITION_STATEMENT = """UNWIND {words} AS word
+MATCH (w:`Word`) WHERE ID(w) = word.id
+SET w.position = word.position"""
+
+# words updated per statement
+CHUNK_SIZE = 1000
+
+
+"""
+Sets the positions of the words of a document, returns the number of words.
+gdb is anything with a query(q, params=...) method, a neo4jrestclient GraphDatabase or common.utils.graph.GraphConnection.
+"""
+def index_positions(gdb, documentCTS):
+
+    table = gdb.query("""MATCH (d:`Document`)-[:sentences]->(:`Sentence`)-[:words]->(w:`Word`) WHERE d.CTS = {CTS} RETURN ID(w), w.CTS""", params={'CTS': documentCTS})
+    ids = [row[0] for row in sorted(table, key=lambda row: cts_sort_key(row[1]))]
+
+    for start in range(0, len(ids), CHUNK_SIZE):
+        words = [{'id': id, 'position': start + i + 1} for i, id in enumerate(ids[start:start + CHUNK_SIZE])]
+        gdb.query(POSITION_STATEMENT, params={'words': words})
+    return len(ids)
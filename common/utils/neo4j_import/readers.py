@@ -0,0 +1,90 @@
+# coding: utf8
+"""
+Streaming readers for the treebank and the Alpheios alignment xml files.
+
+The files are read with iterparse, every sentence is yielded as a plain record as soon as its end tag was parsed
+and the consumed elements are cleared afterwards, so memory stays flat regardless of the file size.
+The records don't depend on neo4j, any import backend can consume them.
+"""
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+
+ALIGNMENT_NAMESPACE = '{http://alpheios.net/namespaces/aligned-text}'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _iter_elements(source, tag):
+    """
+    Yields every element with the given (local) tag name once it is complete and clears it afterwards.
+    The root is cleared as well, otherwise it would keep the emptied elements.
+    """
+    root = None
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event == 'end' and _local_name(elem.tag) == tag:
+            yield elem
+            elem.clear()
+            root.clear()
+
+
+"""
+Yields the sentences of a treebank file as dicts with the sentence attributes (id, subdoc, book, chapter)
+and the list of its words, each with cid, form, head, id, lemma, relation and postag (the morph code).
+"""
+def read_treebank(source):
+
+    for sentence in _iter_elements(source, 'sentence'):
+        record = dict(sentence.attrib)
+
+        # subdoc, e.g. book=1:chapter=89
+        for part in record.get('subdoc', '').split(':'):
+            if '=' in part:
+                key, value = part.split('=', 1)
+                record[key] = int(value) if value.isdigit() else value
+
+        record['words'] = [dict(word.attrib) for word in sentence if _local_name(word.tag) == 'word']
+        yield record
+
+
+"""
+Yields the sentences of an alignment file as dicts with the sentence id and a dict mapping the languages
+(xml:lang of the <language> headers, e.g. grc and eng) to their word lists.
+Every word has its reference n, the text and the list of aligned references of the other language.
+"""
+def read_alignment(source):
+
+    languages = {}
+    root = None
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event != 'end':
+            continue
+
+        tag = _local_name(elem.tag)
+        if tag == 'language':
+            languages[elem.get('lnum')] = elem.get(XML_LANG)
+
+        elif tag == 'sentence':
+            record = {'id': elem.get('id'), 'languages': {}}
+            for wds in elem.iter(ALIGNMENT_NAMESPACE + 'wds'):
+                words = []
+                for w in wds.iter(ALIGNMENT_NAMESPACE + 'w'):
+                    text = w.find(ALIGNMENT_NAMESPACE + 'text')
+                    refs = w.find(ALIGNMENT_NAMESPACE + 'refs')
+                    words.append({'n': w.get('n'),
+                                  'text': text.text if text is not None else None,
+                                  'refs': refs.get('nrefs', '').split() if refs is not None else []})
+                lnum = wds.get('lnum')
+                record['languages'][languages.get(lnum, lnum)] = words
+            yield record
+            elem.clear()
+            root.clear()
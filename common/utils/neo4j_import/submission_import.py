@@ -74,6 +74,7 @@ for user in fileContent:
                       
 # build indexes at the end:
 gdb.query("""CREATE INDEX ON :Submission(ID)""")
+gdb.query("""CREATE INDEX ON :Submission(key)""")
 gdb.query("""CREATE INDEX ON :User(ID)""")
 gdb.query("""CREATE INDEX ON :User(username)""")
                                         
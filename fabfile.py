@@ -61,6 +61,11 @@ def import_neo4j():
     """
     with virtualenv():
         local('python %s/common/utils/neo4j_import/pentecontaetia_import.py' % env.directory)
+        local('python %s/manage.py index_alignments' % env.directory)
+        local('python %s/manage.py index_positions' % env.directory)
+        local('python %s/manage.py build_word_index' % env.directory)
+        local('python %s/manage.py bump_corpus_version' % env.directory)
+        local('python %s/manage.py warm_cache' % env.directory)
 
 @task
 def import_alignment(lang):
@@ -73,6 +78,10 @@ def import_alignment(lang):
     """
     with virtualenv():
         local('python %s/common/utils/neo4j_import/import_alignment.py %s' % (env.directory, lang))
+        local('python %s/manage.py index_positions' % env.directory)
+        local('python %s/manage.py build_word_index' % env.directory)
+        local('python %s/manage.py bump_corpus_version' % env.directory)
+        local('python %s/manage.py warm_cache' % env.directory)
 
 ###############################
 # Backend Utility tasks       #
@@ -237,6 +246,9 @@ def setup_server():
     # Create directories and folders needed by uwsgi/nginx
     directories = [
         '%s/logs' % env.directory,
+        '%s/cache' % env.directory,
+        '%s/cache_versions' % env.directory,
+        '%s/indexes' % env.directory,
         '/var/log/uwsgi'
     ]
     files = [
@@ -252,6 +264,9 @@ def setup_server():
         if not os.path.isfile(f):
             local('touch %s' % f)
 
+    # The shared api cache (CACHES in settings.py) is written by the uwsgi workers, the word index (WORD_INDEX_PATH) is read by them
+    local('chown www-data:www-data %s/cache %s/cache_versions %s/indexes' % (env.directory, env.directory, env.directory))
+
 @task
 def setup_neo4j():
     """
@@ -218,6 +218,63 @@ ENABLE_WORD_LIST_SORTING = True
 # The url on which the Neo4j rest client works
 GRAPH_DATABASE_REST_URL = 'http://localhost:7474/db/data/'
 
+# Keep-alive connections to Neo4j every uWSGI worker keeps open (see extras/uwsgi/phaidra.ini).
+# One per thread of a worker is enough, the client reconnects lazily if Neo4j went away.
+GRAPH_DATABASE_POOL_SIZE = 4
+
+# Queue submissions and let the process_submissions command write them to Neo4j in the background,
+# see extras/uwsgi/phaidra.ini. Switch it to False to write them while answering the request.
+ENABLE_SUBMISSION_QUEUE = True
+# Failed queued submissions are retried this many times
+SUBMISSION_QUEUE_MAX_ATTEMPTS = 5
+# Seconds before the first retry of a failed queued submission, doubled with every further attempt up to the maximum
+SUBMISSION_QUEUE_RETRY_DELAY = 30
+SUBMISSION_QUEUE_MAX_RETRY_DELAY = 3600
+
+# Cache shared by all uWSGI processes and workers (see extras/uwsgi/phaidra.ini).
+# To use memcached instead set BACKEND to 'django.core.cache.backends.memcached.MemcachedCache'
+# and LOCATION to '127.0.0.1:11211'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/opt/phaidra/cache',
+        'TIMEOUT': 86400,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000
+        }
+    },
+    # the corpus version of the api caches (api/versioned_cache.py), kept apart so it is never culled
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/opt/phaidra/cache_versions',
+        'TIMEOUT': None
+    }
+}
+
+# Cache policy per api resource: timeout of the cached objects in seconds (None: the TIMEOUT of the default cache,
+# which api/versioned_cache.py passes on explicitly, so the objects do expire)
+# and maxsize, the number of objects a process additionally keeps in memory (sentences and short sentence searches only).
+# Cached objects of all resources are dropped when the corpus version is bumped (manage.py bump_corpus_version).
+API_CACHE_POLICIES = {
+    'document': {'timeout': None},
+    'sentence': {'timeout': None, 'maxsize': 2000},
+    'short_sentences': {'timeout': None, 'maxsize': 200},
+    'word': {'timeout': 3600},
+    'lemma': {'timeout': 3600}
+}
+
+# max-age of the api responses in seconds (0: no-cache). Kept short and independent of the server side timeouts above,
+# so clients don't keep responses of an outdated corpus version.
+API_HTTP_MAX_AGE = 60
+
+# Index of the word attributes value, form and lemma for the contains, startswith and endswith filters,
+# built by manage.py build_word_index. Without it these filters are regular expressions over all words.
+WORD_INDEX_PATH = '/opt/phaidra/indexes/word_index.pickle'
+# filters matching more words than this (and empty values) aren't resolved by the index
+WORD_INDEX_MAX_IDS = 5000
+# seconds between the checks whether the index file changed
+WORD_INDEX_CHECK_INTERVAL = 10
+
 # The current api path
 API_PATH = '/api/v1/'
 
@@ -2,7 +2,7 @@ define(['jquery', 'underscore', 'backbone', 'models/document', 'utils'], functio
 
 	return Backbone.Collection.extend({
 		model: DocumentModel,
-		url: '/api/v1/document/',
+		url: '/api/v1/document/?include=sentences',
 		parse: function(response) {
 
 			// Flatten our references to sentence URIs